@@ -0,0 +1,224 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from lib import shared_state
+
+# Admission control for the password-hashing endpoints.
+#
+# Every login/register attempt costs a full PBKDF2 derivation, so requests are
+# charged against a per-IP and a per-username token bucket *before* any key
+# derivation runs. Repeated failures additionally put the key into an
+# exponentially growing lockout. Buckets live in a bounded LRU so a flood of
+# distinct usernames or addresses cannot grow memory without limit.
+#
+# With several worker processes (SHARED_STATE set) the buckets live in
+# lib.shared_state instead, so a client cannot multiply its budget by the
+# number of workers; expired entries take the place of LRU eviction there.
+# When that table has no room for a new bucket, admit() refuses the attempt
+# (fails closed) instead of letting it through uncounted.
+
+IP_RATE = 0.5           # tokens per second per client IP
+IP_BURST = 20
+USER_RATE = 0.2         # tokens per second per username
+USER_BURST = 5
+LOCKOUT_THRESHOLD = 5   # consecutive failures before lockout starts
+LOCKOUT_BASE = 2.0      # seconds; doubles with every further failure
+LOCKOUT_MAX = 15 * 60.0
+MAX_ENTRIES = 4096
+FULL_RETRY_AFTER = 5.0  # seconds; wait suggested when the shared table has no room
+
+
+class _Bucket:
+    __slots__ = ('tokens', 'updated', 'failures', 'locked_until')
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = float(burst)
+        self.updated = now
+        self.failures = 0
+        self.locked_until = 0.0
+
+
+class AdmissionController:
+    def __init__(self, ip_rate: float = IP_RATE, ip_burst: int = IP_BURST,
+                 user_rate: float = USER_RATE, user_burst: int = USER_BURST,
+                 lockout_threshold: int = LOCKOUT_THRESHOLD, lockout_base: float = LOCKOUT_BASE,
+                 lockout_max: float = LOCKOUT_MAX, max_entries: int = MAX_ENTRIES, clock=time.monotonic):
+        self._limits = {'ip': (ip_rate, ip_burst), 'user': (user_rate, user_burst)}
+        self.lockout_threshold = lockout_threshold
+        self.lockout_base = lockout_base
+        self.lockout_max = lockout_max
+        self.max_entries = max_entries
+        self._clock = clock
+        self._buckets: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def _keys(self, ip: Optional[str], username: Optional[str]) -> list:
+        keys = []
+        if ip:
+            keys.append(('ip', ip))
+        if username:
+            keys.append(('user', username))
+        return keys
+
+    def _locked(self):
+        return self._lock
+
+    def _peek(self, key: tuple) -> Optional[_Bucket]:
+        return self._buckets.get(key)
+
+    def _save(self, key: tuple, bucket: _Bucket, now: float) -> bool:
+        """Persist a changed bucket; False if it could not be stored.
+        In-process buckets are updated in place."""
+        return True
+
+    def _reserve(self, buckets: list, now: float) -> bool:
+        """Make sure every bucket can be stored before any of them is charged.
+        In-process buckets always can."""
+        return True
+
+    def _bucket(self, key: tuple, now: float) -> _Bucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = _Bucket(self._limits[key[0]][1], now)
+            self._buckets[key] = bucket
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            rate, burst = self._limits[key[0]]
+            bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+        return bucket
+
+    def admit(self, ip: Optional[str], username: Optional[str]) -> float:
+        """Charge one attempt against the IP and username buckets.
+
+        Returns 0 when the attempt is admitted, otherwise the number of seconds
+        the caller should wait. Nothing is charged for a rejected attempt.
+        """
+        with self._locked():
+            now = self._clock()
+            buckets = [(key, self._bucket(key, now)) for key in self._keys(ip, username)]
+            wait = 0.0
+            for key, bucket in buckets:
+                if bucket.locked_until > now:
+                    wait = max(wait, bucket.locked_until - now)
+                elif bucket.tokens < 1.0:
+                    rate = self._limits[key[0]][0]
+                    wait = max(wait, (1.0 - bucket.tokens) / rate)
+            if wait > 0:
+                self.rejected += 1
+                return wait
+            if not self._reserve(buckets, now):
+                # an attempt that cannot be counted is refused, or a flood of
+                # new keys would switch rate limiting off
+                self.rejected += 1
+                return FULL_RETRY_AFTER
+            for key, bucket in buckets:
+                bucket.tokens -= 1.0
+                self._save(key, bucket, now)
+            return 0.0
+
+    def record_failure(self, ip: Optional[str], username: Optional[str]) -> None:
+        with self._locked():
+            now = self._clock()
+            for key in self._keys(ip, username):
+                bucket = self._bucket(key, now)
+                bucket.failures += 1
+                excess = bucket.failures - self.lockout_threshold
+                if excess >= 0:
+                    bucket.locked_until = now + min(self.lockout_max, self.lockout_base * (2 ** min(excess, 32)))
+                self._save(key, bucket, now)
+
+    def record_success(self, username: Optional[str]) -> None:
+        # Only the account's failure streak is cleared; a client that owns one
+        # valid account must not be able to reset its per-IP lockout with it.
+        with self._locked():
+            bucket = self._peek(('user', username))
+            if bucket is not None:
+                bucket.failures = 0
+                bucket.locked_until = 0.0
+                self._save(('user', username), bucket, self._clock())
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+            self.rejected = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._buckets)
+
+
+class SharedAdmissionController(AdmissionController):
+    """AdmissionController whose buckets are shared by all worker processes."""
+
+    PREFIX = 'admission:'
+
+    def __init__(self, table: Optional[shared_state.SharedTable] = None, **kwargs):
+        super().__init__(**kwargs)
+        self._table = table
+
+    @property
+    def table(self) -> shared_state.SharedTable:
+        if self._table is None:
+            self._table = shared_state.table()
+        return self._table
+
+    def _locked(self):
+        return self.table.lock()
+
+    def _name(self, key: tuple) -> str:
+        return f"{self.PREFIX}{key[0]}:{key[1]}"
+
+    def _peek(self, key: tuple) -> Optional[_Bucket]:
+        state = self.table.get(self._name(key))
+        if state is None:
+            return None
+        bucket = _Bucket(0, 0.0)
+        bucket.tokens, bucket.updated, bucket.failures, bucket.locked_until = state
+        return bucket
+
+    def _save(self, key: tuple, bucket: _Bucket, now: float) -> bool:
+        rate, burst = self._limits[key[0]]
+        # kept until it would have refilled and any lockout or failure streak has lapsed
+        ttl = max((burst - bucket.tokens) / rate, bucket.locked_until - now,
+                  self.lockout_max if bucket.failures else 0.0) + 1.0
+        try:
+            self.table.set(self._name(key), [bucket.tokens, bucket.updated, bucket.failures, bucket.locked_until],
+                           ttl=ttl)
+        except shared_state.SharedTableFull:
+            return False
+        return True
+
+    def _reserve(self, buckets: list, now: float) -> bool:
+        # A bucket already in the table is overwritten in place, which cannot
+        # fail; a new one is stored uncharged first so it holds its slot.
+        for key, bucket in buckets:
+            if self.table.get(self._name(key)) is None and not self._save(key, bucket, now):
+                return False
+        return True
+
+    def _bucket(self, key: tuple, now: float) -> _Bucket:
+        bucket = self._peek(key)
+        if bucket is None:
+            return _Bucket(self._limits[key[0]][1], now)
+        rate, burst = self._limits[key[0]]
+        bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+        bucket.updated = now
+        return bucket
+
+    def reset(self) -> None:
+        with self._locked():
+            for name, _ in self.table.items(self.PREFIX):
+                self.table.delete(name)
+            self.rejected = 0
+
+    def __len__(self) -> int:
+        return len(self.table.items(self.PREFIX))
+
+
+controller = SharedAdmissionController() if shared_state.enabled() else AdmissionController()
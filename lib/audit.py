@@ -0,0 +1,196 @@
+import argparse
+import atexit
+import datetime
+import json
+import os
+import threading
+from collections import deque
+from typing import Optional
+
+# Non-blocking structured audit log.
+#
+# Request handlers call `record()`, which only appends a dict to a bounded
+# in-memory ring. A background writer drains the ring in batches into JSONL
+# files under server_state/audit/, rotating them by size. When the ring is
+# full new events are counted as dropped instead of blocking the request; the
+# writer logs the drop count as an `audit.overflow` event.
+#
+# The process-wide log writes nowhere until `configure()` names its directory
+# (the server does at start-up), so importing the module, or calling record()
+# from a test or an embedding caller, never writes relative to whatever the
+# working directory happens to be.
+
+STATE_DIR = 'server_state'
+AUDIT_DIR = os.path.join(STATE_DIR, 'audit')
+LOG_NAME = 'audit.jsonl'
+CAPACITY = 10_000           # events held in memory before dropping
+BATCH_SIZE = 512
+FLUSH_INTERVAL = 1.0        # seconds
+MAX_FILE_BYTES = 1024 * 1024
+MAX_FILES = 5               # audit.jsonl plus audit.jsonl.1 .. .4
+
+
+class AuditLog:
+    def __init__(self, directory: str = AUDIT_DIR, capacity: int = CAPACITY,
+                 max_bytes: int = MAX_FILE_BYTES, max_files: int = MAX_FILES):
+        self.directory = directory
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self._ring: deque = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._write_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.written = 0
+        self.dropped = 0
+        self._dropped_reported = 0
+
+    # -- producer side -----------------------------------------------------
+    def record(self, event: str, **fields) -> bool:
+        """Queue one event. Never blocks on I/O; returns False if it was dropped."""
+        entry = {'ts': datetime.datetime.now().isoformat(timespec='milliseconds'), 'event': event}
+        entry.update((k, v) for k, v in fields.items() if v is not None)
+        with self._lock:
+            if len(self._ring) >= self.capacity:
+                self.dropped += 1
+                return False
+            self._ring.append(entry)
+            if self._thread is None:
+                self._start()
+        if len(self._ring) >= BATCH_SIZE:
+            self._wake.set()
+        return True
+
+    def stats(self) -> dict:
+        return {'queued': len(self._ring), 'written': self.written, 'dropped': self.dropped}
+
+    # -- writer side -------------------------------------------------------
+    def _start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Warning: audit log write failed: {e}")
+
+    def _take_batch(self) -> list:
+        with self._lock:
+            batch = []
+            while self._ring and len(batch) < BATCH_SIZE:
+                batch.append(self._ring.popleft())
+            if self.dropped > self._dropped_reported:
+                batch.append({'ts': datetime.datetime.now().isoformat(timespec='milliseconds'),
+                              'event': 'audit.overflow', 'dropped': self.dropped - self._dropped_reported})
+                self._dropped_reported = self.dropped
+            return batch
+
+    def _rotate(self) -> None:
+        base = os.path.join(self.directory, LOG_NAME)
+        for i in range(self.max_files - 1, 0, -1):
+            src = base if i == 1 else f"{base}.{i - 1}"
+            if os.path.exists(src):
+                os.replace(src, f"{base}.{i}")
+
+    def flush(self) -> int:
+        """Write everything queued so far; returns the number of events written."""
+        total = 0
+        with self._write_lock:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, LOG_NAME)
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    break
+                lines = ''.join(json.dumps(e, separators=(',', ':')) + '\n' for e in batch)
+                try:
+                    size = os.path.getsize(path)
+                except FileNotFoundError:
+                    size = 0
+                if size and size + len(lines) > self.max_bytes:
+                    self._rotate()
+                with open(path, 'a') as f:
+                    f.write(lines)
+                self.written += len(batch)
+                total += len(batch)
+        return total
+
+    # -- reading -----------------------------------------------------------
+    def files(self) -> list:
+        """Log files oldest first."""
+        base = os.path.join(self.directory, LOG_NAME)
+        paths = [f"{base}.{i}" for i in range(self.max_files - 1, 0, -1)] + [base]
+        return [p for p in paths if os.path.exists(p)]
+
+    def query(self, user: Optional[str] = None, ip: Optional[str] = None, event: Optional[str] = None,
+              since: Optional[str] = None, limit: Optional[int] = None) -> list:
+        """Filter logged events. `event` matches exactly or as a dotted prefix ('auth')."""
+        matches = deque(maxlen=limit) if limit else []
+        for path in self.files():
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        e = json.loads(line)
+                    except ValueError:
+                        continue
+                    if user and e.get('user') != user:
+                        continue
+                    if ip and e.get('ip') != ip:
+                        continue
+                    if event and e.get('event') != event and not e.get('event', '').startswith(event + '.'):
+                        continue
+                    if since and e.get('ts', '') < since:
+                        continue
+                    matches.append(e)
+        return list(matches)
+
+
+log: Optional[AuditLog] = None
+
+
+def configure(directory: str = AUDIT_DIR, **kwargs) -> AuditLog:
+    """Point the process-wide log at `directory`, resolved now to an absolute path."""
+    global log
+    log = AuditLog(os.path.abspath(directory), **kwargs)
+    return log
+
+
+def record(event: str, **fields) -> bool:
+    """Queue an event on the process-wide log; False if it is not configured or full."""
+    if log is None:
+        return False
+    return log.record(event, **fields)
+
+
+def _flush_at_exit() -> None:
+    if log is not None and log._thread is not None:
+        try:
+            log.flush()
+        except Exception:
+            pass
+
+
+atexit.register(_flush_at_exit)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Query the secret-server audit log')
+    parser.add_argument('--dir', default=AUDIT_DIR, help='audit log directory')
+    parser.add_argument('--user')
+    parser.add_argument('--ip')
+    parser.add_argument('--event', help="event type or prefix, e.g. 'auth' or 'secret.read'")
+    parser.add_argument('--since', help='ISO timestamp, e.g. 2026-01-31T12:00')
+    parser.add_argument('--limit', type=int, default=100, help='show only the last N matches (0 = all)')
+    args = parser.parse_args(argv)
+    for e in AuditLog(args.dir).query(args.user, args.ip, args.event, args.since, args.limit or None):
+        print(json.dumps(e))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
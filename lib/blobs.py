@@ -0,0 +1,218 @@
+import base64
+import io
+import os
+import struct
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from lib import crypto
+
+DB_DIR = 'db'
+BLOBS_SUBDIR = 'blobs'
+
+# Blob file layout:
+#   header  = MAGIC || salt (16) || nonce prefix (7) || segment size (uint32 BE)
+#   body    = one or more AES-GCM segments, each (ciphertext || 16-byte tag)
+# Each segment nonce is prefix || counter (uint32 BE) || last flag (1 byte), so
+# reordering, dropping or truncating segments fails authentication.
+MAGIC = b'SSB1'
+SEGMENT_SIZE = 64 * 1024  # plaintext bytes per segment
+_NONCE_PREFIX_SIZE = 7
+_TAG_SIZE = 16
+_HEADER = struct.Struct('>4s16s7sI')
+_READ_SIZE = 64 * 1024
+
+
+class BlobError(Exception):
+    """Raised when a blob cannot be stored or decrypted."""
+
+
+def _blob_key(passphrase: str, salt: bytes) -> AESGCM:
+    # Reuse the same PBKDF2 parameters as secrets; one derivation per blob.
+    return AESGCM(base64.urlsafe_b64decode(crypto._derive_key(passphrase, salt)))
+
+
+def _nonce(prefix: bytes, counter: int, last: bool) -> bytes:
+    return prefix + struct.pack('>IB', counter, 1 if last else 0)
+
+
+def _iter_segments(chunks: Iterable[bytes], segment_size: int) -> Iterator[tuple[bytes, bool]]:
+    """Re-slice arbitrary chunks into (segment, is_last) pairs, one segment of lookahead."""
+    buf = bytearray()
+    pending = None
+    for chunk in chunks:
+        if not chunk:
+            continue
+        buf += chunk
+        while len(buf) >= segment_size:
+            if pending is not None:
+                yield pending, False
+            pending = bytes(buf[:segment_size])
+            del buf[:segment_size]
+    if buf:
+        if pending is not None:
+            yield pending, False
+        yield bytes(buf), True
+    else:
+        # Empty input still produces one (empty) final segment so the
+        # end of the stream is always authenticated.
+        yield (pending if pending is not None else b''), True
+
+
+def read_chunks(stream: BinaryIO, size: int = _READ_SIZE) -> Iterator[bytes]:
+    """Yield fixed-size reads from a file-like object until EOF."""
+    while True:
+        chunk = stream.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+
+class ChunkReader(io.RawIOBase):
+    """Read-only file object over an iterable of byte chunks, e.g. `decrypt_stream`."""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._buf = b''
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buf:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._buf = chunk
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+
+def _valid_name(name: str) -> bool:
+    return bool(name) and name not in ('.', '..') and '/' not in name and '\\' not in name
+
+
+def blob_path(username: str, app_name: str, blob_name: str) -> str:
+    if not _valid_name(app_name):
+        raise BlobError('Invalid app name')
+    if not _valid_name(blob_name):
+        raise BlobError('Invalid blob name')
+    return os.path.join(DB_DIR, username, app_name, BLOBS_SUBDIR, blob_name + '.blob')
+
+
+def encrypt_stream(chunks: Iterable[bytes], passphrase: str, out: BinaryIO,
+                   segment_size: int = SEGMENT_SIZE) -> int:
+    """Encrypt an iterable of plaintext chunks into `out`. Returns plaintext byte count."""
+    if passphrase is None or passphrase == "":
+        raise BlobError('Passphrase required')
+    salt = os.urandom(crypto._SALT_SIZE)
+    prefix = os.urandom(_NONCE_PREFIX_SIZE)
+    aead = _blob_key(passphrase, salt)
+    out.write(_HEADER.pack(MAGIC, salt, prefix, segment_size))
+    total = 0
+    for counter, (segment, last) in enumerate(_iter_segments(chunks, segment_size)):
+        out.write(aead.encrypt(_nonce(prefix, counter, last), segment, None))
+        total += len(segment)
+    return total
+
+
+def decrypt_stream(src: BinaryIO, passphrase: str) -> Iterator[bytes]:
+    """Yield decrypted plaintext segments from an encrypted blob stream.
+
+    The first segment is authenticated before this function returns, so a
+    wrong passphrase or corrupt header raises BlobError eagerly rather than
+    partway through a response.
+    """
+    if passphrase is None or passphrase == "":
+        raise BlobError('Passphrase required')
+    header = src.read(_HEADER.size)
+    if len(header) != _HEADER.size:
+        raise BlobError('Invalid blob header')
+    magic, salt, prefix, segment_size = _HEADER.unpack(header)
+    if magic != MAGIC or segment_size <= 0:
+        raise BlobError('Invalid blob header')
+    aead = _blob_key(passphrase, salt)
+    record_size = segment_size + _TAG_SIZE
+
+    def _open(counter: int, record: bytes, last: bool) -> bytes:
+        try:
+            return aead.decrypt(_nonce(prefix, counter, last), record, None)
+        except Exception:
+            raise BlobError('Blob authentication failed')
+
+    current = src.read(record_size)
+    if len(current) < _TAG_SIZE:
+        raise BlobError('Blob is truncated')
+    following = src.read(record_size)
+    first = _open(0, current, not following)
+
+    def _generate() -> Iterator[bytes]:
+        nonlocal current, following
+        yield first
+        counter = 0
+        while following:
+            counter += 1
+            current, following = following, src.read(record_size)
+            if len(current) < _TAG_SIZE:
+                raise BlobError('Blob is truncated')
+            yield _open(counter, current, not following)
+
+    return _generate()
+
+
+def store_blob(username: str, app_name: str, blob_name: str, passphrase: str,
+               chunks: Iterable[bytes]) -> tuple[str, int]:
+    """Stream-encrypt `chunks` into the app's blob directory. Returns (path, size)."""
+    filename = blob_path(username, app_name, blob_name)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    tmp = filename + '.tmp'
+    try:
+        with open(tmp, 'wb') as f:
+            size = encrypt_stream(chunks, passphrase, f)
+        os.replace(tmp, filename)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+    return filename, size
+
+
+def open_blob(username: str, app_name: str, blob_name: str, passphrase: str) -> Optional[Iterator[bytes]]:
+    """Return a plaintext chunk iterator for a stored blob, or None if it does not exist."""
+    filename = blob_path(username, app_name, blob_name)
+    if not os.path.exists(filename):
+        return None
+    f = open(filename, 'rb')
+    try:
+        segments = decrypt_stream(f, passphrase)
+    except BaseException:
+        f.close()
+        raise
+
+    def _generate() -> Iterator[bytes]:
+        try:
+            yield from segments
+        finally:
+            f.close()
+
+    return _generate()
+
+
+def list_blobs(username: str, app_name: str) -> list[dict]:
+    if not _valid_name(app_name):
+        raise BlobError('Invalid app name')
+    blob_dir = os.path.join(DB_DIR, username, app_name, BLOBS_SUBDIR)
+    if not os.path.isdir(blob_dir):
+        return []
+    blobs = []
+    for item in sorted(os.listdir(blob_dir)):
+        if not item.endswith('.blob'):
+            continue
+        stat = os.stat(os.path.join(blob_dir, item))
+        blobs.append({'name': item[:-len('.blob')], 'modified': stat.st_mtime, 'size': stat.st_size})
+    return blobs
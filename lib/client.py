@@ -0,0 +1,323 @@
+import argparse
+import collections
+import getpass
+import http.client
+import json
+import os
+import queue
+import ssl
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, Optional
+from urllib.parse import quote, urlsplit
+
+# Scriptable client for the server's JSON API.
+#
+# One `Client` logs in once and shares that session (the Flask session cookie)
+# across a small pool of keep-alive connections, so a batch of operations pays
+# for one login and a handful of TCP/TLS handshakes instead of one per call.
+# `batch()` keeps up to `parallel` requests in flight over the pool, reading
+# its input lazily and yielding results in input order, so a batch read from
+# stdin needs memory only for the requests in flight.
+#
+# Only the standard library is used, so the client runs anywhere Python does.
+
+DEFAULT_URL = 'http://localhost:5001'
+DEFAULT_PARALLEL = 4
+MAX_PARALLEL = 8            # every store/retrieve/update costs the server a KDF run
+DEFAULT_TIMEOUT = 60.0
+MAX_RETRIES = 3             # for 429/503 answers that carry Retry-After
+OPS = ('store', 'retrieve', 'update')
+
+
+class ClientError(Exception):
+    """An API call answered with an error status."""
+
+    def __init__(self, status: int, message: str, body: Optional[dict] = None):
+        super().__init__(f'{status}: {message}')
+        self.status = status
+        self.message = message
+        self.body = body or {}
+
+
+class _Pool:
+    """Keep-alive connections to one host, handed out one request at a time."""
+
+    def __init__(self, url: str, size: int, context: Optional[ssl.SSLContext], timeout: float):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f'Unsupported URL scheme: {parts.scheme!r}')
+        self.host, self.port = parts.hostname or 'localhost', parts.port
+        self.https = parts.scheme == 'https'
+        self.context = context
+        self.timeout = timeout
+        self.size = size
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self.opened = 0
+
+    def _connect(self) -> http.client.HTTPConnection:
+        self.opened += 1
+        if self.https:
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout, context=self.context)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method: str, path: str, body: Optional[bytes], headers: dict):
+        """(status, headers, body bytes) for one request on a pooled connection."""
+        with self._slots:
+            try:
+                conn, reused = self._idle.get_nowait(), True
+            except queue.Empty:
+                conn, reused = self._connect(), False
+            while True:
+                try:
+                    conn.request(method, path, body=body, headers=headers)
+                    response = conn.getresponse()
+                    break
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                    conn.close()
+                    if not reused:
+                        raise
+                    # the server closed an idle keep-alive connection; nothing was processed
+                    conn, reused = self._connect(), False
+                except Exception:
+                    conn.close()
+                    raise
+            data = response.read()
+            if response.will_close:
+                conn.close()
+            else:
+                self._idle.put(conn)
+            return response.status, response.headers, data
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class Client:
+    def __init__(self, url: str = DEFAULT_URL, pool_size: int = DEFAULT_PARALLEL,
+                 context: Optional[ssl.SSLContext] = None, timeout: float = DEFAULT_TIMEOUT):
+        self._pool = _Pool(url.rstrip('/'), max(1, pool_size), context, timeout)
+        self._cookies: dict = {}
+        self._cookie_lock = threading.Lock()
+        self.username: Optional[str] = None
+
+    def __enter__(self) -> 'Client':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._pool.close()
+
+    @property
+    def connections_opened(self) -> int:
+        return self._pool.opened
+
+    # -- transport ---------------------------------------------------------
+    def _save_cookies(self, headers) -> None:
+        for header in headers.get_all('Set-Cookie') or []:
+            name, _, value = header.split(';', 1)[0].partition('=')
+            with self._cookie_lock:
+                if value:
+                    self._cookies[name.strip()] = value.strip()
+                else:
+                    self._cookies.pop(name.strip(), None)
+
+    def request(self, method: str, path: str, payload: Optional[dict] = None,
+                headers: Optional[dict] = None) -> dict:
+        """Send one API call and return its JSON body; raises ClientError on failure."""
+        headers = dict(headers or {})
+        body = None
+        if payload is not None:
+            body = json.dumps(payload).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        for attempt in range(MAX_RETRIES + 1):
+            with self._cookie_lock:
+                if self._cookies:
+                    headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in self._cookies.items())
+            status, response_headers, data = self._pool.request(method, path, body, headers)
+            self._save_cookies(response_headers)
+            retry_after = response_headers.get('Retry-After')
+            if status in (429, 503) and retry_after and attempt < MAX_RETRIES:
+                time.sleep(min(float(retry_after), 30.0))
+                continue
+            break
+        try:
+            result = json.loads(data) if data else {}
+        except ValueError:
+            result = {'error': data.decode('utf-8', 'replace')}
+        if status >= 400:
+            raise ClientError(status, result.get('error', 'Request failed'), result)
+        return result
+
+    # -- API ---------------------------------------------------------------
+    def login(self, username: str, password: str) -> dict:
+        result = self.request('POST', '/api/auth/login', {'username': username, 'password': password})
+        self.username = username
+        return result
+
+    def logout(self) -> None:
+        self.request('POST', '/api/auth/logout')
+        self.username = None
+
+    def apps(self) -> list:
+        return self.request('GET', '/api/apps').get('apps', [])
+
+    def store(self, app_name: str, secret: str, passphrase: str, app_username: str = '',
+              version: Optional[int] = None) -> dict:
+        """Store a secret; `version` -1 means "must not exist", N means "replace version N"."""
+        return self.request('POST', '/api/secrets/store',
+                            {'app_name': app_name, 'secret_text': secret, 'passphrase': passphrase,
+                             'app_username': app_username}, _precondition(version))
+
+    def retrieve(self, app_name: str, passphrase: str) -> dict:
+        return self.request('POST', '/api/secrets/retrieve', {'app_name': app_name, 'passphrase': passphrase})
+
+    def update(self, app_name: str, passphrase: str, value, key_path: Optional[str] = None,
+               version: Optional[int] = None) -> dict:
+        return self.request('POST', '/api/secrets/update',
+                            {'app_name': app_name, 'passphrase': passphrase, 'value': value,
+                             'key_path': key_path}, _precondition(version))
+
+    def metadata(self, app_name: str) -> dict:
+        return self.request('GET', '/api/secrets/metadata/' + quote(app_name, safe=''))
+
+    # -- batches -----------------------------------------------------------
+    def run(self, op: dict, passphrase: Optional[str] = None) -> dict:
+        """Run one batch operation ({'op', 'app_name', ...}); errors become results."""
+        kind = op.get('op')
+        app_name = op.get('app_name')
+        result = dict({'line': op['line']} if 'line' in op else {}, op=kind, app_name=app_name)
+        passphrase = op.get('passphrase') or passphrase
+        try:
+            if kind not in OPS:
+                raise ValueError(op.get('error') or f"op must be one of {', '.join(OPS)}")
+            if not app_name or not passphrase:
+                raise ValueError('app_name and a passphrase are required')
+            if kind == 'store':
+                response = self.store(app_name, op.get('secret', ''), passphrase,
+                                      op.get('app_username', ''), op.get('version'))
+            elif kind == 'retrieve':
+                response = self.retrieve(app_name, passphrase)
+            else:
+                response = self.update(app_name, passphrase, op.get('value'), op.get('key_path'),
+                                       op.get('version'))
+        except ClientError as e:
+            return dict(result, ok=False, status=e.status, error=e.message)
+        except (ValueError, OSError, http.client.HTTPException) as e:
+            return dict(result, ok=False, error=str(e))
+        response.pop('success', None)
+        return dict(result, ok=True, **response)
+
+    def batch(self, ops: Iterable[dict], passphrase: Optional[str] = None,
+              parallel: int = DEFAULT_PARALLEL) -> Iterator[dict]:
+        """Run operations with up to `parallel` in flight, yielding results in input order."""
+        parallel = max(1, min(parallel, MAX_PARALLEL, self._pool.size))
+        pending: collections.deque = collections.deque()
+        with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix='client') as executor:
+            for op in ops:
+                pending.append(executor.submit(self.run, op, passphrase))
+                if len(pending) >= parallel:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+
+def _precondition(version: Optional[int]) -> dict:
+    if version is None:
+        return {}
+    if version == -1:
+        return {'If-None-Match': '*'}
+    return {'If-Match': f'"{version}"'}
+
+
+def ssl_context(cafile: Optional[str] = None, insecure: bool = False) -> ssl.SSLContext:
+    """Client context for a server using its own self-signed certificate."""
+    context = ssl.create_default_context(cafile=cafile)
+    if insecure:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    elif cafile:
+        # the generated certificate names the phone's addresses, but automation
+        # often reaches it through another name or a tunnel
+        context.check_hostname = False
+    return context
+
+
+def read_ops(lines: Iterable[str], default_op: Optional[str] = None) -> Iterator[dict]:
+    """Parse batch input: one JSON object per line, or a bare app name.
+
+    Blank lines and lines starting with '#' are skipped. A line without an
+    'op' gets `default_op`.
+    """
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('{'):
+            try:
+                op = json.loads(line)
+            except ValueError as e:
+                op = {'error': f'Malformed JSON: {e}'}
+        else:
+            op = {'app_name': line}
+        if 'error' not in op:
+            op.setdefault('op', default_op)
+        op['line'] = number
+        yield op
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description='Batch store, retrieve and update secrets over one authenticated session',
+        epilog="Input is one JSON object per line, e.g. "
+               '{"op": "store", "app_name": "mail", "secret": "...", "app_username": "me"}; '
+               "for retrieve a bare app name per line also works. Results are printed as "
+               "JSON lines in input order. SECRET_SERVER_PASSWORD and SECRET_SERVER_PASSPHRASE "
+               "are used instead of prompting when set.")
+    parser.add_argument('command', choices=OPS + ('batch',),
+                        help="operation for every line, or 'batch' to take each line's \"op\"")
+    parser.add_argument('file', nargs='?', default='-', help="input file, or '-' for stdin (default)")
+    parser.add_argument('--url', default=os.environ.get('SECRET_SERVER_URL', DEFAULT_URL))
+    parser.add_argument('--user', required=True)
+    parser.add_argument('--parallel', type=int, default=DEFAULT_PARALLEL,
+                        help=f'requests in flight (at most {MAX_PARALLEL})')
+    parser.add_argument('--cacert', help='server certificate to trust, e.g. server_state/tls/cert.pem')
+    parser.add_argument('--insecure', action='store_true', help='do not verify the server certificate')
+    args = parser.parse_args(argv)
+
+    password = os.environ.get('SECRET_SERVER_PASSWORD') or getpass.getpass(f'Login password for {args.user}: ')
+    passphrase = os.environ.get('SECRET_SERVER_PASSPHRASE') or getpass.getpass('Encryption passphrase: ')
+    parallel = max(1, min(args.parallel, MAX_PARALLEL))
+    context = ssl_context(args.cacert, args.insecure) if args.url.startswith('https') else None
+
+    stream = sys.stdin if args.file == '-' else open(args.file, 'r', encoding='utf-8')
+    failed = 0
+    try:
+        with Client(args.url, pool_size=parallel, context=context) as client:
+            try:
+                client.login(args.user, password)
+            except ClientError as e:
+                print(f'Error: login failed ({e.message})', file=sys.stderr)
+                return 1
+            default_op = None if args.command == 'batch' else args.command
+            for result in client.batch(read_ops(stream, default_op), passphrase, parallel):
+                failed += not result['ok']
+                print(json.dumps(result), flush=True)
+            client.logout()
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    return 0 if not failed else 2
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
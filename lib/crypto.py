@@ -1,4 +1,5 @@
 import base64
+import hashlib
 import os
 from typing import Optional
 
@@ -7,6 +8,8 @@ from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.backends import default_backend
 from cryptography.fernet import Fernet
 
+from lib.locks import SingleFlight
+
 
 class CryptoResult:
     def __init__(self, ok: bool, data: bytes = b"", status: str = ""):
@@ -22,15 +25,44 @@ class CryptoResult:
 # Crypto parameters
 _SALT_SIZE = 16  # bytes
 _KDF_ITERATIONS = 600_000  # PBKDF2 iterations (adjustable)
+# Iteration counts accepted from stored or client-supplied methods; outside
+# this window a payload could make every retrieve burn arbitrary CPU (or, at
+# 0, silently fall back to the default).
+MIN_KDF_ITERATIONS = 100_000
+MAX_KDF_ITERATIONS = 2_000_000
+
+
+_KDF_METHOD_PREFIX = 'pbkdf2:sha256:'
+
+
+def kdf_method(iterations: int = None) -> str:
+    """Method string recorded next to stored ciphertext (mirrors auth.json's `method`)."""
+    return f"{_KDF_METHOD_PREFIX}{iterations or _KDF_ITERATIONS}"
+
 
+def iterations_from_method(method: Optional[str]) -> int:
+    """Return the PBKDF2 iteration count for a stored `method`; legacy payloads have none."""
+    if not method:
+        return _KDF_ITERATIONS
+    if not isinstance(method, str) or not method.startswith(_KDF_METHOD_PREFIX):
+        raise ValueError(f"Unsupported KDF method: {method}")
+    digits = method[len(_KDF_METHOD_PREFIX):]
+    if not digits.isdigit():
+        raise ValueError(f"Unsupported KDF method: {method}")
+    iterations = int(digits)
+    # the configured count is always accepted, even below the window
+    if iterations != _KDF_ITERATIONS and not MIN_KDF_ITERATIONS <= iterations <= MAX_KDF_ITERATIONS:
+        raise ValueError(f"KDF iterations must be between {MIN_KDF_ITERATIONS} and {MAX_KDF_ITERATIONS}")
+    return iterations
 
-def _derive_key(passphrase: str, salt: bytes) -> bytes:
+
+def _derive_key(passphrase: str, salt: bytes, iterations: int = None) -> bytes:
     """Derive a 32-byte key from the given passphrase and salt using PBKDF2-HMAC-SHA256."""
     kdf = PBKDF2HMAC(
         algorithm=hashes.SHA256(),
         length=32,
         salt=salt,
-        iterations=_KDF_ITERATIONS,
+        iterations=iterations or _KDF_ITERATIONS,
         backend=default_backend(),
     )
     key = kdf.derive(passphrase.encode('utf-8'))
@@ -38,7 +70,7 @@ def _derive_key(passphrase: str, salt: bytes) -> bytes:
     return base64.urlsafe_b64encode(key)
 
 
-def encrypt_secret(plaintext: str, passphrase: str) -> CryptoResult:
+def encrypt_secret(plaintext: str, passphrase: str, iterations: int = None) -> CryptoResult:
     """Encrypt plaintext using a key derived from the passphrase.
 
     Returns a CryptoResult whose `data` is (salt || fernet_token) as raw bytes.
@@ -49,7 +81,7 @@ def encrypt_secret(plaintext: str, passphrase: str) -> CryptoResult:
 
     try:
         salt = os.urandom(_SALT_SIZE)
-        fernet_key = _derive_key(passphrase, salt)
+        fernet_key = _derive_key(passphrase, salt, iterations)
         f = Fernet(fernet_key)
         token = f.encrypt(plaintext.encode('utf-8'))
         return CryptoResult(True, data=salt + token)
@@ -59,8 +91,12 @@ def encrypt_secret(plaintext: str, passphrase: str) -> CryptoResult:
         return CryptoResult(False, status=str(e))
 
 
-def decrypt_secret(encrypted_text: str, passphrase: str) -> CryptoResult:
-    """Decrypt a base64-encoded (salt || token) value using the passphrase."""
+def decrypt_secret(encrypted_text: str, passphrase: str, iterations: int = None) -> CryptoResult:
+    """Decrypt a base64-encoded (salt || token) value using the passphrase.
+
+    `iterations` must match the value used at encryption time; see
+    `iterations_from_method` for reading it from a stored payload.
+    """
     if passphrase is None or passphrase == "":
         return CryptoResult(False, status="Passphrase required")
 
@@ -70,9 +106,55 @@ def decrypt_secret(encrypted_text: str, passphrase: str) -> CryptoResult:
             return CryptoResult(False, status="Invalid encrypted payload")
         salt = combined[:_SALT_SIZE]
         token = combined[_SALT_SIZE:]
-        fernet_key = _derive_key(passphrase, salt)
+        fernet_key = _derive_key(passphrase, salt, iterations)
         f = Fernet(fernet_key)
         plaintext = f.decrypt(token)
         return CryptoResult(True, data=plaintext)
     except Exception as e:
         return CryptoResult(False, status=str(e))
+
+
+# Concurrent decryptions of the same stored secret with the same passphrase
+# (one secret opened on several devices, a double-fired request) share one
+# KDF run. Callers are matched on a keyed digest of the passphrase, so the
+# in-flight table never holds the passphrase itself, and on a digest of the
+# ciphertext, so a caller never gets the plaintext of a different ciphertext
+# filed under the same key (a rewrite that kept the version, say). Results
+# are not cached.
+_decrypt_flights = SingleFlight()
+_FLIGHT_KEY = os.urandom(32)
+
+
+def decrypt_secret_shared(key: tuple, encrypted_text: str, passphrase: str,
+                          iterations: int = None) -> CryptoResult:
+    """`decrypt_secret`, shared with concurrent callers passing the same `key`
+    (e.g. user, app and payload version), ciphertext and passphrase."""
+    if passphrase is None or passphrase == "":
+        return CryptoResult(False, status="Passphrase required")
+    digest = hashlib.blake2b(passphrase.encode('utf-8'), key=_FLIGHT_KEY, digest_size=16).digest()
+    text_digest = hashlib.sha256(encrypted_text.encode('utf-8')).digest()
+    result, _ = _decrypt_flights.do(
+        (key, text_digest, digest, iterations),
+        lambda: decrypt_secret(encrypted_text, passphrase, iterations))
+    return result
+
+
+def coalescing_stats() -> dict:
+    """How often concurrent decryptions were served by another caller's KDF run."""
+    return _decrypt_flights.stats()
+
+
+def is_valid_ciphertext(encrypted_text: str) -> bool:
+    """Cheap structural check of a client-supplied base64 (salt || fernet token) value.
+
+    Used by the ciphertext passthrough API, where the server stores data it
+    cannot decrypt; it only guards against storing something no client could
+    ever open.
+    """
+    try:
+        combined = base64.b64decode(encrypted_text.encode('utf-8'), validate=True)
+        token = base64.urlsafe_b64decode(combined[_SALT_SIZE:])
+    except Exception:
+        return False
+    # version (1) + timestamp (8) + IV (16) + one AES block (16) + HMAC (32)
+    return len(token) >= 73 and token[0] == 0x80
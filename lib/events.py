@@ -0,0 +1,144 @@
+import collections
+import itertools
+import json
+import threading
+import time
+from typing import Optional
+
+from lib import storage
+
+# Live change notifications for connected clients (server-sent events).
+#
+# Every storage write is published to the subscriptions of the user it
+# belongs to as {type, name, version}; `type` is 'created' for the first
+# version of a secret and 'updated' otherwise ('deleted' is reserved for when
+# storage gains a delete). A subscription is a bounded buffer plus a
+# condition variable: an idle client costs one thread parked in wait() and
+# wakes only for its own user's events or for a heartbeat. A client that
+# falls more than BUFFER_SIZE events behind gets a single 'resync' instead,
+# and refetches what changed rather than being sent a backlog.
+#
+# Subscriptions are per process; with several workers a client hears about
+# writes made by the worker it is connected to.
+
+HEARTBEAT_INTERVAL = 20.0   # seconds between comments on an idle stream
+BUFFER_SIZE = 64            # events held per client before it must resync
+MAX_SUBSCRIBERS = 16        # open streams per user
+RETRY_MS = 5000             # reconnect delay suggested to EventSource
+
+
+class TooManySubscribers(Exception):
+    """Raised when a user already has MAX_SUBSCRIBERS open streams."""
+
+
+class Subscription:
+    def __init__(self, username: str, buffer_size: int = BUFFER_SIZE):
+        self.username = username
+        self._events: collections.deque = collections.deque()
+        self._buffer_size = buffer_size
+        self._cond = threading.Condition()
+        self._overflowed = False
+        self.closed = False
+
+    def push(self, event: dict) -> None:
+        with self._cond:
+            if self._overflowed:
+                return
+            if len(self._events) >= self._buffer_size:
+                self._events.clear()
+                self._overflowed = True
+            else:
+                self._events.append(event)
+            self._cond.notify()
+
+    def wait(self, timeout: float = HEARTBEAT_INTERVAL) -> list:
+        """Events received since the last call; [] after `timeout` idle seconds."""
+        with self._cond:
+            if not self._events and not self._overflowed and not self.closed:
+                self._cond.wait(timeout)
+            if self._overflowed:
+                self._overflowed = False
+                return [{'type': 'resync'}]
+            events = list(self._events)
+            self._events.clear()
+            return events
+
+    def close(self) -> None:
+        unsubscribe(self)
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+
+_subscriptions: dict = {}
+_lock = threading.Lock()
+_ids = itertools.count(1)
+
+
+def subscribe(username: str) -> Subscription:
+    with _lock:
+        subs = _subscriptions.setdefault(username, set())
+        if len(subs) >= MAX_SUBSCRIBERS:
+            raise TooManySubscribers(f'Too many open event streams for {username}')
+        sub = Subscription(username)
+        subs.add(sub)
+        return sub
+
+
+def unsubscribe(sub: Subscription) -> None:
+    with _lock:
+        subs = _subscriptions.get(sub.username)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del _subscriptions[sub.username]
+
+
+def subscriber_count(username: Optional[str] = None) -> int:
+    with _lock:
+        if username is not None:
+            return len(_subscriptions.get(username, ()))
+        return sum(len(subs) for subs in _subscriptions.values())
+
+
+def publish(username: str, event_type: str, name: str, version: Optional[int] = None) -> None:
+    with _lock:
+        subs = list(_subscriptions.get(username, ()))
+    if not subs:
+        return
+    event = {'id': next(_ids), 'type': event_type, 'name': name, 'version': version, 'time': time.time()}
+    for sub in subs:
+        sub.push(event)
+
+
+def format_event(event: dict) -> str:
+    """One event in text/event-stream framing."""
+    if event['type'] == 'resync':
+        return 'event: resync\ndata: {}\n\n'
+    data = {k: event[k] for k in ('type', 'name', 'version', 'time')}
+    return f"id: {event['id']}\nevent: change\ndata: {json.dumps(data)}\n\n"
+
+
+def stream(sub: Subscription, heartbeat: float = HEARTBEAT_INTERVAL):
+    """Yield the text/event-stream body for a subscription until it is closed
+    or the client goes away."""
+    try:
+        yield f'retry: {RETRY_MS}\nevent: ready\ndata: {{}}\n\n'
+        while not sub.closed:
+            events = sub.wait(heartbeat)
+            if events:
+                yield ''.join(format_event(e) for e in events)
+            else:
+                # a comment line; keeps proxies from timing out and lets a
+                # dead client be noticed on the next write
+                yield ': heartbeat\n\n'
+    finally:
+        sub.close()
+
+
+def _on_store(username: str, app_name: str, payload: dict) -> None:
+    version = storage.payload_version(payload)
+    publish(username, 'created' if version == 1 else 'updated', app_name, version)
+
+
+storage.add_listener(_on_store)
@@ -0,0 +1,336 @@
+import argparse
+import csv
+import datetime
+import getpass
+import io
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Iterable, Iterator, Optional
+from urllib.parse import urlparse
+
+from lib import blobs, crypto, jobs, storage
+
+# Bulk import of password-manager exports.
+#
+# Exports are parsed incrementally (CSV rows, or the elements of a JSON array
+# read a chunk at a time) into plain entries. Entries are processed in
+# batches: each batch is encrypted on a worker pool, since the per-secret KDF
+# dominates the cost, then written through `storage.store_payload`. Only one
+# batch is held in memory at a time, whatever the size of the export.
+
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+READ_SIZE = 64 * 1024
+MAX_NAME_LENGTH = 100
+MAX_ERRORS = 20             # error messages kept in the progress report
+ON_CONFLICT = ('skip', 'overwrite', 'rename')
+
+# Column names used by common exporters (Bitwarden, LastPass, 1Password,
+# KeePass, Chrome, Firefox, Dashlane), lowercased.
+_COLUMNS = {
+    'name': ('name', 'title', 'account'),
+    'username': ('username', 'login_username', 'login name', 'login', 'user', 'email'),
+    'password': ('password', 'login_password'),
+    'url': ('url', 'login_uri', 'website', 'web site', 'uri'),
+}
+
+
+class ImportFormatError(Exception):
+    """Raised when an export cannot be parsed."""
+
+
+def _pick(row: dict, field: str) -> str:
+    for column in _COLUMNS[field]:
+        value = row.get(column)
+        if value:
+            return str(value).strip()
+    return ''
+
+
+def _entry(row: dict) -> dict:
+    """Normalise one exported item to {name, username, password, url}."""
+    row = {str(k).strip().lower(): v for k, v in row.items() if k is not None}
+    login = row.get('login')
+    if isinstance(login, dict):
+        # Bitwarden JSON keeps credentials in a nested `login` object
+        uris = login.get('uris') or []
+        row = dict(row, login=None, username=login.get('username'), password=login.get('password'),
+                   url=uris[0].get('uri') if uris and isinstance(uris[0], dict) else None)
+    entry = {field: _pick(row, field) for field in _COLUMNS}
+    if not entry['name'] and entry['url']:
+        entry['name'] = urlparse(entry['url']).hostname or entry['url']
+    return entry
+
+
+def _iter_csv(stream) -> Iterator[dict]:
+    for row in csv.DictReader(stream):
+        yield _entry(row)
+
+
+class _JsonArrayReader:
+    """Yield the elements of a JSON array (top level, or a top-level object's
+    `items`) without reading the whole document."""
+
+    def __init__(self, stream, head: str = ''):
+        self._stream = stream
+        self._buf = head
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._stream.read(READ_SIZE)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos].isspace():
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, char: str) -> None:
+        if self._peek() != char:
+            raise ImportFormatError(f"Malformed JSON: expected '{char}'")
+        self._pos += 1
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError as e:
+                if not self._fill():
+                    raise ImportFormatError(f"Malformed JSON: {e.msg}")
+                continue
+            self._pos = end
+            return value
+
+    def _elements(self) -> Iterator:
+        self._expect('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self._value()
+            char = self._peek()
+            self._pos += 1
+            if char == ']':
+                return
+            if char != ',':
+                raise ImportFormatError("Malformed JSON: expected ',' or ']'")
+
+    def __iter__(self) -> Iterator:
+        if self._peek() == '[':
+            yield from self._elements()
+            return
+        self._expect('{')
+        while self._peek() not in ('}', ''):
+            key = self._value()
+            self._expect(':')
+            if key == 'items' and self._peek() == '[':
+                yield from self._elements()
+                return
+            self._value()           # skip folders, collections, ...
+            if self._peek() == ',':
+                self._pos += 1
+        raise ImportFormatError("JSON export has no 'items' array")
+
+
+def _iter_json(stream, head: str = '') -> Iterator[dict]:
+    for item in _JsonArrayReader(stream, head):
+        if isinstance(item, dict):
+            yield _entry(item)
+
+
+def iter_entries(stream, fmt: Optional[str] = None) -> Iterator[dict]:
+    """Parse a text stream as a CSV or JSON export; `fmt` None detects it."""
+    if fmt == 'csv':
+        return _iter_csv(stream)
+    if fmt == 'json':
+        return _iter_json(stream)
+    if fmt is not None:
+        raise ImportFormatError(f"Unsupported format: {fmt}")
+    head = stream.read(1)
+    while head.isspace():
+        head = stream.read(1)
+    if head in ('[', '{'):
+        return _iter_json(stream, head)
+    first_line = head + stream.readline()
+    return _iter_csv(itertools.chain([first_line], stream))
+
+
+def app_name_for(entry: dict) -> str:
+    name = entry['name'].replace('/', '_').replace('\\', '_').replace('\0', '').strip()
+    name = name[:MAX_NAME_LENGTH].strip()
+    return name if name not in ('', '.', '..') else 'imported'
+
+
+def _encrypt(password: str, passphrase: str) -> str:
+    # top-level so it can run in a process pool
+    result = crypto.encrypt_secret(password, passphrase)
+    if not result.ok:
+        raise ValueError(f'Encryption failed: {result.status}')
+    return str(result)
+
+
+def _batches(entries: Iterable[dict], size: int) -> Iterator[list]:
+    it = iter(entries)
+    while True:
+        batch = list(itertools.islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def run_import(username: str, entries: Iterable[dict], passphrase: str, on_conflict: str = 'skip',
+               batch_size: int = DEFAULT_BATCH_SIZE, workers: int = DEFAULT_WORKERS,
+               executor: Optional[Executor] = None) -> Iterator[dict]:
+    """Import entries for `username`, yielding a progress report after each batch.
+
+    `on_conflict` decides what happens when an app already exists: 'skip' it,
+    'overwrite' it, or store the entry under a 'name (2)'-style name. The last
+    report has `done` set.
+    """
+    if on_conflict not in ON_CONFLICT:
+        raise ValueError(f"on_conflict must be one of {', '.join(ON_CONFLICT)}")
+    progress = {'processed': 0, 'imported': 0, 'skipped': 0, 'failed': 0, 'errors': [], 'done': False}
+
+    def fail(entry, message):
+        progress['failed'] += 1
+        if len(progress['errors']) < MAX_ERRORS:
+            progress['errors'].append({'name': entry['name'], 'error': message})
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='import')
+    try:
+        for batch in _batches(entries, max(1, batch_size)):
+            progress['processed'] += len(batch)
+            todo = []
+            for entry in batch:
+                if not entry['password']:
+                    # secure notes, cards and the like have nothing to store
+                    progress['skipped'] += 1
+                    continue
+                name = app_name_for(entry)
+                # don't spend a KDF on entries that will be skipped anyway
+                if on_conflict == 'skip' and storage.current_version(username, name) is not None:
+                    progress['skipped'] += 1
+                    continue
+                todo.append((entry, name))
+
+            futures = [executor.submit(_encrypt, entry['password'], passphrase) for entry, _ in todo]
+            timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+            for (entry, name), future in zip(todo, futures):
+                try:
+                    ciphertext = future.result()
+                except Exception as e:
+                    fail(entry, str(e))
+                    continue
+                payload = {'app_username': entry['username'], 'password': ciphertext,
+                           'method': crypto.kdf_method(), 'timestamp': timestamp}
+                try:
+                    _write(username, name, payload, on_conflict)
+                    progress['imported'] += 1
+                except storage.VersionConflict:
+                    progress['skipped'] += 1
+                except OSError as e:
+                    fail(entry, str(e))
+            yield dict(progress, errors=list(progress['errors']))
+    finally:
+        if own_executor:
+            executor.shutdown(cancel_futures=True)
+    progress['done'] = True
+    yield progress
+
+
+def _write(username: str, name: str, payload: dict, on_conflict: str) -> None:
+    if on_conflict == 'overwrite':
+        storage.store_payload(username, name, None, payload)
+        return
+    if on_conflict == 'skip':
+        storage.store_payload(username, name, None, payload, expected_version=-1)
+        return
+    for n in itertools.count(1):
+        candidate = name if n == 1 else f"{name[:MAX_NAME_LENGTH - 6]} ({n})"
+        try:
+            storage.store_payload(username, candidate, None, payload, expected_version=-1)
+            return
+        except storage.VersionConflict:
+            continue
+
+
+def spool(chunks: Iterable[bytes]) -> tuple[str, str]:
+    """Write an uploaded export to disk for a background job, encrypted under a
+    one-off key that is kept only in memory. Returns (path, key)."""
+    path, key = jobs.spool_path(), os.urandom(32).hex()
+    with open(path, 'wb') as f:
+        blobs.encrypt_stream(chunks, key, f)
+    return path, key
+
+
+def _import_job(job, spool_file: str, fmt: Optional[str], on_conflict: str, batch_size: int,
+                passphrase: str, spool_key: str) -> dict:
+    progress = {}
+    with open(spool_file, 'rb') as f:
+        raw = blobs.ChunkReader(blobs.decrypt_stream(f, spool_key))
+        stream = io.TextIOWrapper(io.BufferedReader(raw), encoding='utf-8-sig', newline='')
+        for progress in run_import(job.user, iter_entries(stream, fmt), passphrase, on_conflict, batch_size):
+            job.update(**progress)
+            job.check_cancelled()
+    return progress
+
+
+jobs.register('import', _import_job)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Import a password-manager export (CSV or JSON)')
+    parser.add_argument('file', help="export file, or '-' for stdin")
+    parser.add_argument('--user', required=True)
+    parser.add_argument('--format', choices=('csv', 'json'), help='detected from the content if omitted')
+    parser.add_argument('--on-conflict', choices=ON_CONFLICT, default='skip')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='encryption processes')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    from lib import auth
+    if not auth.check_auth(args.user, getpass.getpass(f'Login password for {args.user}: ')):
+        print('Error: invalid username or password')
+        return 1
+    passphrase = getpass.getpass('Encryption passphrase for imported secrets: ')
+
+    stream = sys.stdin if args.file == '-' else open(args.file, 'r', encoding='utf-8-sig', newline='')
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            for progress in run_import(args.user, iter_entries(stream, args.format), passphrase,
+                                       args.on_conflict, args.batch_size, executor=executor):
+                print(f"\r{progress['processed']} read, {progress['imported']} imported, "
+                      f"{progress['skipped']} skipped, {progress['failed']} failed", end='', flush=True)
+    except ImportFormatError as e:
+        print(f"\nError: {e}")
+        return 1
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    print()
+    for error in progress['errors']:
+        print(f"  {error['name'] or '(unnamed)'}: {error['error']}")
+    return 0 if not progress['failed'] else 2
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
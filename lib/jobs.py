@@ -0,0 +1,306 @@
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+
+# In-process background jobs for operations too slow to run inside a request.
+#
+# A route submits a job and answers 202 with its id; a bounded pool of worker
+# threads runs jobs in submission order. Each job's state, progress and result
+# live in server_state/jobs/<id>.json, so they survive a restart. Values that
+# must never reach the disk (passphrases, login passwords) are passed as
+# `secrets` and held only in memory; a job that needed them and was queued or
+# running when the process stopped is marked 'interrupted' on the next start,
+# while secret-free jobs are queued again. The server calls `start()` at
+# start-up so that happens straight away, not on the first jobs API call.
+#
+# Files listed in a job's `files` (such as an uploaded body spooled for the
+# handler) are deleted once the job finishes, however it finishes.
+#
+# Handlers are registered per kind and called as fn(job, **params, **secrets).
+# Long handlers call `job.update(...)` to publish progress and
+# `job.check_cancelled()` between steps.
+
+STATE_DIR = 'server_state'
+JOBS_DIR = os.path.join(STATE_DIR, 'jobs')
+DEFAULT_WORKERS = 2
+MAX_PENDING = 16            # queued jobs per user
+KEEP_FINISHED = 200         # finished job records kept on disk
+SAVE_INTERVAL = 0.5         # seconds between progress writes
+
+FINISHED = ('done', 'failed', 'cancelled', 'interrupted')
+
+_handlers: dict = {}
+
+
+def register(kind: str, fn: Callable) -> None:
+    _handlers[kind] = fn
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler by `check_cancelled()` once cancellation is requested."""
+
+
+class QueueFull(Exception):
+    """Raised when a user already has MAX_PENDING jobs waiting."""
+
+
+class Job:
+    def __init__(self, kind: str, user: str, params: Optional[dict] = None,
+                 secrets: Optional[dict] = None, files: Optional[list] = None,
+                 job_id: Optional[str] = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.user = user
+        self.params = params or {}
+        self.secrets = secrets or {}
+        self.files = files or []
+        self.state = 'queued'
+        self.progress: dict = {}
+        self.result = None
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.needs_secrets = bool(self.secrets)
+        self._cancel = threading.Event()
+        self._saved_at = 0.0
+        self.queue: Optional['JobQueue'] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def check_cancelled(self) -> None:
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def update(self, **progress) -> None:
+        """Publish progress; written to disk at most every SAVE_INTERVAL."""
+        self.progress = dict(self.progress, **progress)     # swapped whole for readers
+        if self.queue is not None and time.monotonic() - self._saved_at >= SAVE_INTERVAL:
+            self.queue.save(self)
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'user': self.user,
+            'state': self.state,
+            'params': self.params,
+            'progress': self.progress,
+            'error': self.error,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'needs_secrets': self.needs_secrets,
+            'files': self.files,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Job':
+        job = cls(data['kind'], data['user'], data.get('params'), files=data.get('files'), job_id=data['id'])
+        for field in ('state', 'progress', 'result', 'error', 'created', 'started', 'finished', 'needs_secrets'):
+            if field in data:
+                setattr(job, field, data[field])
+        return job
+
+
+class JobQueue:
+    def __init__(self, directory: str = JOBS_DIR, workers: int = DEFAULT_WORKERS,
+                 max_pending: int = MAX_PENDING):
+        # absolute, so workers keep writing to the same place if the cwd changes
+        self.directory = os.path.abspath(directory)
+        self.workers = workers
+        self.max_pending = max_pending
+        self._jobs: dict = {}
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads: list = []
+        self._loaded = False
+
+    # -- persistence -------------------------------------------------------
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.directory, job_id + '.json')
+
+    def save(self, job: Job) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        job._saved_at = time.monotonic()
+        data = dict(job.to_dict(), result=job.result)
+        tmp = self._path(job.id) + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, self._path(job.id))
+
+    def _finish(self, job: Job, state: str, error: Optional[str] = None) -> None:
+        job.state, job.error, job.finished, job.secrets = state, error, time.time(), {}
+        for path in job.files:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.save(job)
+
+    def _load(self) -> None:
+        """Read job records once; requeue or mark jobs cut off by a restart."""
+        if self._loaded:
+            return
+        self._loaded = True
+        if not os.path.isdir(self.directory):
+            return
+        recovered = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), 'r') as f:
+                    job = Job.from_dict(json.load(f))
+            except (OSError, ValueError, KeyError):
+                continue
+            job.queue = self
+            self._jobs[job.id] = job
+            if job.state not in FINISHED:
+                recovered.append(job)
+        for job in sorted(recovered, key=lambda j: j.created):
+            if job.needs_secrets:
+                self._finish(job, 'interrupted', 'Server restarted before the job finished')
+            else:
+                job.state = 'queued'
+                self._queue.put(job)
+                self._ensure_workers()
+        self._prune()
+
+    def _prune(self) -> None:
+        finished = sorted((j for j in self._jobs.values() if j.state in FINISHED),
+                          key=lambda j: j.finished or 0)
+        for job in finished[:max(0, len(finished) - KEEP_FINISHED)]:
+            del self._jobs[job.id]
+            try:
+                os.remove(self._path(job.id))
+            except FileNotFoundError:
+                pass
+
+    # -- workers -----------------------------------------------------------
+    def _ensure_workers(self) -> None:
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self.workers:
+            t = threading.Thread(target=self._work, name=f'job-worker-{len(self._threads)}', daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _work(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job: Job) -> None:
+        with self._lock:
+            if job.state != 'queued':
+                return          # cancelled while waiting
+            job.state, job.started = 'running', time.time()
+        self.save(job)
+        state, error = 'done', None
+        try:
+            handler = _handlers.get(job.kind)
+            if handler is None:
+                raise ValueError(f'No handler for job kind {job.kind!r}')
+            job.check_cancelled()
+            job.result = handler(job, **job.params, **job.secrets)
+        except JobCancelled:
+            state = 'cancelled'
+        except Exception as e:
+            state, error = 'failed', str(e)
+        with self._lock:
+            self._finish(job, state, error)
+            self._prune()
+
+    # -- API ---------------------------------------------------------------
+    def start(self) -> None:
+        """Load job records now and resume the jobs a restart cut off."""
+        with self._lock:
+            self._load()
+
+    def submit(self, kind: str, user: str, params: Optional[dict] = None,
+               secrets: Optional[dict] = None, files: Optional[list] = None) -> Job:
+        """Queue a job; `params` are persisted, `secrets` stay in memory."""
+        job = Job(kind, user, params, secrets, files)
+        job.queue = self
+        with self._lock:
+            self._load()
+            pending = sum(1 for j in self._jobs.values() if j.user == user and j.state == 'queued')
+            if pending >= self.max_pending:
+                raise QueueFull(f'Too many queued jobs for {user}')
+            self._jobs[job.id] = job
+            self.save(job)
+            self._ensure_workers()
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            self._load()
+            return self._jobs.get(job_id)
+
+    def list(self, user: str) -> list:
+        with self._lock:
+            self._load()
+            return sorted((j for j in self._jobs.values() if j.user == user),
+                          key=lambda j: j.created, reverse=True)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued job at once, or ask a running one to stop."""
+        with self._lock:
+            self._load()
+            job = self._jobs.get(job_id)
+            if job is None or job.state in FINISHED:
+                return job
+            job._cancel.set()
+            if job.state == 'queued':
+                self._finish(job, 'cancelled')
+            return job
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the queue is drained (tests and shutdown); False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+
+_default: Optional[JobQueue] = None
+_default_lock = threading.Lock()
+
+
+def get_queue() -> JobQueue:
+    """The process-wide queue, created on first use."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = JobQueue()
+        return _default
+
+
+def submit(kind: str, user: str, params: Optional[dict] = None, secrets: Optional[dict] = None,
+           files: Optional[list] = None) -> Job:
+    return get_queue().submit(kind, user, params, secrets, files)
+
+
+def start() -> JobQueue:
+    """Resume the process-wide queue; call once the handler modules are imported."""
+    job_queue = get_queue()
+    job_queue.start()
+    return job_queue
+
+
+def spool_path() -> str:
+    """A fresh path under the jobs directory for data a job will read."""
+    os.makedirs(get_queue().directory, exist_ok=True)
+    return os.path.join(get_queue().directory, uuid.uuid4().hex + '.spool')
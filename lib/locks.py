@@ -0,0 +1,91 @@
+import contextlib
+import threading
+
+
+class KeyedLocks:
+    """Per-key mutexes that only exist while someone holds or waits for them.
+
+    Memory is bounded by the number of keys in concurrent use, not by the
+    number of keys ever locked, and different keys never contend.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: dict = {}  # key -> [lock, users]
+
+    @contextlib.contextmanager
+    def hold(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        entry[0].acquire()
+        try:
+            yield
+        finally:
+            entry[0].release()
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._entries[key]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class SingleFlight:
+    """Share one call among concurrent callers asking for the same key.
+
+    The first caller for a key runs the function; callers arriving while it
+    runs wait for it and get the same result (or exception). Nothing is kept
+    once the call completes, so a later caller always computes afresh.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict = {}  # key -> [done event, result, exception]
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Return (fn() result, shared), where shared means another caller ran it."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = [threading.Event(), None, None]
+                self.executed += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+        if not leader:
+            call[0].wait()
+            if call[2] is not None:
+                raise call[2]
+            return call[1], True
+        try:
+            call[1] = fn()
+        except BaseException as e:
+            call[2] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call[0].set()
+        return call[1], False
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.executed + self.coalesced
+            return {
+                'executed': self.executed,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._calls),
+                'hit_rate': round(self.coalesced / total, 3) if total else None,
+            }
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,329 @@
+import abc
+import glob
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+from lib import crypto, jobs, storage
+
+# Resumable background re-encryption jobs.
+#
+# A migration walks a sorted list of files, rewrites them one at a time at a
+# bounded rate and checkpoints its cursor under server_state/migrations/, so a
+# restart resumes where it stopped instead of starting over. Migrations run as
+# 'migration' jobs on lib.jobs and sleep between items to leave the CPU to
+# request handlers. A master key rotation needs no secrets, so after a restart
+# the job queue runs it again and it continues from its checkpoint. A secret
+# re-encryption needs the user's passphrase, which is never stored; its job is
+# reported 'interrupted', and starting it again continues from the checkpoint.
+
+DB_DIR = 'db'
+STATE_DIR = 'server_state'
+MIGRATIONS_DIR = os.path.join(STATE_DIR, 'migrations')
+DEFAULT_RATE = 2.0       # items per second
+MIN_RATE = 0.1           # bounds for a rate supplied by a client
+MAX_RATE = 20.0
+CHECKPOINT_EVERY = 10    # items between checkpoint writes
+MAINTENANCE_USER = ''    # owner of server-wide jobs; no account can have an empty name
+
+
+class Migration(abc.ABC):
+    name = 'migration'
+
+    def __init__(self, rate: float = DEFAULT_RATE):
+        self.rate = rate
+        self.state = 'pending'
+        self.total = 0
+        self.done = 0
+        self.skipped = 0
+        self.failed = 0
+        self.failed_items: list = []
+        self.cursor: Optional[str] = None
+        self.error: Optional[str] = None
+        self._stop = threading.Event()
+        self.job: Optional[jobs.Job] = None      # set when run as a job
+
+    # -- hooks -----------------------------------------------------------
+    @abc.abstractmethod
+    def items(self) -> list:
+        """Return the sorted list of paths to migrate."""
+
+    def begin(self, resumed: bool) -> None:
+        """Prepare the migration; called once before the first item."""
+
+    @abc.abstractmethod
+    def migrate_item(self, path: str) -> bool:
+        """Rewrite one item. Return False if it needed no change."""
+
+    def finish(self) -> str:
+        """Called once after every item has been processed; returns the final state."""
+        return 'done'
+
+    # -- checkpointing ---------------------------------------------------
+    @property
+    def checkpoint_file(self) -> str:
+        return os.path.join(MIGRATIONS_DIR, self.name + '.json')
+
+    def _load_checkpoint(self) -> bool:
+        try:
+            with open(self.checkpoint_file, 'r') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+        if data.get('state') in ('done', 'failed', None):
+            return False        # finished; a new run starts over
+        self.cursor = data.get('cursor')
+        self.done = data.get('done', 0)
+        self.skipped = data.get('skipped', 0)
+        self.failed = data.get('failed', 0)
+        self.failed_items = data.get('failed_items', [])
+        return True
+
+    def _save_checkpoint(self) -> None:
+        os.makedirs(MIGRATIONS_DIR, exist_ok=True)
+        tmp = self.checkpoint_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.progress(), f)
+        os.replace(tmp, self.checkpoint_file)
+
+    # -- execution -------------------------------------------------------
+    def progress(self) -> dict:
+        return {
+            'name': self.name,
+            'state': self.state,
+            'total': self.total,
+            'done': self.done,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'failed_items': self.failed_items,
+            'cursor': self.cursor,
+            'error': self.error,
+        }
+
+    def run(self) -> None:
+        resumed = self._load_checkpoint()
+        try:
+            self.begin(resumed)
+            paths = self.items()
+            self.total = len(paths)
+            self.state = 'running'
+            interval = 1.0 / self.rate if self.rate else 0.0
+            since_checkpoint = 0
+            for path in paths:
+                if self.cursor is not None and path <= self.cursor:
+                    continue
+                if self._stop.is_set() or (self.job is not None and self.job.cancelled):
+                    self.state = 'stopped'
+                    break
+                started = time.monotonic()
+                try:
+                    if self.migrate_item(path):
+                        self.done += 1
+                    else:
+                        self.skipped += 1
+                except Exception:
+                    self.failed += 1
+                    self.failed_items.append(path)
+                self.cursor = path
+                if self.job is not None:
+                    self.job.update(**self.progress())
+                since_checkpoint += 1
+                if since_checkpoint >= CHECKPOINT_EVERY:
+                    self._save_checkpoint()
+                    since_checkpoint = 0
+                remaining = interval - (time.monotonic() - started)
+                if remaining > 0:
+                    self._stop.wait(remaining)
+            else:
+                self.state = self.finish() or 'done'
+        except Exception as e:
+            self.state = 'error'
+            self.error = str(e)
+        self._save_checkpoint()
+
+    def stop(self) -> None:
+        """Ask a running migration to stop after the current item."""
+        self._stop.set()
+
+
+class MasterKeyRotation(Migration):
+    """Rotate server_state/master.key and re-encrypt every stored session.
+
+    The previous key is retired only once every session has been rewritten.
+    Other worker processes notice both steps from the key files within
+    session_store.KEY_CHECK_INTERVAL.
+    If some could not be, the job ends 'failed' with the previous key still
+    readable; starting the rotation again retries them (sessions already under
+    the new key are skipped), and `force=True` deletes the sessions that still
+    fail, logging those users out, so the previous key can be retired.
+    """
+
+    name = 'master-key-rotation'
+
+    def __init__(self, rate: float = DEFAULT_RATE, force: bool = False):
+        super().__init__(rate)
+        self.force = force
+
+    def items(self) -> list:
+        from lib import session_store
+        return sorted(glob.glob(os.path.join(session_store.SESSIONS_DIR, '*.json')))
+
+    def begin(self, resumed: bool) -> None:
+        from lib import session_store
+        # An interrupted or failed rotation still has the previous key on
+        # disk, so dual-key reads are already in place; continue it rather
+        # than installing yet another key.
+        if not session_store.rotating():
+            session_store.rotate_master_key()
+        # Other worker processes switch to the new key on their next key
+        # check; sessions they write before then are under the old key, so
+        # listing the sessions to re-encrypt waits until they all have.
+        self._stop.wait(2 * session_store.KEY_CHECK_INTERVAL)
+
+    def migrate_item(self, path: str) -> bool:
+        from lib import session_store
+        return session_store.reencrypt_session_file(path)
+
+    def finish(self) -> str:
+        from lib import session_store
+        if self.failed and not self.force:
+            self.error = (f'{self.failed} session(s) could not be re-encrypted; the previous key is kept. '
+                          'Run the rotation again to retry, or with force to drop them.')
+            return 'failed'
+        for path in self.failed_items:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        session_store.retire_previous_key()
+        return 'done'
+
+
+class SecretReencryption(Migration):
+    """Re-encrypt one user's secrets under the current KDF parameters.
+
+    Secrets are encrypted with a user passphrase the server never stores, so
+    this job runs per user with the passphrase they supply. Apps encrypted
+    under a different passphrase are reported in `failed_items` and left as
+    they are.
+    """
+
+    def __init__(self, username: str, passphrase: str, rate: float = DEFAULT_RATE):
+        super().__init__(rate)
+        self.username = username
+        self._passphrase = passphrase
+        self.name = f'reencrypt-{username}'
+
+    def items(self) -> list:
+        return sorted(glob.glob(os.path.join(DB_DIR, self.username, '*', 'secret.json')))
+
+    def migrate_item(self, path: str) -> bool:
+        with open(path, 'r') as f:
+            payload = json.load(f)
+        if payload.get('method') == crypto.kdf_method():
+            return False
+        decrypted = crypto.decrypt_secret(payload['password'], self._passphrase,
+                                          crypto.iterations_from_method(payload.get('method')))
+        if not decrypted.ok:
+            raise ValueError(decrypted.status)
+        encrypted = crypto.encrypt_secret(decrypted.data.decode('utf-8'), self._passphrase)
+        if not encrypted.ok:
+            raise ValueError(encrypted.status)
+        base_version = storage.payload_version(payload)
+        payload['password'] = str(encrypted)
+        payload['method'] = crypto.kdf_method()
+        app_name = os.path.basename(os.path.dirname(path))
+        try:
+            storage.store_payload(self.username, app_name, None, payload, expected_version=base_version)
+        except storage.VersionConflict:
+            # A request rewrote the secret meanwhile; it is already current.
+            return False
+        return True
+
+    def run(self) -> None:
+        try:
+            super().run()
+        finally:
+            # never keep the passphrase around once the job has ended
+            self._passphrase = None
+
+
+def parse_rate(value, default: float = DEFAULT_RATE) -> float:
+    """A client-supplied rate, clamped to [MIN_RATE, MAX_RATE]; ValueError if not a number."""
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        raise ValueError('rate must be a number')
+    rate = float(value)
+    if rate != rate:
+        raise ValueError('rate must be a number')
+    return min(max(rate, MIN_RATE), MAX_RATE)
+
+
+def _owner(name: str) -> Optional[str]:
+    if name == MasterKeyRotation.name:
+        return MAINTENANCE_USER
+    if name.startswith('reencrypt-'):
+        return name[len('reencrypt-'):]
+    return None
+
+
+def _migration_job(job: jobs.Job, name: str, rate: float = DEFAULT_RATE, force: bool = False,
+                   passphrase: Optional[str] = None) -> dict:
+    if name == MasterKeyRotation.name:
+        migration: Migration = MasterKeyRotation(rate, force)
+    elif name == f'reencrypt-{job.user}':
+        migration = SecretReencryption(job.user, passphrase, rate)
+    else:
+        raise ValueError(f'Unknown migration {name!r}')
+    migration.job = job
+    migration.run()
+    job.update(**migration.progress())
+    if migration.state == 'stopped':
+        raise jobs.JobCancelled()
+    if migration.state != 'done':
+        raise RuntimeError(migration.error or f'Migration ended {migration.state}')
+    return migration.progress()
+
+
+jobs.register('migration', _migration_job)
+
+
+def _active_job(name: str) -> Optional[jobs.Job]:
+    owner = _owner(name)
+    if owner is None:
+        return None
+    for job in jobs.get_queue().list(owner):
+        if job.kind == 'migration' and job.params.get('name') == name and job.state not in jobs.FINISHED:
+            return job
+    return None
+
+
+def _start(user: str, name: str, params: dict, secrets: Optional[dict] = None) -> jobs.Job:
+    """Queue a migration job unless one with the same name is already queued or running."""
+    existing = _active_job(name)
+    if existing is not None:
+        return existing
+    return jobs.submit('migration', user, dict(params, name=name), secrets)
+
+
+def start_rotation(rate: float = DEFAULT_RATE, force: bool = False) -> jobs.Job:
+    return _start(MAINTENANCE_USER, MasterKeyRotation.name, {'rate': rate, 'force': force})
+
+
+def start_reencryption(username: str, passphrase: str, rate: float = DEFAULT_RATE) -> jobs.Job:
+    return _start(username, f'reencrypt-{username}', {'rate': rate}, {'passphrase': passphrase})
+
+
+def progress(name: str) -> Optional[dict]:
+    """Progress of a queued or running job, else of its last checkpoint on disk."""
+    job = _active_job(name)
+    if job is not None:
+        return dict({'name': name}, **job.progress, state=job.state, job=job.id)
+    try:
+        with open(os.path.join(MIGRATIONS_DIR, name + '.json'), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
@@ -1,6 +1,23 @@
 import socket
 import subprocess
 import ipaddress
+import threading
+import time
+
+# Hotspot detection shells out to `ip`/`ifconfig`, which is far too slow to
+# repeat on every request. The result is cached for a short time instead.
+HOTSPOT_INFO_TTL = 30.0  # seconds
+_hotspot_cache = None  # (expires_at, (subnet, gateway, iface))
+_hotspot_lock = threading.Lock()
+
+# With several worker processes (SHARED_STATE set) the snapshot and the peer
+# list are also published to lib.shared_state, so one process's detection
+# serves them all.
+PEERS_TTL = 5.0  # seconds
+
+def _shared_table():
+    from lib import shared_state
+    return shared_state.table()
 
 def get_hotspot_interface_ifconfig():
     """Find hotspot interface via ifconfig."""
@@ -115,11 +132,55 @@ def get_hotspot_info():
 
     return None, None, None
 
+def get_hotspot_info_cached(max_age=HOTSPOT_INFO_TTL):
+    """
+    Same as get_hotspot_info(), but reuses a result younger than `max_age` seconds.
+    A failed detection is not cached, so a hotspot that comes up is seen at once.
+    """
+    global _hotspot_cache
+    now = time.monotonic()
+    cached = _hotspot_cache
+    if cached and cached[0] > now:
+        return cached[1]
+    with _hotspot_lock:
+        cached = _hotspot_cache
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        table = _shared_table()
+        shared = table.get('network.hotspot') if table is not None else None
+        if shared:
+            info = tuple(shared)
+            _hotspot_cache = (time.monotonic() + max_age, info)
+            return info
+        info = get_hotspot_info()
+        _publish_hotspot(info, max_age)
+        return info
+
+def _publish_hotspot(info, max_age):
+    global _hotspot_cache
+    if not info[0]:
+        return
+    _hotspot_cache = (time.monotonic() + max_age, info)
+    table = _shared_table()
+    if table is not None:
+        from lib import shared_state
+        try:
+            table.set('network.hotspot', list(info), ttl=max_age)
+        except shared_state.SharedTableFull:
+            pass    # this worker still has its own cache; others detect it themselves
+
+def refresh_snapshot():
+    """Re-run hotspot detection now and cache the result (used by start-up warm-up)."""
+    with _hotspot_lock:
+        info = get_hotspot_info()
+        _publish_hotspot(info, HOTSPOT_INFO_TTL)
+        return info
+
 def is_ip_in_hotspot_subnet(ip_addr):
     """
     Checks if a given IP address belongs to the current Hotspot Subnet.
     """
-    subnet_cidr, _, _ = get_hotspot_info()
+    subnet_cidr, _, _ = get_hotspot_info_cached()
     if not subnet_cidr:
         return False
         
@@ -173,6 +234,33 @@ def get_connected_peers():
         
     return peers
 
+def publish_peers(ttl=PEERS_TTL):
+    """Read the neighbour table and publish one shared entry per peer."""
+    from lib import shared_state
+    table = _shared_table()
+    peers = get_connected_peers()
+    if table is not None:
+        try:
+            with table.lock():
+                for ip in peers:
+                    table.set(f'network.peer:{ip}', 1, ttl=ttl)
+                table.set('network.peers.updated', time.time(), ttl=ttl)
+        except (shared_state.SharedTableFull, ValueError) as e:
+            print(f"Warning: Could not publish peers: {e}")
+    return peers
+
+def is_connected_peer(ip_addr):
+    """
+    True if `ip_addr` is in the ARP/neighbour table. With shared state this is
+    a lookup in the published peer list, refreshed when it is older than PEERS_TTL.
+    """
+    table = _shared_table()
+    if table is None:
+        return ip_addr in get_connected_peers()
+    if table.get('network.peers.updated') is None:
+        return ip_addr in publish_peers()
+    return table.get(f'network.peer:{ip_addr}') is not None
+
 def get_local_ip():
     """
     Determines the local IP address of the device by attempting to check
@@ -0,0 +1,235 @@
+import bisect
+import json
+import os
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+from lib import storage
+
+# Per-user in-memory search index over app names and `app_username` values.
+#
+# Each user's index is built from db/ on first query and afterwards kept
+# current by a storage listener, so queries never scan the directory. The
+# build runs outside the global lock; writes that land meanwhile are queued
+# and applied to the new index before it is installed.
+#
+# Prefix matches use bisect over sorted lowercase keys, kept per field and
+# per key length. A prefix score only depends on the field and the key's
+# length, so walking lengths from shortest up visits matches best first and
+# stops as soon as the limit is filled; a prefix shared by every entry (an
+# email domain, 'user') costs no more than a rare one. Among matches of equal
+# score at the cut-off, those whose key sorts first are kept. Fuzzy matches
+# use a trigram inverted index scored by overlap with the query.
+#
+# The listener only sees writes made through store_payload in this process.
+# Writes from other workers, the CLI importer or a snapshot restore reach the
+# index only when it is rebuilt: after a restart, or after reset().
+
+DB_DIR = 'db'
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 200
+MIN_FUZZY_SCORE = 0.3
+STOPGRAM_RATIO = 0.25     # trigrams in more than this share of entries are skipped
+FUZZY_CANDIDATES = 4      # candidates scored exactly, per result slot
+
+# ranking weights, highest wins
+_EXACT = 100.0
+_NAME_PREFIX = 80.0
+_NAME_SUBSTRING = 60.0
+_USER_PREFIX = 50.0
+_USER_SUBSTRING = 45.0
+_FUZZY = 40.0
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class UserIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.entries: dict = {}       # app name -> {'app_username', 'modified', 'grams'}
+        # field -> key length -> sorted (lowercase text, app name)
+        self._keys: dict = {'name': {}, 'user': {}}
+        self._grams: dict = {}        # trigram -> set of app names
+
+    def _texts(self, name: str, entry: dict) -> list:
+        texts = [(name.lower(), 'name')]
+        if entry.get('app_username'):
+            texts.append((entry['app_username'].lower(), 'user'))
+        return texts
+
+    def _remove(self, name: str) -> None:
+        entry = self.entries.pop(name, None)
+        if entry is None:
+            return
+        for text, field in self._texts(name, entry):
+            keys = self._keys[field].get(len(text), [])
+            i = bisect.bisect_left(keys, (text, name))
+            if i < len(keys) and keys[i] == (text, name):
+                del keys[i]
+                if not keys:
+                    del self._keys[field][len(text)]
+            for gram in _trigrams(text):
+                names = self._grams.get(gram)
+                if names is not None:
+                    names.discard(name)
+                    if not names:
+                        del self._grams[gram]
+
+    def put(self, name: str, app_username: str, modified: float) -> None:
+        with self._lock:
+            self._remove(name)
+            entry = {'app_username': app_username or '', 'modified': modified, 'grams': []}
+            self.entries[name] = entry
+            for text, field in self._texts(name, entry):
+                bisect.insort(self._keys[field].setdefault(len(text), []), (text, name))
+                grams = _trigrams(text)
+                entry['grams'].append(grams)
+                for gram in grams:
+                    self._grams.setdefault(gram, set()).add(name)
+
+    def search(self, query: str, limit: int = DEFAULT_LIMIT, fuzzy: bool = True) -> list:
+        q = query.strip().lower()
+        if not q:
+            return []
+        with self._lock:
+            scores: dict = {}
+
+            def offer(name, score):
+                if score > scores.get(name, 0.0):
+                    scores[name] = score
+
+            # Prefix matches, best first: name matches outrank username
+            # matches, and within a field shorter keys outrank longer ones.
+            for field in ('name', 'user'):
+                buckets = self._keys[field]
+                for length in sorted(n for n in buckets if n >= len(q)):
+                    if len(scores) >= limit:
+                        break
+                    keys = buckets[length]
+                    i = bisect.bisect_left(keys, (q,))
+                    while i < len(keys) and len(scores) < limit and keys[i][0].startswith(q):
+                        text, name = keys[i]
+                        if field == 'name':
+                            offer(name, _EXACT if text == q else _NAME_PREFIX + len(q) / length)
+                        else:
+                            offer(name, _USER_PREFIX + len(q) / length)
+                        i += 1
+
+            # Fuzzy/substring matches via trigram overlap. Skipped when prefix
+            # matches (which always outrank them) already fill the limit.
+            if fuzzy and len(scores) < limit:
+                q_grams = _trigrams(q)
+                # Trigrams shared by a large share of entries say little and
+                # make postings long; count hits over the informative ones and
+                # score only the best-supported candidates exactly.
+                cap = max(STOPGRAM_RATIO * len(self.entries), 32)
+                postings = sorted((self._grams.get(gram, ()) for gram in q_grams), key=len)
+                informative = [p for p in postings if len(p) <= cap] or postings[:1]
+                hits = Counter()
+                for names in informative:
+                    hits.update(names)
+                for name, _ in hits.most_common(limit * FUZZY_CANDIDATES):
+                    if name in scores and scores[name] >= _USER_PREFIX:
+                        continue
+                    entry = self.entries[name]
+                    if q in name.lower():
+                        offer(name, _NAME_SUBSTRING + len(q) / len(name))
+                        continue
+                    if q in entry['app_username'].lower():
+                        offer(name, _USER_SUBSTRING + len(q) / len(entry['app_username']))
+                        continue
+                    best = max(len(grams & q_grams) / len(grams | q_grams) for grams in entry['grams'])
+                    if best >= MIN_FUZZY_SCORE:
+                        offer(name, _FUZZY * best)
+
+            ranked = sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))[:limit]
+            return [{'name': name, 'app_username': self.entries[name]['app_username'],
+                     'modified': self.entries[name]['modified'], 'score': round(score, 3)}
+                    for name, score in ranked]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+_indexes: dict = {}
+_building: dict = {}      # username -> (Event set once built, writes seen meanwhile)
+_indexes_lock = threading.Lock()
+
+
+def _build(username: str) -> UserIndex:
+    index = UserIndex()
+    user_dir = os.path.join(DB_DIR, username)
+    if not os.path.isdir(user_dir):
+        return index
+    for item in os.scandir(user_dir):
+        if not item.is_dir():
+            continue
+        secret_file = os.path.join(item.path, 'secret.json')
+        try:
+            with open(secret_file, 'r') as f:
+                payload = json.load(f)
+            modified = os.stat(secret_file).st_mtime
+        except (FileNotFoundError, ValueError):
+            continue
+        index.put(item.name, payload.get('app_username', ''), modified)
+    return index
+
+
+def get_index(username: str) -> UserIndex:
+    """Return the user's index, building it from db/ on first use."""
+    while True:
+        with _indexes_lock:
+            index = _indexes.get(username)
+            if index is not None:
+                return index
+            building = _building.get(username)
+            if building is None:
+                building = _building[username] = (threading.Event(), [])
+                break
+        # another thread is scanning db/ for this user
+        building[0].wait()
+    try:
+        index = _build(username)
+    except BaseException:
+        with _indexes_lock:
+            del _building[username]
+        building[0].set()
+        raise
+    with _indexes_lock:
+        # writes that landed during the scan are newer than what it read
+        for update in building[1]:
+            index.put(*update)
+        _indexes[username] = index
+        del _building[username]
+    building[0].set()
+    return index
+
+
+def search(username: str, query: str, limit: int = DEFAULT_LIMIT, fuzzy: bool = True) -> list:
+    return get_index(username).search(query, max(1, min(limit, MAX_LIMIT)), fuzzy)
+
+
+def _on_store(username: str, app_name: str, payload: dict) -> None:
+    # Runs under the storage write lock, so it never waits for a build: users
+    # whose index is being built get the write queued, others whose index
+    # does not exist yet are built from disk on their first query anyway.
+    update = (app_name, payload.get('app_username', ''), time.time())
+    with _indexes_lock:
+        index: Optional[UserIndex] = _indexes.get(username)
+        if index is None and username in _building:
+            _building[username][1].append(update)
+    if index is not None:
+        index.put(*update)
+
+
+def reset() -> None:
+    with _indexes_lock:
+        _indexes.clear()
+
+
+storage.add_listener(_on_store)
@@ -1,12 +1,28 @@
 import os
 import json
-from cryptography.fernet import Fernet
+import threading
+import time
+from cryptography.fernet import Fernet, MultiFernet
 
 STATE_DIR = 'server_state'
 SESSIONS_DIR = os.path.join(STATE_DIR, 'sessions')
 MASTER_KEY_FILE = os.path.join(STATE_DIR, 'master.key')
+# Previous master key, kept only while a rotation is re-encrypting sessions.
+PREVIOUS_KEY_FILE = os.path.join(STATE_DIR, 'master.key.old')
+# Seconds between checks of the key files. A rotation run by another worker
+# process is picked up within this interval.
+KEY_CHECK_INTERVAL = 1.0
 
-os.makedirs(SESSIONS_DIR, exist_ok=True)
+
+def _write_key_file(path: str, key: bytes) -> None:
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(key)
+    try:
+        os.chmod(tmp, 0o600)
+    except Exception:
+        pass
+    os.replace(tmp, path)
 
 
 def _load_master_key() -> bytes:
@@ -21,23 +37,152 @@ def _load_master_key() -> bytes:
 
     # Generate and persist a new key (restrict permissions)
     key = Fernet.generate_key()
-    with open(MASTER_KEY_FILE, 'wb') as f:
-        f.write(key)
+    _write_key_file(MASTER_KEY_FILE, key)
+    return key
+
+
+def _load_previous_key():
+    env_key = os.environ.get('MASTER_KEY_PREVIOUS')
+    if env_key:
+        return env_key.encode('utf-8')
+    if os.path.exists(PREVIOUS_KEY_FILE):
+        with open(PREVIOUS_KEY_FILE, 'rb') as f:
+            return f.read().strip()
+    return None
+
+
+def _build_fernets() -> list:
+    # The first key encrypts; every key is tried for decryption, which gives
+    # dual-key reads for the duration of a rotation.
+    keys = [_load_master_key()]
+    previous = _load_previous_key()
+    if previous and previous != keys[0]:
+        keys.append(previous)
+    return [Fernet(k) for k in keys]
+
+
+def _key_files_stamp() -> tuple:
+    stamp = []
+    for path in (MASTER_KEY_FILE, PREVIOUS_KEY_FILE):
+        try:
+            st = os.stat(path)
+            stamp.append((st.st_ino, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+def _reload_keys() -> None:
+    global _fernets, _fernet, _key_stamp, _keys_checked
+    # stamped before reading, so a change made meanwhile is seen next check
+    _key_stamp = _key_files_stamp()
+    _keys_checked = time.monotonic()
+    _fernets = _build_fernets()
+    _fernet = MultiFernet(_fernets)
+
+
+# Keys are loaded on first use (or by an explicit `init()`), not at import
+# time, so importing this module never touches the filesystem.
+_fernets = []
+_fernet = None
+_key_stamp = None
+_keys_checked = 0.0
+_init_lock = threading.Lock()
+
+
+def init() -> None:
+    """Create the session directory and load the master key(s). Idempotent."""
+    with _init_lock:
+        if _fernet is None:
+            os.makedirs(SESSIONS_DIR, exist_ok=True)
+            _reload_keys()
+
+
+def _get_fernet() -> MultiFernet:
+    global _keys_checked
+    if _fernet is None:
+        init()
+    elif time.monotonic() - _keys_checked >= KEY_CHECK_INTERVAL:
+        # picks up key files rewritten by a rotation in another worker process
+        with _init_lock:
+            if _key_files_stamp() != _key_stamp:
+                _reload_keys()
+            else:
+                _keys_checked = time.monotonic()
+    return _fernet
+
+
+def rotating() -> bool:
+    """True while a previous master key is still accepted for reads."""
+    _get_fernet()
+    return len(_fernets) > 1
+
+
+def rotate_master_key() -> None:
+    """Install a fresh master key and keep the current one readable.
+
+    Existing sessions keep working through dual-key reads until
+    `reencrypt_session_file` has rewritten them and `retire_previous_key` is
+    called. Keys supplied through the environment cannot be rotated here.
+    """
+    if os.environ.get('MASTER_KEY'):
+        raise RuntimeError('MASTER_KEY is set in the environment; rotate it there '
+                           'and pass the old value as MASTER_KEY_PREVIOUS')
+    if rotating():
+        raise RuntimeError('A master key rotation is already in progress')
+    current = _load_master_key()
+    _write_key_file(PREVIOUS_KEY_FILE, current)
+    _write_key_file(MASTER_KEY_FILE, Fernet.generate_key())
+    _reload_keys()
+
+
+def retire_previous_key() -> None:
+    """Drop the previous master key once no session depends on it."""
     try:
-        os.chmod(MASTER_KEY_FILE, 0o600)
-    except Exception:
+        os.remove(PREVIOUS_KEY_FILE)
+    except FileNotFoundError:
         pass
-    return key
+    _reload_keys()
+
 
+def reencrypt_session_file(filename: str) -> bool:
+    """Rewrite one session file under the current master key.
 
-_MASTER_KEY = _load_master_key()
-_fernet = Fernet(_MASTER_KEY)
+    Returns False when the session vanished or is already current.
+    """
+    try:
+        with open(filename, 'r') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return False
+    enc = data.get('encrypted_password')
+    if not enc or _is_current(enc.encode('utf-8')):
+        return False
+    data['encrypted_password'] = _get_fernet().rotate(enc.encode('utf-8')).decode('utf-8')
+    tmp = filename + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    if not os.path.exists(filename):
+        # logged out while we were working
+        os.remove(tmp)
+        return False
+    os.replace(tmp, filename)
+    return True
+
+
+def _is_current(token: bytes) -> bool:
+    _get_fernet()
+    try:
+        _fernets[0].decrypt(token)
+        return True
+    except Exception:
+        return False
 
 
 def save_session_credentials(session_id: str, username: str, password: str) -> None:
     # Ensure sessions dir exists for current working directory
     os.makedirs(SESSIONS_DIR, exist_ok=True)
-    enc = _fernet.encrypt(password.encode('utf-8')).decode('utf-8')
+    enc = _get_fernet().encrypt(password.encode('utf-8')).decode('utf-8')
     data = {'username': username, 'encrypted_password': enc}
     filename = os.path.join(SESSIONS_DIR, session_id + '.json')
     with open(filename, 'w') as f:
@@ -52,7 +197,7 @@ def get_session_password(session_id: str):
         data = json.load(f)
     enc = data.get('encrypted_password')
     try:
-        return _fernet.decrypt(enc.encode('utf-8')).decode('utf-8')
+        return _get_fernet().decrypt(enc.encode('utf-8')).decode('utf-8')
     except Exception:
         return None
 
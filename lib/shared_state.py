@@ -0,0 +1,379 @@
+import argparse
+import contextlib
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Iterator, Optional
+
+# Cross-process shared state for multi-process deployments.
+#
+# A fixed-size hash table in an mmap'd file: every worker process maps the
+# same file, so a value one process publishes (the hotspot snapshot, auth
+# rate-limit buckets) is visible to all of them without IPC. Lookups are
+# plain memory reads guarded by a per-slot seqlock: a writer makes the slot's
+# sequence number odd, writes, then makes it even again, and a reader retries
+# until it has copied the slot under the same even sequence number. Writers
+# serialise on flock() over the file plus a thread lock.
+#
+# Deleted and expired entries leave tombstones that linear probing has to step
+# over. The header counts slots that are not EMPTY; when an insert would push
+# that past MAX_LOAD of the table, the writer compacts: it rewrites the table
+# with only the live entries, turning every tombstone back into EMPTY. If the
+# live entries alone fill MAX_LOAD, the insert raises SharedTableFull. Probe
+# sequences therefore stay short. Compaction moves entries, so it bumps the
+# header's generation (odd while in progress), and a lookup that missed while
+# the generation changed is repeated.
+#
+# Decrypted session credentials are deliberately never stored here: anything
+# that can map the file could read them.
+#
+# Enabled by the SHARED_STATE environment variable: '1' uses the default file
+# under server_state/, any other value is taken as the file path.
+
+STATE_DIR = 'server_state'
+DEFAULT_PATH = os.path.join(STATE_DIR, 'shared_state.tbl')
+DEFAULT_SLOTS = 4096
+DEFAULT_SLOT_SIZE = 256
+
+MAX_LOAD = 0.75             # share of slots that may be in use (live or tombstone)
+FULL_RECHECK = 1.0          # seconds a full table is not compacted again by this process
+
+MAGIC = b'SST2'
+_OLD_MAGICS = (b'SST1',)
+# magic, slots, slot size, generation, slots not EMPTY
+_HEADER = struct.Struct('<4sIIII')
+_GENERATION_OFFSET = 12
+_IN_USE_OFFSET = 16
+# seq, state, key length, value length, key hash, expires (time.time(), 0 = never)
+_SLOT = struct.Struct('<IBxHHxxQd')
+_SEQ = struct.Struct('<I')
+# the slot header after seq; packed separately because pack_into() zero-fills
+# its target first, which would briefly make the seq look even
+_FIELDS = struct.Struct('<BxHHxxQd')
+_EMPTY, _USED, _DELETED = 0, 1, 2
+_SPINS_BEFORE_YIELD = 100
+
+
+class SharedTableFull(Exception):
+    """Raised when a new key would take the table past MAX_LOAD live entries."""
+
+
+def _hash(key: bytes) -> int:
+    # hash() is randomised per process, so it cannot index a shared table
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+
+class SharedTable:
+    def __init__(self, path: str = DEFAULT_PATH, slots: int = DEFAULT_SLOTS,
+                 slot_size: int = DEFAULT_SLOT_SIZE):
+        if slot_size <= _SLOT.size:
+            raise ValueError('slot_size too small')
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        with self._file_lock():
+            size = os.fstat(self._fd).st_size
+            header = os.pread(self._fd, _HEADER.size, 0)
+            if size and header[:4] not in _OLD_MAGICS:
+                if size < _HEADER.size:
+                    raise ValueError(f'{path} is not a shared state table')
+                magic, slots, slot_size, _, _ = _HEADER.unpack(header)
+                if magic != MAGIC or size != _HEADER.size + slots * slot_size:
+                    raise ValueError(f'{path} is not a shared state table')
+                # an existing table keeps its geometry
+            else:
+                # new, or an older layout: the contents are caches every worker
+                # republishes, so the file is simply recreated
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, _HEADER.size + slots * slot_size)
+                os.pwrite(self._fd, _HEADER.pack(MAGIC, slots, slot_size, 0, 0), 0)
+        self.slots = slots
+        self.slot_size = slot_size
+        self.capacity = slot_size - _SLOT.size
+        self.max_in_use = int(slots * MAX_LOAD)
+        self._full_until = 0.0
+        self._mm = mmap.mmap(self._fd, _HEADER.size + slots * slot_size)
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    @contextlib.contextmanager
+    def lock(self):
+        """Hold the table's write lock across several reads and writes (reentrant)."""
+        with self._thread_lock:
+            if self._depth:
+                self._depth += 1
+                try:
+                    yield
+                finally:
+                    self._depth -= 1
+                return
+            with self._file_lock():
+                self._depth = 1
+                try:
+                    yield
+                finally:
+                    self._depth = 0
+
+    def close(self) -> None:
+        self._mm.close()
+        os.close(self._fd)
+
+    # -- header ------------------------------------------------------------
+    def _generation(self) -> int:
+        return _SEQ.unpack_from(self._mm, _GENERATION_OFFSET)[0]
+
+    def _stable_generation(self) -> int:
+        """The generation once no compaction is in progress."""
+        spins = 0
+        while True:
+            generation = self._generation()
+            if not generation & 1:
+                return generation
+            spins += 1
+            if spins % _SPINS_BEFORE_YIELD == 0:
+                time.sleep(0)
+
+    def _set_generation(self, generation: int) -> None:
+        self._mm[_GENERATION_OFFSET:_GENERATION_OFFSET + _SEQ.size] = _SEQ.pack(generation & 0xFFFFFFFF)
+
+    def _in_use(self) -> int:
+        return _SEQ.unpack_from(self._mm, _IN_USE_OFFSET)[0]
+
+    def _set_in_use(self, count: int) -> None:
+        self._mm[_IN_USE_OFFSET:_IN_USE_OFFSET + _SEQ.size] = _SEQ.pack(count)
+
+    # -- slots -------------------------------------------------------------
+    def _offset(self, index: int) -> int:
+        return _HEADER.size + index * self.slot_size
+
+    def _read_slot(self, index: int) -> bytes:
+        """Consistent copy of one slot (seqlock read)."""
+        offset = self._offset(index)
+        spins = 0
+        while True:
+            seq = _SEQ.unpack_from(self._mm, offset)[0]
+            if not seq & 1:
+                raw = self._mm[offset:offset + self.slot_size]
+                if _SEQ.unpack_from(self._mm, offset)[0] == seq and _SEQ.unpack_from(raw)[0] == seq:
+                    return raw
+            spins += 1
+            if spins % _SPINS_BEFORE_YIELD == 0:
+                time.sleep(0)
+
+    def _write_slot(self, index: int, state: int, key: bytes, value: bytes, h: int, expires: float) -> None:
+        offset = self._offset(index)
+        seq = _SEQ.unpack_from(self._mm, offset)[0]
+        # seq is stored with one 4-byte copy (pack_into would zero it first)
+        self._mm[offset:offset + _SEQ.size] = _SEQ.pack(seq + 1)   # odd: readers retry
+        self._mm[offset + _SLOT.size:offset + _SLOT.size + len(key) + len(value)] = key + value
+        _FIELDS.pack_into(self._mm, offset + _SEQ.size, state, len(key), len(value), h, expires)
+        self._mm[offset:offset + _SEQ.size] = _SEQ.pack((seq + 2) & 0xFFFFFFFE)
+
+    def _probe(self, h: int) -> Iterator[int]:
+        start = h % self.slots
+        for i in range(self.slots):
+            yield (start + i) % self.slots
+
+    def _find(self, key: bytes, h: int) -> tuple[Optional[int], Optional[bytes]]:
+        """(slot index, raw slot) holding `key`, or (None, None)."""
+        for index in self._probe(h):
+            raw = self._read_slot(index)
+            _, state, key_len, _, slot_hash, _ = _SLOT.unpack_from(raw)
+            if state == _EMPTY:
+                return None, None
+            if state == _USED and slot_hash == h and raw[_SLOT.size:_SLOT.size + key_len] == key:
+                return index, raw
+        return None, None
+
+    def _compact(self, now: float) -> int:
+        """Rewrite the table with only its live entries; returns how many there are.
+
+        Called with the lock held.
+        """
+        live = []
+        for index in range(self.slots):
+            raw = self._read_slot(index)
+            _, state, key_len, value_len, h, expires = _SLOT.unpack_from(raw)
+            if state == _USED and not (expires and expires <= now):
+                body = raw[_SLOT.size:_SLOT.size + key_len + value_len]
+                live.append((body[:key_len], body[key_len:], h, expires))
+        generation = self._generation()
+        self._set_generation(generation + 1)       # odd: lookups that miss retry
+        for index in range(self.slots):
+            self._write_slot(index, _EMPTY, b'', b'', 0, 0.0)
+        for key, value, h, expires in live:
+            for index in self._probe(h):
+                if _SLOT.unpack_from(self._read_slot(index))[1] == _EMPTY:
+                    self._write_slot(index, _USED, key, value, h, expires)
+                    break
+        self._set_in_use(len(live))
+        self._set_generation(generation + 2)
+        return len(live)
+
+    # -- API ---------------------------------------------------------------
+    def get(self, key: str, default=None):
+        """Value stored under `key`, or `default` if absent or expired. Lock-free."""
+        k = key.encode('utf-8')
+        h = _hash(k)
+        now = time.time()
+        while True:
+            generation = self._stable_generation()
+            index, raw = self._find(k, h)
+            # a hit is always valid; a miss might have raced a compaction
+            if raw is not None or self._generation() == generation:
+                break
+        if raw is None:
+            return default
+        _, _, key_len, value_len, _, expires = _SLOT.unpack_from(raw)
+        if expires and expires <= now:
+            return default
+        return json.loads(raw[_SLOT.size + key_len:_SLOT.size + key_len + value_len])
+
+    def set(self, key: str, value, ttl: Optional[float] = None) -> None:
+        """Store a JSON-serialisable value, optionally expiring after `ttl` seconds."""
+        k = key.encode('utf-8')
+        v = json.dumps(value, separators=(',', ':')).encode('utf-8')
+        if len(k) + len(v) > self.capacity:
+            raise ValueError(f'Entry for {key!r} exceeds {self.capacity} bytes')
+        h = _hash(k)
+        with self.lock():
+            now = time.time()
+            index, state = self._slot_for(k, h, now)
+            if state == _EMPTY and self._in_use() >= self.max_in_use:
+                # Taking an EMPTY slot would pass the load limit: reclaim
+                # tombstones and expired entries first, unless this process
+                # found nothing to reclaim a moment ago.
+                if now < self._full_until or self._compact(now) >= self.max_in_use:
+                    self._full_until = max(self._full_until, now + FULL_RECHECK)
+                    raise SharedTableFull(f'No free slot for {key!r}')
+                index, state = self._slot_for(k, h, now)
+            if index is None:
+                raise SharedTableFull(f'No free slot for {key!r}')
+            if state == _EMPTY:
+                self._set_in_use(self._in_use() + 1)
+            self._write_slot(index, _USED, k, v, h, now + ttl if ttl else 0.0)
+
+    def _slot_for(self, k: bytes, h: int, now: float) -> tuple[Optional[int], Optional[int]]:
+        """(slot index, its state) where `k` should be written: its own slot,
+        else the first tombstone or expired slot on its probe sequence, else
+        the EMPTY slot that ends the sequence."""
+        free = None
+        for index in self._probe(h):
+            raw = self._read_slot(index)
+            _, state, key_len, _, slot_hash, expires = _SLOT.unpack_from(raw)
+            if state == _USED and slot_hash == h and raw[_SLOT.size:_SLOT.size + key_len] == k:
+                return index, _USED
+            if free is None and (state == _DELETED or (state == _USED and expires and expires <= now)):
+                free = index
+            if state == _EMPTY:
+                return (free, _DELETED) if free is not None else (index, _EMPTY)
+        return free, (None if free is None else _DELETED)
+
+    def delete(self, key: str) -> bool:
+        k = key.encode('utf-8')
+        h = _hash(k)
+        with self.lock():
+            index, _ = self._find(k, h)
+            if index is None:
+                return False
+            self._write_slot(index, _DELETED, b'', b'', 0, 0.0)
+            self._full_until = 0.0
+            return True
+
+    def items(self, prefix: str = '') -> list:
+        """Live (key, value) pairs, optionally limited to keys starting with `prefix`."""
+        while True:
+            generation = self._stable_generation()
+            out = self._items(prefix)
+            if self._generation() == generation:
+                return out
+
+    def _items(self, prefix: str) -> list:
+        now = time.time()
+        out = []
+        for index in range(self.slots):
+            raw = self._read_slot(index)
+            _, state, key_len, value_len, _, expires = _SLOT.unpack_from(raw)
+            if state != _USED or (expires and expires <= now):
+                continue
+            key = raw[_SLOT.size:_SLOT.size + key_len].decode('utf-8')
+            if key.startswith(prefix):
+                out.append((key, json.loads(raw[_SLOT.size + key_len:_SLOT.size + key_len + value_len])))
+        return out
+
+    def clear(self) -> None:
+        with self.lock():
+            generation = self._generation()
+            self._set_generation(generation + 1)
+            for index in range(self.slots):
+                self._write_slot(index, _EMPTY, b'', b'', 0, 0.0)
+            self._set_in_use(0)
+            self._set_generation(generation + 2)
+            self._full_until = 0.0
+
+
+def enabled() -> bool:
+    return os.environ.get('SHARED_STATE', '') not in ('', '0')
+
+
+_table: Optional[SharedTable] = None
+_table_pid: Optional[int] = None
+_table_lock = threading.Lock()
+
+
+def table() -> Optional[SharedTable]:
+    """The process's handle on the shared table, or None when SHARED_STATE is unset."""
+    global _table, _table_pid
+    if not enabled():
+        return None
+    setting = os.environ['SHARED_STATE']
+    with _table_lock:
+        # flock() is shared across fork(), so a forked worker opens its own handle
+        if _table is None or _table_pid != os.getpid():
+            _table = SharedTable(DEFAULT_PATH if setting == '1' else setting)
+            _table_pid = os.getpid()
+        return _table
+
+
+def refresh(interval: Optional[float] = None) -> None:
+    """Publish the network snapshot now, and every `interval` seconds if given."""
+    from lib import network
+    while True:
+        network.refresh_snapshot()
+        network.publish_peers(max(network.PEERS_TTL, 2 * (interval or 0)))
+        if not interval:
+            return
+        time.sleep(interval)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Inspect or refresh the shared state table')
+    parser.add_argument('--path', default=DEFAULT_PATH)
+    parser.add_argument('--refresh', type=float, metavar='SECONDS',
+                        help='keep publishing the network snapshot at this interval')
+    parser.add_argument('--prefix', default='', help='only list keys with this prefix')
+    args = parser.parse_args(argv)
+    os.environ['SHARED_STATE'] = args.path
+    if args.refresh:
+        refresh(args.refresh)
+        return 0
+    for key, value in table().items(args.prefix):
+        print(f"{key}\t{json.dumps(value)}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,231 @@
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import zlib
+from typing import Iterator, Optional
+
+# Incremental, deduplicated snapshots of db/ and server_state/.
+#
+# Repository layout (under backups/repo by default):
+#   packs/<snapshot>.pack   zlib-compressed chunks appended by one snapshot
+#   index.json              chunk hash -> [pack, offset, length]
+#   filecache.json          path -> [mtime_ns, size, chunks] from the last run
+#   snapshots/<id>.json     manifest: path -> {size, mtime, chunks}
+#
+# A file whose mtime and size match the cache is not even read; changed files
+# are split into fixed-size chunks and only chunks missing from the index are
+# compressed into the new pack. Restores seek straight to the chunks of the
+# requested files, so one user or app can be restored without reading the
+# rest of the repository.
+
+REPO_DIR = os.path.join('backups', 'repo')
+SOURCES = ('db', 'server_state')
+CHUNK_SIZE = 1024 * 1024
+
+
+class SnapshotError(Exception):
+    """Raised for a missing snapshot or a damaged repository."""
+
+
+def _write_json(path: str, data) -> None:
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _read_json(path: str, default):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+class Repository:
+    def __init__(self, path: str = REPO_DIR):
+        self.path = path
+        self.packs_dir = os.path.join(path, 'packs')
+        self.snapshots_dir = os.path.join(path, 'snapshots')
+        self.index_file = os.path.join(path, 'index.json')
+        self.filecache_file = os.path.join(path, 'filecache.json')
+
+    def _init(self) -> None:
+        os.makedirs(self.packs_dir, exist_ok=True)
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+
+    # -- writing ---------------------------------------------------------
+    def _walk(self, sources) -> Iterator[str]:
+        for root in sources:
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    if name.endswith('.tmp'):
+                        continue
+                    yield os.path.join(dirpath, name)
+
+    def create(self, sources=SOURCES) -> dict:
+        """Take a snapshot and return its manifest (plus `stats`)."""
+        self._init()
+        index = _read_json(self.index_file, {})
+        filecache = _read_json(self.filecache_file, {})
+        snap_id = datetime.datetime.now().strftime('%Y%m%d-%H%M%S-') + os.urandom(3).hex()
+        pack_name = snap_id + '.pack'
+        pack_path = os.path.join(self.packs_dir, pack_name)
+        files = {}
+        new_cache = {}
+        stats = {'files': 0, 'unchanged': 0, 'hashed': 0, 'new_chunks': 0, 'bytes_written': 0}
+
+        with open(pack_path, 'wb') as pack:
+            for path in self._walk(sources):
+                rel = path.replace(os.sep, '/')
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                stats['files'] += 1
+                cached = filecache.get(rel)
+                if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size \
+                        and all(h in index for h in cached[2]):
+                    chunks = cached[2]
+                    stats['unchanged'] += 1
+                else:
+                    chunks = []
+                    stats['hashed'] += 1
+                    with open(path, 'rb') as f:
+                        while True:
+                            data = f.read(CHUNK_SIZE)
+                            if not data and chunks:
+                                break
+                            digest = hashlib.sha256(data).hexdigest()
+                            chunks.append(digest)
+                            if digest not in index:
+                                compressed = zlib.compress(data)
+                                index[digest] = [pack_name, pack.tell(), len(compressed)]
+                                pack.write(compressed)
+                                stats['new_chunks'] += 1
+                                stats['bytes_written'] += len(compressed)
+                            if not data:
+                                break
+                new_cache[rel] = [st.st_mtime_ns, st.st_size, chunks]
+                files[rel] = {'size': st.st_size, 'mtime': st.st_mtime, 'chunks': chunks}
+            pack.flush()
+            os.fsync(pack.fileno())
+
+        if stats['new_chunks'] == 0:
+            os.remove(pack_path)
+        # Pack first, then index, then manifest: a crash leaves at most an
+        # unreferenced pack behind, never a manifest pointing at missing data.
+        _write_json(self.index_file, index)
+        _write_json(self.filecache_file, new_cache)
+        manifest = {'id': snap_id, 'created': datetime.datetime.now().isoformat(timespec='seconds'),
+                    'sources': list(sources), 'files': files}
+        _write_json(os.path.join(self.snapshots_dir, snap_id + '.json'), manifest)
+        manifest['stats'] = stats
+        return manifest
+
+    # -- reading ---------------------------------------------------------
+    def list(self) -> list:
+        if not os.path.isdir(self.snapshots_dir):
+            return []
+        return sorted(name[:-len('.json')] for name in os.listdir(self.snapshots_dir)
+                      if name.endswith('.json'))
+
+    def manifest(self, snap_id: str) -> dict:
+        data = _read_json(os.path.join(self.snapshots_dir, snap_id + '.json'), None)
+        if data is None:
+            raise SnapshotError(f'No such snapshot: {snap_id}')
+        return data
+
+    def iter_file(self, chunks: list, index: dict) -> Iterator[bytes]:
+        """Yield the decompressed chunks of one file, one chunk in memory at a time."""
+        handles = {}
+        try:
+            for digest in chunks:
+                if digest not in index:
+                    raise SnapshotError(f'Missing chunk {digest}')
+                pack_name, offset, length = index[digest]
+                f = handles.get(pack_name)
+                if f is None:
+                    f = handles[pack_name] = open(os.path.join(self.packs_dir, pack_name), 'rb')
+                f.seek(offset)
+                data = zlib.decompress(f.read(length))
+                if hashlib.sha256(data).hexdigest() != digest:
+                    raise SnapshotError(f'Corrupt chunk {digest}')
+                yield data
+        finally:
+            for f in handles.values():
+                f.close()
+
+    def restore(self, snap_id: str, target: str = '.', prefix: Optional[str] = None) -> list:
+        """Restore files from a snapshot under `target`.
+
+        `prefix` limits the restore to one subtree, e.g. 'db/alice/' for a
+        user or 'db/alice/gmail/' for one app. Returns the restored paths.
+        """
+        manifest = self.manifest(snap_id)
+        index = _read_json(self.index_file, {})
+        restored = []
+        for rel, entry in manifest['files'].items():
+            if prefix and not rel.startswith(prefix):
+                continue
+            dest = os.path.join(target, *rel.split('/'))
+            os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+            tmp = dest + '.tmp'
+            with open(tmp, 'wb') as out:
+                for data in self.iter_file(entry['chunks'], index):
+                    out.write(data)
+            os.replace(tmp, dest)
+            os.utime(dest, (entry['mtime'], entry['mtime']))
+            restored.append(dest)
+        return restored
+
+
+def restore_prefix(username: Optional[str] = None, app_name: Optional[str] = None) -> Optional[str]:
+    if app_name and not username:
+        raise SnapshotError('Restoring an app requires a username')
+    if username and app_name:
+        return f'db/{username}/{app_name}/'
+    if username:
+        return f'db/{username}/'
+    return None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Incremental snapshots of db/ and server_state/')
+    parser.add_argument('--repo', default=REPO_DIR, help='snapshot repository directory')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('create', help='take a new snapshot')
+    sub.add_parser('list', help='list snapshots')
+    p_restore = sub.add_parser('restore', help='restore a snapshot')
+    p_restore.add_argument('snapshot')
+    p_restore.add_argument('--user')
+    p_restore.add_argument('--app')
+    p_restore.add_argument('--target', default='.', help='directory to restore into')
+    args = parser.parse_args(argv)
+
+    repo = Repository(args.repo)
+    try:
+        if args.command == 'create':
+            manifest = repo.create()
+            stats = manifest['stats']
+            print(f"Snapshot {manifest['id']}: {stats['files']} files, {stats['unchanged']} unchanged, "
+                  f"{stats['new_chunks']} new chunks ({stats['bytes_written']} bytes)")
+        elif args.command == 'list':
+            for snap_id in repo.list():
+                print(snap_id)
+        else:
+            paths = repo.restore(args.snapshot, args.target, restore_prefix(args.user, args.app))
+            print(f"Restored {len(paths)} files into {args.target}")
+    except SnapshotError as e:
+        print(f"Error: {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
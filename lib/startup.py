@@ -0,0 +1,200 @@
+import argparse
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable, Optional
+
+# Start-up instrumentation and optional cache warm-up.
+#
+# `phase()` records how long each start-up step took and the resident set
+# size after it. `import_profile()` runs `python -X importtime` on a module in
+# a fresh interpreter and returns the slowest imports, so cold-start cost can
+# be checked without external tools. `warm_up()` runs registered warmers on a
+# background thread once the server port accepts connections, so the first
+# real requests do not pay for cold caches.
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATIC_DIR = os.path.join(PROJECT_DIR, 'static')
+DB_DIR = 'db'
+PORT_WAIT_TIMEOUT = 30.0
+
+_phases: list = []
+_warmers: list = []
+warmup_status: dict = {'state': 'idle', 'results': []}
+
+
+def rss_kb() -> Optional[int]:
+    """Current resident set size in KiB (peak RSS where /proc is unavailable)."""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except Exception:
+        return None
+
+
+@contextlib.contextmanager
+def phase(name: str):
+    """Time a start-up step and record RSS after it."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases.append({'name': name, 'seconds': round(time.perf_counter() - started, 4), 'rss_kb': rss_kb()})
+
+
+def phases() -> list:
+    return list(_phases)
+
+
+def import_profile(module: str = 'web_server', top: int = 15) -> dict:
+    """Import `module` in a fresh interpreter under -X importtime.
+
+    Returns the total import time, the child's RSS after the import and the
+    `top` slowest imports by cumulative time.
+    """
+    code = f"import {module}; from lib import startup; print(startup.rss_kb())"
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=PROJECT_DIR,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'import failed')
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = [part.strip() for part in line.split(':', 1)[1].split('|')]
+            entries.append({'module': name, 'self_us': int(self_us), 'cumulative_us': int(cumulative_us)})
+        except ValueError:
+            continue
+    total = next((e['cumulative_us'] for e in entries if e['module'] == module), None)
+    entries.sort(key=lambda e: e['cumulative_us'], reverse=True)
+    rss = proc.stdout.strip().splitlines()[-1] if proc.stdout.strip() else ''
+    return {'module': module, 'total_us': total, 'rss_kb': int(rss) if rss.isdigit() else None,
+            'slowest': entries[:top]}
+
+
+def register_warmer(name: str, fn: Callable[[], object]) -> None:
+    _warmers.append((name, fn))
+
+
+def _warm_session_store() -> None:
+    from lib import session_store
+    session_store.init()
+
+
+def _warm_network() -> None:
+    from lib import network
+    network.refresh_snapshot()
+
+
+def _warm_user_index() -> int:
+    # Walk db/ once so directory entries and secret.json inodes are cached.
+    count = 0
+    if not os.path.isdir(DB_DIR):
+        return count
+    for user in os.scandir(DB_DIR):
+        if not user.is_dir():
+            continue
+        for app_entry in os.scandir(user.path):
+            if app_entry.is_dir():
+                try:
+                    os.stat(os.path.join(app_entry.path, 'secret.json'))
+                    count += 1
+                except FileNotFoundError:
+                    pass
+    return count
+
+
+def _warm_static() -> int:
+    # Read the static shell once so it is in the page cache.
+    size = 0
+    for name in os.listdir(STATIC_DIR):
+        path = os.path.join(STATIC_DIR, name)
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                size += len(f.read())
+    return size
+
+
+register_warmer('session_store', _warm_session_store)
+register_warmer('network', _warm_network)
+register_warmer('user_index', _warm_user_index)
+register_warmer('static', _warm_static)
+
+
+def _wait_for_port(host: str, port: int, timeout: float) -> bool:
+    if host in ('0.0.0.0', '::', ''):
+        host = '127.0.0.1'
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=0.5).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def run_warmers() -> list:
+    results = []
+    for name, fn in _warmers:
+        started = time.perf_counter()
+        try:
+            value = fn()
+            error = None
+        except Exception as e:
+            value, error = None, str(e)
+        results.append({'name': name, 'seconds': round(time.perf_counter() - started, 4),
+                        'result': value, 'error': error})
+    return results
+
+
+def warm_up(host: str = '127.0.0.1', port: Optional[int] = None,
+            timeout: float = PORT_WAIT_TIMEOUT) -> threading.Thread:
+    """Run the warmers in the background, after `port` accepts connections if given."""
+    def _run():
+        warmup_status['state'] = 'waiting'
+        if port is not None and not _wait_for_port(host, port, timeout):
+            warmup_status['state'] = 'port-timeout'
+            return
+        warmup_status['state'] = 'running'
+        with phase('warm-up'):
+            warmup_status['results'] = run_warmers()
+        warmup_status['state'] = 'done'
+
+    thread = threading.Thread(target=_run, name='warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
+def report() -> dict:
+    return {'rss_kb': rss_kb(), 'phases': phases(), 'warm_up': warmup_status}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Report import time and memory of a module')
+    parser.add_argument('--module', default='web_server')
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args(argv)
+    profile = import_profile(args.module, args.top)
+    total_ms = (profile['total_us'] or 0) / 1000
+    print(f"import {profile['module']}: {total_ms:.1f} ms, RSS {profile['rss_kb']} KiB")
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    for e in profile['slowest']:
+        print(f"{e['cumulative_us'] / 1000:>14.1f} {e['self_us'] / 1000:>8.1f}  {e['module']}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,17 +1,96 @@
 import os
 import json
+import time
 from typing import Optional, Tuple
 
+from lib.locks import KeyedLocks
+
 DB_DIR = 'db'
+# Per-user record of the app names seen by the last scan and of apps that have
+# since disappeared, so clients syncing by delta learn about removals too.
+TOMBSTONES_FILE = 'tombstones.json'
+
+# One lock per (user, app): writes to the same secret are serialized, writes
+# to different secrets run in parallel.
+_locks = KeyedLocks()
+
+# Callables notified after every successful write as
+# fn(username, app_name, payload). Used to keep in-memory views (such as the
+# search index) current without rescanning db/. They run under the secret's
+# write lock and must be cheap.
+_listeners: list = []
+
+
+def add_listener(fn) -> None:
+    if fn not in _listeners:
+        _listeners.append(fn)
+
+
+def _notify(username: str, app_name: str, payload: dict) -> None:
+    for fn in list(_listeners):
+        try:
+            fn(username, app_name, payload)
+        except Exception as e:
+            print(f"Warning: storage listener {getattr(fn, '__name__', fn)} failed: {e}")
+
+
+class VersionConflict(Exception):
+    """Raised when a write's expected version does not match the stored one."""
+
+    def __init__(self, current: int):
+        super().__init__(f"Version conflict: stored version is {current}")
+        self.current = current
+
+
+def lock(username: str, app_name: str):
+    """Context manager holding the write lock for one secret."""
+    return _locks.hold((username, app_name))
 
 
-def store_payload(username: str, app_name: str, user_password: str, payload: dict) -> str:
+def payload_version(payload: dict) -> int:
+    """Version of a stored payload; payloads written before versioning are 0."""
+    try:
+        return int(payload.get('version', 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def current_version(username: str, app_name: str) -> Optional[int]:
+    """Stored version of a secret, or None if it does not exist."""
+    result = retrieve_latest_payload(username, app_name, None)
+    if result is None:
+        return None
+    try:
+        return payload_version(json.loads(result[0]))
+    except ValueError:
+        return 0
+
+
+def store_payload(username: str, app_name: str, user_password: str, payload: dict,
+                  expected_version: Optional[int] = None, version: Optional[int] = None) -> str:
+    """Write a secret's payload atomically and stamp it with a version.
+
+    `expected_version` makes the write conditional: it must equal the stored
+    version (-1 meaning "must not exist yet"), otherwise VersionConflict is
+    raised. The new version is the stored one plus one unless `version` is
+    given explicitly (sync keeps the version of the copy it imports).
+    """
     # simple file-based storage
     app_dir = os.path.join(DB_DIR, username, app_name)
-    os.makedirs(app_dir, exist_ok=True)
     filename = os.path.join(app_dir, 'secret.json')
-    with open(filename, 'w') as f:
-        json.dump(payload, f)
+    with lock(username, app_name):
+        current = current_version(username, app_name)
+        if expected_version is not None and expected_version != (-1 if current is None else current):
+            raise VersionConflict(-1 if current is None else current)
+        # only once the write is allowed, so a rejected one leaves no empty app
+        os.makedirs(app_dir, exist_ok=True)
+        payload['version'] = version if version is not None else (current or 0) + 1
+        tmp = filename + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(payload, f)
+        os.replace(tmp, filename)
+        # still under the lock, so listeners see writes to one secret in order
+        _notify(username, app_name, payload)
     return filename
 
 
@@ -22,3 +101,66 @@ def retrieve_latest_payload(username: str, app_name: str, user_password: str) ->
     with open(filename, 'r') as f:
         data = f.read()
     return (data, filename)
+
+
+def changed_since(username: str, since: float = 0.0) -> Tuple[list, list, int]:
+    """Apps whose secret changed at or after `since` (a time.time() value).
+
+    Returns (changes, removed names, total app count). Change detection uses
+    the inode change time rather than the mtime, because sync sets imported
+    files' mtime back to the origin's; `modified` is still reported as the
+    mtime. Only changed payloads are read, for their `app_username` and
+    `version`. An app is reported removed from the first scan that no longer
+    finds it until it is stored again.
+    """
+    user_dir = os.path.join(DB_DIR, username)
+    changes, total, names = [], 0, set()
+    if not os.path.isdir(user_dir):
+        return changes, [], total
+    for item in os.scandir(user_dir):
+        if not item.is_dir():
+            continue
+        filename = os.path.join(item.path, 'secret.json')
+        try:
+            stat = os.stat(filename)
+        except FileNotFoundError:
+            continue
+        total += 1
+        names.add(item.name)
+        if max(stat.st_mtime, stat.st_ctime) < since:
+            continue
+        try:
+            with open(filename, 'r') as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            payload = {}
+        changes.append({'name': item.name, 'modified': stat.st_mtime, 'size': stat.st_size,
+                        'app_username': payload.get('app_username', ''),
+                        'version': payload_version(payload)})
+    removed = _tombstones(username, names)
+    return changes, sorted(name for name, when in removed.items() if when >= since), total
+
+
+def _tombstones(username: str, names: set) -> dict:
+    """Record apps missing from `names` since the last scan; returns name -> removal time."""
+    filename = os.path.join(DB_DIR, username, TOMBSTONES_FILE)
+    # app names are never empty, so this key cannot clash with a secret's lock
+    with lock(username, ''):
+        try:
+            with open(filename, 'r') as f:
+                record = json.load(f)
+            seen, removed = set(record['names']), dict(record['removed'])
+        except (OSError, ValueError, KeyError, TypeError):
+            seen, removed = None, {}
+        if seen == names and not removed.keys() & names:
+            return removed
+        now = time.time()
+        for name in (seen or set()) - names:
+            removed[name] = now
+        for name in names & removed.keys():
+            del removed[name]
+        tmp = filename + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'names': sorted(names), 'removed': removed}, f)
+        os.replace(tmp, filename)
+    return removed
@@ -0,0 +1,259 @@
+import argparse
+import getpass
+import hashlib
+import http.cookiejar
+import ipaddress
+import json
+import math
+import os
+import time
+import urllib.error
+import urllib.request
+from typing import Optional
+from urllib.parse import urlsplit
+
+from lib import jobs, storage
+
+# Delta sync of encrypted payloads between two secret-server instances.
+#
+# Each side summarises a user's app tree as {app: {hash, version, modified}}
+# plus a root hash over the sorted leaves. Equal roots end the exchange after
+# one request; otherwise only apps whose hashes differ are transferred, and the
+# side holding the newer payload (higher `version`, then later mtime, then the
+# larger hash as a tie-break both sides agree on) wins. Payloads are moved as
+# the stored ciphertext JSON, so no passphrase is needed.
+#
+# Hashes are taken over a normalised form of the payload (sorted keys, the
+# version made explicit), because importing rewrites the file: a legacy
+# payload without a version field is stored with "version": 0.
+
+DB_DIR = 'db'
+TIMEOUT = 30
+MAX_CLOCK_SKEW = 24 * 3600      # seconds a peer's mtime may lie in the future
+
+
+class SyncError(Exception):
+    """Raised when a peer cannot be reached or rejects the exchange."""
+
+
+def valid_app_name(app_name: str) -> bool:
+    return bool(app_name) and app_name not in ('.', '..') and '/' not in app_name \
+        and '\\' not in app_name and '\0' not in app_name
+
+
+def _secret_file(username: str, app_name: str) -> str:
+    return os.path.join(DB_DIR, username, app_name, 'secret.json')
+
+
+def _digest(raw: bytes) -> str:
+    try:
+        payload = json.loads(raw)
+    except ValueError:
+        return hashlib.sha256(raw).hexdigest()
+    if isinstance(payload, dict):
+        payload = dict(payload, version=storage.payload_version(payload))
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _leaf(username: str, app_name: str) -> Optional[dict]:
+    filename = _secret_file(username, app_name)
+    try:
+        with open(filename, 'rb') as f:
+            raw = f.read()
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    try:
+        version = storage.payload_version(json.loads(raw))
+    except (ValueError, AttributeError):
+        version = 0
+    return {'hash': _digest(raw), 'version': version, 'modified': stat.st_mtime}
+
+
+def summary(username: str) -> dict:
+    """Hash summary of a user's apps: per-app leaves plus a root over them."""
+    user_dir = os.path.join(DB_DIR, username)
+    apps = {}
+    if os.path.isdir(user_dir):
+        for item in sorted(os.listdir(user_dir)):
+            if os.path.isdir(os.path.join(user_dir, item)):
+                leaf = _leaf(username, item)
+                if leaf is not None:
+                    apps[item] = leaf
+    root = hashlib.sha256(''.join(f"{name}\0{leaf['hash']}\n" for name, leaf in apps.items())
+                          .encode('utf-8')).hexdigest()
+    return {'root': root, 'apps': apps}
+
+
+def _newer(a: dict, b: dict) -> bool:
+    """True if leaf `a` should win over leaf `b`."""
+    return (a.get('version', 0), a['modified'], a['hash']) > (b.get('version', 0), b['modified'], b['hash'])
+
+
+def plan(local: dict, remote: dict) -> tuple[list, list]:
+    """Return (apps to pull from the peer, apps to push to the peer)."""
+    pull, push = [], []
+    if local['root'] == remote['root']:
+        return pull, push
+    for name in sorted(set(local['apps']) | set(remote['apps'])):
+        mine, theirs = local['apps'].get(name), remote['apps'].get(name)
+        if mine and theirs and mine['hash'] == theirs['hash']:
+            continue
+        if theirs is None or (mine is not None and _newer(mine, theirs)):
+            push.append(name)
+        else:
+            pull.append(name)
+    return pull, push
+
+
+def export_payloads(username: str, app_names: list) -> dict:
+    out = {}
+    for name in app_names:
+        if not valid_app_name(name):
+            continue
+        filename = _secret_file(username, name)
+        try:
+            with open(filename, 'r') as f:
+                out[name] = {'payload': f.read(), 'modified': os.stat(filename).st_mtime}
+        except FileNotFoundError:
+            continue
+    return out
+
+
+def _modified(value) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError('modified must be a number')
+    if not math.isfinite(value) or not 0 <= value <= time.time() + MAX_CLOCK_SKEW:
+        raise ValueError('modified is out of range')
+    return float(value)
+
+
+def import_payloads(username: str, payloads: dict) -> list:
+    """Store incoming payloads that are newer than the local copy; return applied app names.
+
+    Every item is validated before anything is written; ValueError (or
+    KeyError/TypeError for a malformed item) means nothing was applied.
+    """
+    incoming_items = []
+    for name, item in payloads.items():
+        if not valid_app_name(name):
+            continue
+        payload = json.loads(item['payload'])
+        if not isinstance(payload, dict) or 'password' not in payload:
+            continue
+        incoming_items.append((name, payload, {
+            'version': storage.payload_version(payload), 'modified': _modified(item['modified']),
+            'hash': _digest(item['payload'].encode('utf-8'))}))
+    applied = []
+    for name, payload, incoming in incoming_items:
+        current = _leaf(username, name)
+        if current is not None and (current['hash'] == incoming['hash'] or not _newer(incoming, current)):
+            continue
+        try:
+            # conditional on the copy we compared against; keeps the peer's version
+            filename = storage.store_payload(username, name, None, payload,
+                                             expected_version=current['version'] if current else -1,
+                                             version=incoming['version'])
+        except storage.VersionConflict:
+            continue
+        # keep the origin's mtime so both sides agree on which copy is newer
+        os.utime(filename, (incoming['modified'], incoming['modified']))
+        applied.append(name)
+    return applied
+
+
+def is_known_peer(peer_url: str) -> bool:
+    """True if `peer_url` names this device or one connected to it.
+
+    A sync run logs in to the peer with the user's password, so the server
+    only runs it against loopback, the hotspot subnet and the neighbour table,
+    and only by IP address, as a name could resolve anywhere.
+    """
+    parts = urlsplit(peer_url)
+    if parts.scheme not in ('http', 'https'):
+        return False
+    try:
+        ip = ipaddress.ip_address(parts.hostname or '')
+    except ValueError:
+        return False
+    if ip.is_loopback:
+        return True
+    from lib import network
+    return network.is_ip_in_hotspot_subnet(str(ip)) or network.is_connected_peer(str(ip))
+
+
+class PeerClient:
+    """Minimal HTTP client for another secret-server instance."""
+
+    def __init__(self, base_url: str, timeout: float = TIMEOUT):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self._opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def _call(self, method: str, path: str, body: Optional[dict] = None) -> dict:
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                     headers={'Content-Type': 'application/json'})
+        try:
+            with self._opener.open(req, timeout=self.timeout) as resp:
+                return json.loads(resp.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read().decode('utf-8')).get('error', e.reason)
+            except ValueError:
+                message = e.reason
+            raise SyncError(f'{path}: {e.code} {message}')
+        except (urllib.error.URLError, OSError) as e:
+            raise SyncError(f'Cannot reach peer {self.base_url}: {e}')
+
+    def login(self, username: str, password: str) -> None:
+        self._call('POST', '/api/auth/login', {'username': username, 'password': password})
+
+    def summary(self) -> dict:
+        return self._call('GET', '/api/sync/summary')
+
+    def pull(self, app_names: list) -> dict:
+        return self._call('POST', '/api/sync/pull', {'apps': app_names})['apps']
+
+    def push(self, payloads: dict) -> list:
+        return self._call('POST', '/api/sync/push', {'apps': payloads})['applied']
+
+
+def sync_with_peer(peer_url: str, username: str, password: str) -> dict:
+    """Two-way delta sync of one user's apps with a peer instance."""
+    peer = PeerClient(peer_url)
+    peer.login(username, password)
+    local = summary(username)
+    remote = peer.summary()
+    pull, push = plan(local, remote)
+    pulled = import_payloads(username, peer.pull(pull)) if pull else []
+    pushed = peer.push(export_payloads(username, push)) if push else []
+    return {'pulled': pulled, 'pushed': pushed, 'in_sync': not pull and not push}
+
+
+def _sync_job(job, peer: str, password: str) -> dict:
+    return sync_with_peer(peer, job.user, password)
+
+
+jobs.register('sync', _sync_job)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Sync a user\'s secrets with another secret-server')
+    parser.add_argument('peer', help='peer base URL, e.g. http://192.168.43.1:5001')
+    parser.add_argument('--user', required=True)
+    args = parser.parse_args(argv)
+    password = getpass.getpass(f'Login password for {args.user}: ')
+    try:
+        result = sync_with_peer(args.peer, args.user, password)
+    except SyncError as e:
+        print(f"Error: {e}")
+        return 1
+    print(f"Pulled {len(result['pulled'])}, pushed {len(result['pushed'])}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
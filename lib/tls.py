@@ -0,0 +1,294 @@
+import datetime
+import io
+import ipaddress
+import os
+import socket
+import ssl
+import threading
+from typing import Optional
+
+from werkzeug.serving import WSGIRequestHandler
+
+# Native TLS for the built-in server.
+#
+# A self-signed certificate (ECDSA P-256, cheap to sign with on a phone) is
+# generated once into server_state/tls/ and reused until it nears expiry. The
+# server context keeps session tickets and the session cache enabled, and the
+# request handler speaks HTTP/1.1 keep-alive, so a browser's repeat and
+# parallel connections mostly resume instead of doing a full handshake.
+# Handshakes are counted per outcome for `stats()`.
+
+STATE_DIR = 'server_state'
+TLS_DIR = os.path.join(STATE_DIR, 'tls')
+CERT_FILE = 'cert.pem'
+KEY_FILE = 'key.pem'
+CERT_DAYS = 397
+RENEW_BEFORE_DAYS = 30
+KEEP_ALIVE_TIMEOUT = 15     # seconds an idle keep-alive connection is kept open
+MAX_DRAIN = 64 * 1024      # unread request body skipped to keep a connection open
+
+
+class _Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.handshakes = 0
+            self.resumed = 0
+            self.failed = 0
+            self.protocols: dict = {}
+
+    def record(self, resumed: bool, protocol: Optional[str]) -> None:
+        with self._lock:
+            self.handshakes += 1
+            self.resumed += bool(resumed)
+            self.protocols[protocol] = self.protocols.get(protocol, 0) + 1
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failed += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'handshakes': self.handshakes,
+                'resumed': self.resumed,
+                'full': self.handshakes - self.resumed,
+                'failed': self.failed,
+                'resumption_rate': round(self.resumed / self.handshakes, 3) if self.handshakes else None,
+                'protocols': dict(self.protocols),
+            }
+
+
+_stats = _Stats()
+_enabled = False
+
+
+class _CountingSSLSocket(ssl.SSLSocket):
+    def do_handshake(self, *args, **kwargs):
+        try:
+            super().do_handshake(*args, **kwargs)
+        except (ssl.SSLError, OSError):
+            _stats.record_failure()
+            raise
+        if self.server_side:
+            _stats.record(self.session_reused, self.version())
+
+
+def _subject_names() -> tuple[list, list]:
+    """DNS names and IP addresses the certificate should cover."""
+    names = ['localhost', socket.gethostname()]
+    ips = {'127.0.0.1', '::1'}
+    try:
+        from lib import network
+        _, gateway, _ = network.get_hotspot_info_cached()
+        local = network.get_local_ip()
+        ips.update(ip for ip in (gateway, local) if ip)
+    except Exception:
+        pass
+    addresses = []
+    for ip in sorted(ips):
+        try:
+            addresses.append(ipaddress.ip_address(ip))
+        except ValueError:
+            continue
+    return sorted(set(names)), addresses
+
+
+def _generate(cert_path: str, key_path: str) -> None:
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    names, addresses = _subject_names()
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'Secret Server')])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(subject)
+        .issuer_name(subject)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=CERT_DAYS))
+        .add_extension(x509.SubjectAlternativeName(
+            [x509.DNSName(n) for n in names] + [x509.IPAddress(a) for a in addresses]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=False, path_length=None), critical=True)
+        .add_extension(x509.ExtendedKeyUsage([x509.oid.ExtendedKeyUsageOID.SERVER_AUTH]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+    with open(cert_path, 'wb') as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+
+
+def _needs_renewal(cert_path: str) -> bool:
+    from cryptography import x509
+    try:
+        with open(cert_path, 'rb') as f:
+            cert = x509.load_pem_x509_certificate(f.read())
+    except (OSError, ValueError):
+        return True
+    remaining = cert.not_valid_after_utc - datetime.datetime.now(datetime.timezone.utc)
+    return remaining < datetime.timedelta(days=RENEW_BEFORE_DAYS)
+
+
+def ensure_certificate(directory: str = TLS_DIR) -> tuple[str, str]:
+    """Return (cert, key) paths, generating a self-signed pair only when needed."""
+    os.makedirs(directory, exist_ok=True)
+    cert_path, key_path = os.path.join(directory, CERT_FILE), os.path.join(directory, KEY_FILE)
+    if not os.path.exists(key_path) or _needs_renewal(cert_path):
+        _generate(cert_path, key_path)
+    return cert_path, key_path
+
+
+def server_context(cert_path: str, key_path: str) -> ssl.SSLContext:
+    """TLS 1.2+ server context with session tickets and handshake accounting."""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.load_cert_chain(cert_path, key_path)
+    # Tickets (TLS 1.2 and 1.3) and OpenSSL's server-side session cache are
+    # what let a returning browser skip the full handshake.
+    context.options &= ~ssl.OP_NO_TICKET
+    context.num_tickets = 2
+    context.sslsocket_class = _CountingSSLSocket
+    return context
+
+
+def context(cert_path: Optional[str] = None, key_path: Optional[str] = None) -> ssl.SSLContext:
+    """Server context from the given files, or from the cached self-signed pair."""
+    global _enabled
+    if not cert_path:
+        cert_path, key_path = ensure_certificate()
+    _enabled = True
+    return server_context(cert_path, key_path or cert_path)
+
+
+class _RequestBody(io.RawIOBase):
+    """A Content-Length request body that knows how much of it is left unread."""
+
+    def __init__(self, stream, length: int):
+        self._stream = stream
+        self.remaining = length
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if self.remaining <= 0:
+            return 0
+        n = self._stream.readinto(memoryview(b)[:self.remaining]) or 0
+        self.remaining -= n
+        return n
+
+    def readline(self, size: int = -1) -> bytes:
+        limit = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        if limit <= 0:
+            return b''
+        line = self._stream.readline(limit)
+        self.remaining -= len(line)
+        return line
+
+    def drain(self, limit: int) -> bool:
+        """Skip what the application left unread; False if more than `limit` is left."""
+        if self.remaining > limit:
+            return False
+        while self.remaining > 0:
+            if not self.read(min(self.remaining, io.DEFAULT_BUFFER_SIZE)):
+                return False
+        return True
+
+
+class _DrainGuard:
+    """Stands in for rfile while a request runs. After the response werkzeug
+    discards whatever is left on the socket with rfile.read(); on a connection
+    being kept open that would swallow the client's next request."""
+
+    def __init__(self, handler, rfile):
+        self._handler = handler
+        self._rfile = rfile
+
+    def read(self, size=-1):
+        if self._handler._kept_alive:
+            return b''
+        return self._rfile.read(size)
+
+    def __getattr__(self, name):
+        return getattr(self._rfile, name)
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """HTTP/1.1 handler so clients reuse a connection for several requests.
+
+    Werkzeug closes every connection because an application may leave part of
+    the request body unread, which would then be parsed as the next request.
+    Here Content-Length bodies are tracked instead. The connection is offered
+    for reuse only if at most MAX_DRAIN bytes are unread when the response
+    headers go out; that rest is skipped once the response has been written,
+    since a streaming route is still reading the body while it responds.
+    Werkzeug's own drain after the response is skipped on such a connection.
+    Chunked uploads, and bodies left unread beyond MAX_DRAIN, still close it.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEP_ALIVE_TIMEOUT
+    _kept_alive = False
+
+    def run_wsgi(self):
+        rfile = self.rfile
+        self.rfile = _DrainGuard(self, rfile)
+        try:
+            super().run_wsgi()
+        finally:
+            self.rfile = rfile
+        if self._kept_alive and self._body is not None and not self._body.drain(MAX_DRAIN):
+            # left unread or cut short after all; close without a next request
+            self.close_connection = True
+
+    def make_environ(self):
+        environ = super().make_environ()
+        self._body = None
+        self._kept_alive = False
+        self._reusable = not environ.get('wsgi.input_terminated')      # chunked: can't drain
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            self._reusable = False
+            length = 0
+        if length > 0 and self._reusable:
+            self._body = environ['wsgi.input'] = _RequestBody(self.rfile, length)
+        return environ
+
+    def _keep_alive(self) -> bool:
+        if self.close_connection or not getattr(self, '_reusable', False):
+            return False
+        # only a promise here: draining now would take input from a route
+        # that is still reading the body while it streams its response
+        return self._body is None or self._body.remaining <= MAX_DRAIN
+
+    def send_header(self, keyword, value):
+        if keyword.lower() == 'connection' and value.lower() == 'close' and self._keep_alive():
+            self._kept_alive = True
+            return
+        super().send_header(keyword, value)
+
+
+def request_handler(ssl_context: Optional[ssl.SSLContext]):
+    """Handler class for the built-in server: keep-alive where handshakes are
+    costly, werkzeug's own (None) for plain HTTP."""
+    return KeepAliveRequestHandler if ssl_context is not None else None
+
+
+def stats() -> dict:
+    return dict(_stats.snapshot(), enabled=_enabled)
+
+
+def reset_stats() -> None:
+    _stats.reset()
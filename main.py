@@ -12,8 +12,9 @@ from kivy.uix.textinput import TextInput
 from kivy.utils import platform
 from kivy.clock import Clock
 
-# Flask import
-from web_server import app as flask_app
+# The Flask app is imported lazily on the server thread so the UI can appear
+# before the web stack (and cryptography) has finished loading.
+from lib import startup
 
 # Global state
 server_thread = None
@@ -26,9 +27,21 @@ class ServerThread(threading.Thread):
         self.daemon = True
 
     def run(self):
+        if self.app is None:
+            with startup.phase('import web_server'):
+                from web_server import app as flask_app
+            self.app = flask_app
+        from lib import audit
+        audit.configure()
+        from web_server import resume_jobs
+        resume_jobs()
+        # Optional, like web_server.py --warm-up: priming caches costs start-up
+        # work that a short-lived session may never benefit from.
+        if os.environ.get('SECRET_SERVER_WARM_UP', '') not in ('', '0'):
+            startup.warm_up('127.0.0.1', 5001)
         # On Android, we need to make sure we are serving on 0.0.0.0
         # Port 5001 as usual
-        flask_app.run(host='0.0.0.0', port=5001, debug=False, use_reloader=False)
+        self.app.run(host='0.0.0.0', port=5001, debug=False, use_reloader=False)
 
 class MainInterface(BoxLayout):
     def __init__(self, **kwargs):
@@ -90,7 +103,7 @@ class MainInterface(BoxLayout):
             self.log("Wake Lock acquired.")
 
         try:
-            server_thread = ServerThread(flask_app)
+            server_thread = ServerThread(None)
             server_thread.start()
             server_running = True
             
@@ -4,6 +4,7 @@ const API_BASE = '';
 // State
 let currentUser = null;
 let loginPassphrase = null;
+let editVersion = null; // version of the secret open in the update editor
 
 // DOM Elements
 const authScreen = document.getElementById('auth-screen');
@@ -16,6 +17,12 @@ const logoutBtn = document.getElementById('logout-btn');
 const newSecretBtn = document.getElementById('new-secret-btn');
 const appsGrid = document.getElementById('apps-grid');
 const emptyState = document.getElementById('empty-state');
+const searchInput = document.getElementById('search-input');
+let searchTimer = null;
+
+// Client-side encryption is only available in a secure context (HTTPS or
+// localhost). Elsewhere the UI falls back to the server-side endpoints.
+const clientCrypto = !!(window.crypto && window.crypto.subtle);
 
 // Modals
 const storeModal = document.getElementById('store-modal');
@@ -26,6 +33,12 @@ const updateModal = document.getElementById('update-modal');
 document.addEventListener('DOMContentLoaded', () => {
     checkAuthStatus();
     setupEventListeners();
+    // Like WebCrypto, service workers need a secure context
+    if ('serviceWorker' in navigator) {
+        navigator.serviceWorker.register('/sw.js').catch(error => {
+            console.error('Service worker registration failed:', error);
+        });
+    }
 });
 
 // Check if user is already authenticated
@@ -65,6 +78,10 @@ function setupEventListeners() {
     // Buttons
     logoutBtn.addEventListener('click', handleLogout);
     newSecretBtn.addEventListener('click', () => openModal('store-modal'));
+    searchInput.addEventListener('input', () => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(searchApps, 150);
+    });
 
     // Visibility toggles
     document.querySelectorAll('.password-toggle').forEach(btn => {
@@ -185,6 +202,8 @@ async function handleRegister(e) {
 async function handleLogout() {
     try {
         await fetch(`${API_BASE}/api/auth/logout`, { method: 'POST' });
+        LiveUpdates.stop();
+        await AppCache.clear(currentUser);
         currentUser = null;
         showAuth();
     } catch (error) {
@@ -198,6 +217,7 @@ function showDashboard() {
     dashboardScreen.classList.add('active');
     usernameDisplay.textContent = currentUser;
     loadApps();
+    LiveUpdates.start();
 }
 
 function showAuth() {
@@ -205,26 +225,127 @@ function showAuth() {
     authScreen.classList.add('active');
     loginForm.reset();
     registerForm.reset();
+    searchInput.value = '';
 }
 
-// Load Apps
+// Load Apps: render the cached list at once, then apply the server's changes
 async function loadApps() {
+    const user = currentUser;
+    const cached = await AppCache.load(user);
+    if (cached.apps.length > 0 && !searchInput.value.trim()) {
+        showApps(cached.apps);
+    }
     try {
-        const response = await fetch(`${API_BASE}/api/apps`);
-        const data = await response.json();
-
-        if (data.apps && data.apps.length > 0) {
-            renderApps(data.apps);
-            emptyState.classList.remove('show');
-        } else {
-            appsGrid.innerHTML = '';
-            emptyState.classList.add('show');
+        const since = cached.since;
+        const data = await fetchChanges(since);
+        const apps = mergeApps(cached.apps, data.changes, data.removed);
+        if (user !== currentUser) {
+            return; // logged out while loading
+        }
+        await AppCache.save(user, apps, data.now, since === 0, data.removed);
+        if (!searchInput.value.trim()) {
+            showApps(apps);
         }
     } catch (error) {
         console.error('Failed to load apps:', error);
     }
 }
 
+async function fetchChanges(since) {
+    const response = await fetch(`${API_BASE}/api/apps/changes?since=${since}`);
+    if (!response.ok) {
+        throw new Error(`HTTP ${response.status}`);
+    }
+    return response.json();
+}
+
+function mergeApps(apps, changes, removed) {
+    const byName = new Map(apps.map(app => [app.name, app]));
+    changes.forEach(app => byName.set(app.name, app));
+    removed.forEach(name => byName.delete(name));
+    return [...byName.values()];
+}
+
+function showApps(apps) {
+    if (apps.length > 0) {
+        renderApps([...apps].sort((a, b) => a.name.localeCompare(b.name)));
+        emptyState.classList.remove('show');
+    } else {
+        appsGrid.innerHTML = '';
+        emptyState.classList.add('show');
+    }
+}
+
+// Live updates: the server pushes a 'change' event for every write to this
+// user's apps (from any device), so the list is refreshed only when something
+// changed instead of after every action or on a timer. Bursts of events are
+// coalesced into one delta fetch.
+const LiveUpdates = (() => {
+    let source = null;
+    let timer = null;
+    let connected = false;
+
+    function refresh() {
+        clearTimeout(timer);
+        timer = setTimeout(() => {
+            if (!searchInput.value.trim()) {
+                loadApps();
+            }
+        }, 200);
+    }
+
+    function start() {
+        if (source || !window.EventSource) {
+            return;
+        }
+        source = new EventSource(`${API_BASE}/api/events`);
+        // 'ready' also follows every reconnect; catch up on what was missed
+        source.addEventListener('ready', () => {
+            if (connected) {
+                refresh();
+            }
+            connected = true;
+        });
+        source.addEventListener('change', refresh);
+        source.addEventListener('resync', refresh);
+    }
+
+    function stop() {
+        clearTimeout(timer);
+        connected = false;
+        if (source) {
+            source.close();
+            source = null;
+        }
+    }
+
+    function active() {
+        return !!source && source.readyState !== EventSource.CLOSED;
+    }
+
+    return { start, stop, active };
+})();
+
+// Server-side search (prefix + fuzzy); an empty query shows the full list
+async function searchApps() {
+    const query = searchInput.value.trim();
+    if (!query) {
+        loadApps();
+        return;
+    }
+    try {
+        const response = await fetch(`${API_BASE}/api/apps/search?q=${encodeURIComponent(query)}&limit=50`);
+        const data = await response.json();
+        if (searchInput.value.trim() !== query) {
+            return; // a newer query is in flight
+        }
+        renderApps(data.results || []);
+        emptyState.classList.remove('show');
+    } catch (error) {
+        console.error('Search failed:', error);
+    }
+}
+
 function renderApps(apps) {
     appsGrid.innerHTML = apps.map(app => `
         <div class="app-card">
@@ -254,23 +375,27 @@ async function handleStore(e) {
     const errorEl = document.getElementById('store-error');
 
     try {
-        const response = await fetch(`${API_BASE}/api/secrets/store`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                app_name: appName,
-                app_username: appUsername,
-                secret_text: secretText,
-                passphrase: passphrase
-            })
-        });
+        const response = clientCrypto
+            ? await storeCiphertext(appName, appUsername, secretText, passphrase)
+            : await fetch(`${API_BASE}/api/secrets/store`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    app_name: appName,
+                    app_username: appUsername,
+                    secret_text: secretText,
+                    passphrase: passphrase
+                })
+            });
 
         const data = await response.json();
 
         if (response.ok) {
             closeModal('store-modal');
             document.getElementById('store-form').reset();
-            loadApps();
+            if (!LiveUpdates.active()) {
+                loadApps();
+            }
         } else {
             showError(errorEl, data.error || 'Failed to store secret');
         }
@@ -288,18 +413,9 @@ async function handleRetrieve(e) {
     const resultEl = document.getElementById('retrieve-result');
 
     try {
-        const response = await fetch(`${API_BASE}/api/secrets/retrieve`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                app_name: appName,
-                passphrase: passphrase
-            })
-        });
-
-        const data = await response.json();
+        const data = await retrieveSecret(appName, passphrase);
 
-        if (response.ok) {
+        if (data.ok) {
             document.getElementById('result-username').textContent = data.app_username;
             document.getElementById('result-timestamp').textContent = data.timestamp;
             document.getElementById('result-secret').textContent = data.secret;
@@ -324,22 +440,28 @@ async function handleUpdate(e) {
     const errorEl = document.getElementById('update-error');
 
     try {
-        const response = await fetch(`${API_BASE}/api/secrets/update`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                app_name: appName,
-                passphrase: passphrase,
-                key_path: "", // Send empty to trigger full overwrite
-                value: value
-            })
-        });
+        const response = clientCrypto
+            ? await updateCiphertext(appName, passphrase, value, editVersion)
+            : await fetch(`${API_BASE}/api/secrets/update`, {
+                method: 'POST',
+                headers: versionHeaders(editVersion),
+                body: JSON.stringify({
+                    app_name: appName,
+                    passphrase: passphrase,
+                    key_path: "", // Send empty to trigger full overwrite
+                    value: value
+                })
+            });
 
         const data = await response.json();
 
         if (response.ok) {
             closeModal('update-modal');
-            loadApps(); // Refresh the list
+            if (!LiveUpdates.active()) {
+                loadApps(); // Refresh the list
+            }
+        } else if (response.status === 409) {
+            showError(errorEl, 'This secret was changed on another device. Close and reopen it to edit the latest version.');
         } else {
             showError(errorEl, data.error || 'Failed to update secret');
         }
@@ -362,6 +484,25 @@ async function handleUnlockEdit() {
     }
 
     try {
+        const data = await retrieveSecret(appName, passphrase);
+
+        if (data.ok) {
+            textarea.value = data.secret;
+            editVersion = data.version;
+            unlockSection.style.display = 'none';
+            editorSection.style.display = 'block';
+            errorEl.classList.remove('show');
+        } else {
+            showError(errorEl, data.error || 'Failed to unlock secret');
+        }
+    } catch (error) {
+        showError(errorEl, 'Network error. Please try again.');
+    }
+}
+
+// Secret transport: encrypt/decrypt in the browser when possible
+async function retrieveSecret(appName, passphrase) {
+    if (!clientCrypto) {
         const response = await fetch(`${API_BASE}/api/secrets/retrieve`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
@@ -370,22 +511,240 @@ async function handleUnlockEdit() {
                 passphrase: passphrase
             })
         });
-
         const data = await response.json();
+        return { ...data, ok: response.ok };
+    }
 
-        if (response.ok) {
-            textarea.value = data.secret;
-            unlockSection.style.display = 'none';
-            editorSection.style.display = 'block';
-            errorEl.classList.remove('show');
-        } else {
-            showError(errorEl, data.error || 'Failed to unlock secret');
+    const response = await fetch(`${API_BASE}/api/secrets/ciphertext/retrieve`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ app_name: appName })
+    });
+    const data = await response.json();
+    if (!response.ok) {
+        return { ...data, ok: false };
+    }
+    try {
+        const secret = await SecretCrypto.decrypt(data.ciphertext, passphrase, data.method);
+        return { ...data, secret, ok: true };
+    } catch (error) {
+        return { ok: false, error: `Decryption failed: ${error.message}` };
+    }
+}
+
+// JSON headers plus an If-Match precondition when the version is known
+function versionHeaders(version) {
+    const headers = { 'Content-Type': 'application/json' };
+    if (version !== null && version !== undefined) {
+        headers['If-Match'] = `"${version}"`;
+    }
+    return headers;
+}
+
+async function storeCiphertext(appName, appUsername, secretText, passphrase, version = null) {
+    const ciphertext = await SecretCrypto.encrypt(secretText, passphrase);
+    return fetch(`${API_BASE}/api/secrets/ciphertext/store`, {
+        method: 'POST',
+        headers: versionHeaders(version),
+        body: JSON.stringify({
+            app_name: appName,
+            app_username: appUsername,
+            ciphertext: ciphertext,
+            method: SecretCrypto.method()
+        })
+    });
+}
+
+async function updateCiphertext(appName, passphrase, value, version) {
+    // Mirrors the server's full-overwrite update: JSON values are re-indented,
+    // anything else is stored as typed. The passphrase is checked by
+    // decrypting the current value first, as the server would.
+    const current = await retrieveSecret(appName, passphrase);
+    if (!current.ok) {
+        return new Response(JSON.stringify({ error: current.error }), { status: 400 });
+    }
+    let text = value;
+    try {
+        const parsed = JSON.parse(value);
+        if (parsed !== null && typeof parsed === 'object') {
+            text = JSON.stringify(parsed, null, 2);
         }
     } catch (error) {
-        showError(errorEl, 'Network error. Please try again.');
+        // not JSON; store as typed
     }
+    return storeCiphertext(appName, current.app_username, text, passphrase,
+        version !== null && version !== undefined ? version : current.version);
 }
 
+// WebCrypto implementation of lib/crypto.py's stored format:
+//   base64( salt(16) || fernet_token )
+// where the Fernet key is PBKDF2-HMAC-SHA256(passphrase, salt) and the token
+// is base64url( 0x80 || timestamp(8) || iv(16) || AES-128-CBC(ciphertext) || HMAC-SHA256 ).
+const SecretCrypto = (() => {
+    const SALT_SIZE = 16;
+    const KDF_ITERATIONS = 600000;
+    const MIN_ITERATIONS = 100000; // same window as crypto.MIN/MAX_KDF_ITERATIONS
+    const MAX_ITERATIONS = 2000000;
+    const METHOD_PREFIX = 'pbkdf2:sha256:';
+    const encoder = new TextEncoder();
+    const decoder = new TextDecoder();
+
+    function method() {
+        return `${METHOD_PREFIX}${KDF_ITERATIONS}`;
+    }
+
+    function iterationsFromMethod(m) {
+        if (!m) return KDF_ITERATIONS;
+        if (!m.startsWith(METHOD_PREFIX)) throw new Error(`Unsupported KDF method: ${m}`);
+        const iterations = parseInt(m.slice(METHOD_PREFIX.length), 10);
+        if (!(iterations >= MIN_ITERATIONS && iterations <= MAX_ITERATIONS)) {
+            throw new Error(`Unsupported KDF iterations: ${m}`);
+        }
+        return iterations;
+    }
+
+    function toBase64(bytes) {
+        let binary = '';
+        for (let i = 0; i < bytes.length; i++) binary += String.fromCharCode(bytes[i]);
+        return btoa(binary);
+    }
+
+    function fromBase64(text) {
+        const binary = atob(text);
+        const bytes = new Uint8Array(binary.length);
+        for (let i = 0; i < binary.length; i++) bytes[i] = binary.charCodeAt(i);
+        return bytes;
+    }
+
+    function concat(...parts) {
+        const out = new Uint8Array(parts.reduce((n, p) => n + p.length, 0));
+        let offset = 0;
+        for (const p of parts) {
+            out.set(p, offset);
+            offset += p.length;
+        }
+        return out;
+    }
+
+    async function deriveKeys(passphrase, salt, iterations) {
+        const base = await crypto.subtle.importKey('raw', encoder.encode(passphrase), 'PBKDF2', false, ['deriveBits']);
+        const bits = new Uint8Array(await crypto.subtle.deriveBits(
+            { name: 'PBKDF2', hash: 'SHA-256', salt, iterations }, base, 256));
+        const signKey = await crypto.subtle.importKey('raw', bits.slice(0, 16),
+            { name: 'HMAC', hash: 'SHA-256' }, false, ['sign', 'verify']);
+        const encKey = await crypto.subtle.importKey('raw', bits.slice(16, 32), 'AES-CBC', false, ['encrypt', 'decrypt']);
+        return { signKey, encKey };
+    }
+
+    async function encrypt(plaintext, passphrase) {
+        const salt = crypto.getRandomValues(new Uint8Array(SALT_SIZE));
+        const iv = crypto.getRandomValues(new Uint8Array(16));
+        const { signKey, encKey } = await deriveKeys(passphrase, salt, KDF_ITERATIONS);
+        const ciphertext = new Uint8Array(await crypto.subtle.encrypt(
+            { name: 'AES-CBC', iv }, encKey, encoder.encode(plaintext)));
+        const timestamp = new Uint8Array(8);
+        new DataView(timestamp.buffer).setBigUint64(0, BigInt(Math.floor(Date.now() / 1000)));
+        const body = concat(new Uint8Array([0x80]), timestamp, iv, ciphertext);
+        const hmac = new Uint8Array(await crypto.subtle.sign('HMAC', signKey, body));
+        const token = toBase64(concat(body, hmac)).replace(/\+/g, '-').replace(/\//g, '_');
+        return toBase64(concat(salt, encoder.encode(token)));
+    }
+
+    async function decrypt(encrypted, passphrase, m) {
+        const combined = fromBase64(encrypted);
+        if (combined.length <= SALT_SIZE) throw new Error('Invalid encrypted payload');
+        const salt = combined.slice(0, SALT_SIZE);
+        const token = fromBase64(decoder.decode(combined.slice(SALT_SIZE)).replace(/-/g, '+').replace(/_/g, '/'));
+        if (token.length < 73 || token[0] !== 0x80) throw new Error('Invalid token');
+        const { signKey, encKey } = await deriveKeys(passphrase, salt, iterationsFromMethod(m));
+        const body = token.slice(0, token.length - 32);
+        const valid = await crypto.subtle.verify('HMAC', signKey, token.slice(token.length - 32), body);
+        if (!valid) throw new Error('Invalid token');
+        const plaintext = await crypto.subtle.decrypt(
+            { name: 'AES-CBC', iv: body.slice(9, 25) }, encKey, body.slice(25));
+        return decoder.decode(plaintext);
+    }
+
+    return { encrypt, decrypt, method };
+})();
+
+// App list and metadata cached per user in IndexedDB, with the server time of
+// the last sync, so reopening the dashboard only fetches what changed. Only
+// metadata is kept; secrets never are. Falls back to an empty cache when
+// IndexedDB is unavailable.
+const AppCache = (() => {
+    const DB_NAME = 'secret-server';
+    const DB_VERSION = 1;
+    let dbPromise = null;
+
+    function open() {
+        if (!window.indexedDB) {
+            return Promise.resolve(null);
+        }
+        if (!dbPromise) {
+            dbPromise = new Promise(resolve => {
+                const request = indexedDB.open(DB_NAME, DB_VERSION);
+                request.onupgradeneeded = () => {
+                    const db = request.result;
+                    db.createObjectStore('apps', { keyPath: ['user', 'name'] }).createIndex('user', 'user');
+                    db.createObjectStore('sync', { keyPath: 'user' });
+                };
+                request.onsuccess = () => resolve(request.result);
+                request.onerror = () => resolve(null);
+            });
+        }
+        return dbPromise;
+    }
+
+    function done(request) {
+        return new Promise((resolve, reject) => {
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    }
+
+    async function load(user) {
+        const db = await open();
+        if (!db || !user) {
+            return { apps: [], since: 0 };
+        }
+        try {
+            const tx = db.transaction(['apps', 'sync'], 'readonly');
+            const [apps, sync] = await Promise.all([
+                done(tx.objectStore('apps').index('user').getAll(user)),
+                done(tx.objectStore('sync').get(user))
+            ]);
+            return { apps, since: sync ? sync.since : 0 };
+        } catch (error) {
+            return { apps: [], since: 0 };
+        }
+    }
+
+    async function save(user, apps, since, replace, removed = []) {
+        const db = await open();
+        if (!db || !user) {
+            return;
+        }
+        const tx = db.transaction(['apps', 'sync'], 'readwrite');
+        const store = tx.objectStore('apps');
+        if (replace) {
+            store.delete(IDBKeyRange.bound([user, ''], [user, []])); // arrays sort after every string
+        }
+        removed.forEach(name => store.delete([user, name]));
+        apps.forEach(app => store.put({ ...app, user }));
+        tx.objectStore('sync').put({ user, since });
+        await new Promise(resolve => {
+            tx.oncomplete = tx.onerror = tx.onabort = () => resolve();
+        });
+    }
+
+    async function clear(user) {
+        await save(user, [], 0, true);
+    }
+
+    return { load, save, clear };
+})();
+
 // Modal Management
 function openModal(modalId) {
     const modal = document.getElementById(modalId);
@@ -425,6 +784,7 @@ function openRetrieveModal(appName) {
 function openUpdateModal(appName) {
     document.getElementById('update-app-name').value = appName;
     document.getElementById('update-value').value = '';
+    editVersion = null;
     document.getElementById('update-unlock-section').style.display = 'block';
     document.getElementById('update-editor-section').style.display = 'none';
     openModal('update-modal');
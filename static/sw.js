@@ -0,0 +1,54 @@
+// Service worker: serves the static shell stale-while-revalidate so the
+// dashboard opens from cache over a slow hotspot, and refreshes the cached
+// copy in the background. API requests are never cached here; app metadata is
+// kept in IndexedDB by app.js and secrets are not stored on the client.
+
+const CACHE = 'secret-server-shell-v4';
+const SHELL = [
+    '/',
+    '/static/style.css?v=5',
+    '/static/app.js?v=12'
+];
+
+self.addEventListener('install', event => {
+    event.waitUntil(
+        caches.open(CACHE)
+            .then(cache => cache.addAll(SHELL))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys()
+            .then(keys => Promise.all(keys.filter(key => key !== CACHE).map(key => caches.delete(key))))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    const url = new URL(request.url);
+    if (request.method !== 'GET' || url.origin !== self.location.origin || url.pathname.startsWith('/api/')) {
+        return; // network only
+    }
+    event.respondWith(staleWhileRevalidate(event, request));
+});
+
+async function staleWhileRevalidate(event, request) {
+    const cache = await caches.open(CACHE);
+    const cached = await cache.match(request);
+    const refresh = fetch(request)
+        .then(response => {
+            if (response.ok) {
+                cache.put(request, response.clone());
+            }
+            return response;
+        });
+    if (cached) {
+        // keep the worker alive until the cached copy has been refreshed
+        event.waitUntil(refresh.catch(() => {}));
+        return cached;
+    }
+    return refresh;
+}
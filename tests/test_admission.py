@@ -0,0 +1,40 @@
+from lib.admission import AdmissionController
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_refills_over_time():
+    clock = FakeClock()
+    ac = AdmissionController(ip_rate=1.0, ip_burst=2, clock=clock)
+    assert ac.admit('10.0.0.2', None) == 0
+    assert ac.admit('10.0.0.2', None) == 0
+    assert ac.admit('10.0.0.2', None) > 0
+    clock.now += 1.0
+    assert ac.admit('10.0.0.2', None) == 0
+
+
+def test_exponential_lockout_and_success_reset():
+    clock = FakeClock()
+    ac = AdmissionController(user_burst=100, ip_burst=100, lockout_threshold=2, lockout_base=1.0, clock=clock)
+    for _ in range(2):
+        ac.record_failure('10.0.0.2', 'bob')
+    first = ac.admit('10.0.0.3', 'bob')
+    ac.record_failure('10.0.0.2', 'bob')
+    assert ac.admit('10.0.0.3', 'bob') > first
+    ac.record_success('bob')
+    assert ac.admit('10.0.0.3', 'bob') == 0
+    # the offending IP stays locked out
+    assert ac.admit('10.0.0.2', 'alice') > 0
+
+
+def test_buckets_are_lru_bounded():
+    ac = AdmissionController(max_entries=3)
+    for i in range(10):
+        ac.admit(f'10.0.0.{i}', None)
+    assert len(ac) == 3
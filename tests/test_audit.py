@@ -0,0 +1,75 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from lib import audit
+
+
+def test_events_are_batched_filtered_and_rotated(tmp_path):
+    log = audit.AuditLog(str(tmp_path), max_bytes=2000, max_files=3)
+    written = 0
+    for i in range(60):
+        log.record('auth.login', user='amy' if i % 2 else 'bob', ip='10.0.0.5', outcome='ok', n=i)
+        if i % 10 == 9:
+            # rotation is checked once per written batch
+            written += log.flush()
+    log.record('secret.read', user='amy', ip='10.0.0.6')
+    assert written + log.flush() == 61
+
+    assert len(log.files()) == 3
+    # rotation discards the oldest files, but the newest events are all there
+    assert log.query(event='secret')[-1]['ip'] == '10.0.0.6'
+    assert all(e['user'] == 'amy' for e in log.query(user='amy'))
+    assert [e['n'] for e in log.query(event='auth.login', limit=2)] == [58, 59]
+    assert log.query(ip='10.0.0.6', event='auth') == []
+
+
+def test_full_ring_counts_drops_instead_of_blocking(tmp_path):
+    log = audit.AuditLog(str(tmp_path), capacity=3)
+    results = [log.record('auth.login', n=i) for i in range(5)]
+    assert results == [True, True, True, False, False]
+    assert log.stats()['dropped'] == 2
+    log.flush()
+    events = log.query()
+    assert events[-1] == dict(events[-1], event='audit.overflow', dropped=2)
+
+
+
+def test_process_log_writes_only_where_configured(tmp_path, monkeypatch):
+    monkeypatch.setattr(audit, 'log', None)
+    monkeypatch.chdir(tmp_path)
+    assert audit.record('auth.login', user='amy') is False
+    log = audit.configure('state/audit')
+    monkeypatch.chdir(tmp_path.parent)
+    assert audit.record('auth.login', user='amy')
+    log.flush()
+    # the directory was fixed when configured, not by the cwd at the first write
+    assert os.path.exists(tmp_path / 'state' / 'audit' / audit.LOG_NAME)
+    assert not os.path.exists(tmp_path / audit.AUDIT_DIR)
+
+def test_login_attempts_are_audited_without_secrets(client_with_audit):
+    client, log = client_with_audit
+    client.post('/api/auth/register', json={'username': 'gus', 'password': 'hunter2'})
+    client.post('/api/auth/login', json={'username': 'gus', 'password': 'wrong'})
+    log.flush()
+    events = log.query(user='gus')
+    assert [(e['event'], e['outcome']) for e in events] == [('auth.register', 'ok'), ('auth.login', 'denied')]
+    with open(log.files()[-1]) as f:
+        assert 'hunter2' not in f.read()
+
+
+@pytest.fixture
+def client_with_audit(tmp_path, monkeypatch):
+    from cryptography.fernet import Fernet
+    from lib import admission
+    from web_server import app
+    monkeypatch.setenv('MASTER_KEY', Fernet.generate_key().decode('utf-8'))
+    monkeypatch.chdir(tmp_path)
+    log = audit.AuditLog(str(tmp_path / 'audit'))
+    monkeypatch.setattr(audit, 'log', log)
+    admission.controller.reset()
+    app.config['TESTING'] = True
+    with app.test_client() as c:
+        yield c, log
@@ -1,11 +1,13 @@
 import os
 import json
+import shutil
 import tempfile
 import sys
 import pytest
 # Ensure project root is importable
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from web_server import app
+from lib import admission
 
 @pytest.fixture
 def client(tmp_path, monkeypatch):
@@ -19,6 +21,7 @@ def client(tmp_path, monkeypatch):
     os.makedirs(str(test_db), exist_ok=True)
     os.makedirs(str(test_state), exist_ok=True)
 
+    admission.controller.reset()
     app.config['TESTING'] = True
     with app.test_client() as c:
         yield c
@@ -62,3 +65,98 @@ def test_secret_flow_with_session_credentials(client):
     client.post('/api/auth/logout')
     r = client.post('/api/secrets/store', json={'app_name': 'demo', 'secret_text': 'x', 'passphrase': 'p'})
     assert r.status_code == 401
+
+
+def test_login_flood_is_rejected_before_kdf(client, monkeypatch):
+    from lib import auth
+    client.post('/api/auth/register', json={'username': 'eve', 'password': 'pw'})
+    calls = []
+    original = auth._hash_password
+    monkeypatch.setattr(auth, '_hash_password', lambda *a: calls.append(1) or original(*a))
+
+    statuses = [client.post('/api/auth/login', json={'username': 'eve', 'password': 'bad'}).status_code
+                for _ in range(admission.USER_BURST + 3)]
+    assert statuses.count(401) == len(calls)
+    assert statuses[-1] == 429
+    r = client.post('/api/auth/login', json={'username': 'eve', 'password': 'bad'})
+    assert r.status_code == 429
+    assert int(r.headers['Retry-After']) >= 1
+
+
+def test_ciphertext_passthrough_roundtrip(client):
+    from lib import crypto
+    client.post('/api/auth/register', json={'username': 'dan', 'password': 'pw'})
+    enc = str(crypto.encrypt_secret('client side', 'p'))
+    r = client.post('/api/secrets/ciphertext/store', json={
+        'app_name': 'demo', 'app_username': 'd', 'ciphertext': enc, 'method': crypto.kdf_method()})
+    assert r.status_code == 200
+
+    # the server-side retrieve path can still open it
+    r = client.post('/api/secrets/retrieve', json={'app_name': 'demo', 'passphrase': 'p'})
+    assert r.get_json().get('secret') == 'client side'
+
+    r = client.post('/api/secrets/ciphertext/retrieve', json={'app_name': 'demo'})
+    j = r.get_json()
+    assert j['ciphertext'] == enc
+    assert j['method'] == crypto.kdf_method()
+    assert j['app_username'] == 'd'
+
+    r = client.post('/api/secrets/ciphertext/store', json={
+        'app_name': 'demo', 'ciphertext': 'not-base64!', 'method': crypto.kdf_method()})
+    assert r.status_code == 400
+
+    # the client cannot pick an unbounded (or zero) KDF cost
+    for method in ('pbkdf2:sha256:0', f'pbkdf2:sha256:{crypto.MAX_KDF_ITERATIONS * 10}'):
+        r = client.post('/api/secrets/ciphertext/store', json={
+            'app_name': 'costly', 'ciphertext': enc, 'method': method})
+        assert r.status_code == 400
+
+
+def test_if_match_preconditions_on_store_and_update(client):
+    client.post('/api/auth/register', json={'username': 'fay', 'password': 'pw'})
+    r = client.post('/api/secrets/store', json={'app_name': 'demo', 'secret_text': 'v1', 'passphrase': 'p'},
+                    headers={'If-None-Match': '*'})
+    assert r.status_code == 200
+    assert r.get_json()['version'] == 1
+    assert r.headers['ETag'] == '"1"'
+
+    # create-only store fails once the secret exists
+    r = client.post('/api/secrets/store', json={'app_name': 'demo', 'secret_text': 'x', 'passphrase': 'p'},
+                    headers={'If-None-Match': '*'})
+    assert r.status_code == 409
+
+    r = client.post('/api/secrets/update', json={'app_name': 'demo', 'passphrase': 'p', 'value': 'v2'},
+                    headers={'If-Match': '"1"'})
+    assert r.status_code == 200
+    assert r.get_json()['version'] == 2
+
+    # a second device still holding version 1 loses cleanly instead of silently
+    r = client.post('/api/secrets/update', json={'app_name': 'demo', 'passphrase': 'p', 'value': 'stale'},
+                    headers={'If-Match': '"1"'})
+    assert r.status_code == 409
+    assert r.get_json()['version'] == 2
+
+    r = client.post('/api/secrets/retrieve', json={'app_name': 'demo', 'passphrase': 'p'})
+    assert r.get_json()['secret'] == 'v2'
+    assert r.headers['ETag'] == '"2"'
+
+
+def test_app_changes_returns_deltas_since_last_call(client):
+    from lib import crypto
+    client.post('/api/auth/register', json={'username': 'hal', 'password': 'pw'})
+    enc = str(crypto.encrypt_secret('x', 'p'))
+    client.post('/api/secrets/ciphertext/store', json={'app_name': 'one', 'ciphertext': enc, 'method': crypto.kdf_method()})
+    first = client.get('/api/apps/changes?since=0').get_json()
+    assert [c['name'] for c in first['changes']] == ['one'] and first['count'] == 1
+
+    client.post('/api/secrets/ciphertext/store', json={'app_name': 'two', 'ciphertext': enc, 'method': crypto.kdf_method()})
+    delta = client.get(f"/api/apps/changes?since={first['now']}").get_json()
+    assert [c['name'] for c in delta['changes']] == ['two'] and delta['count'] == 2
+
+    shutil.rmtree(os.path.join('db', 'hal', 'one'))
+    gone = client.get(f"/api/apps/changes?since={delta['now']}").get_json()
+    assert (gone['changes'], gone['removed']) == ([], ['one'])
+    assert client.get('/api/apps/changes?since=soon').status_code == 400
+
+    r = client.get('/sw.js')
+    assert r.status_code == 200 and 'javascript' in r.mimetype
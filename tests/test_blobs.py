@@ -0,0 +1,85 @@
+import io
+import os
+import sys
+import pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from lib import blobs
+
+
+def _chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_stream_roundtrip_multiple_segments():
+    data = os.urandom(10_000)
+    out = io.BytesIO()
+    n = blobs.encrypt_stream(_chunks(data, 777), 'pw', out, segment_size=1024)
+    assert n == len(data)
+
+    out.seek(0)
+    assert b''.join(blobs.decrypt_stream(out, 'pw')) == data
+
+
+def test_empty_stream_roundtrip():
+    out = io.BytesIO()
+    blobs.encrypt_stream([], 'pw', out, segment_size=1024)
+    out.seek(0)
+    assert b''.join(blobs.decrypt_stream(out, 'pw')) == b''
+
+
+def test_wrong_passphrase_fails_before_streaming():
+    out = io.BytesIO()
+    blobs.encrypt_stream([b'abc'], 'good', out)
+    out.seek(0)
+    with pytest.raises(blobs.BlobError):
+        blobs.decrypt_stream(out, 'bad')
+
+
+def test_truncated_blob_is_detected():
+    out = io.BytesIO()
+    blobs.encrypt_stream([os.urandom(4096)], 'pw', out, segment_size=1024)
+    truncated = io.BytesIO(out.getvalue()[:-(1024 + 16)])
+    with pytest.raises(blobs.BlobError):
+        b''.join(blobs.decrypt_stream(truncated, 'pw'))
+
+
+def test_store_and_open_blob(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    filename, size = blobs.store_blob('dave', 'docs', 'scan.pdf', 'pw', [b'a' * 100, b'b' * 50])
+    assert size == 150
+    assert os.path.dirname(filename) == os.path.join('db', 'dave', 'docs', 'blobs')
+    assert b''.join(blobs.open_blob('dave', 'docs', 'scan.pdf', 'pw')) == b'a' * 100 + b'b' * 50
+    assert blobs.open_blob('dave', 'docs', 'missing', 'pw') is None
+    with pytest.raises(blobs.BlobError):
+        blobs.blob_path('dave', 'docs', '../auth')
+
+
+def test_upload_requires_existing_app_and_session_credentials(tmp_path, monkeypatch):
+    from cryptography.fernet import Fernet
+    from web_server import app
+    from lib import admission, crypto
+    monkeypatch.setenv('MASTER_KEY', Fernet.generate_key().decode('utf-8'))
+    monkeypatch.setattr(crypto, '_KDF_ITERATIONS', 1000)
+    monkeypatch.chdir(tmp_path)
+    admission.controller.reset()
+    app.config['TESTING'] = True
+    headers = {'X-Passphrase': 'pw'}
+    with app.test_client() as c:
+        with c.session_transaction() as s:
+            s['username'] = 'dave'      # no server-side session credentials
+        assert c.post('/api/blobs/docs/a.txt', data=b'x', headers=headers).status_code == 401
+
+        c.post('/api/auth/register', json={'username': 'dave', 'password': 'pw'})
+        assert c.post('/api/blobs/docs/a.txt', data=b'x', headers=headers).status_code == 404
+        assert c.post('/api/blobs/../a.txt', data=b'x', headers=headers).status_code in (400, 404)
+        assert c.get('/api/blobs/%2E%2E').status_code == 400
+        assert c.get('/api/blobs/docs').get_json() == {'blobs': []}
+
+        c.post('/api/secrets/store', json={'app_name': 'docs', 'secret_text': 's', 'passphrase': 'pw'})
+        name = 'résumé "1".pdf'
+        assert c.post(f'/api/blobs/docs/{name}', data=b'x', headers=headers).status_code == 200
+        r = c.get(f'/api/blobs/docs/{name}', headers=headers)
+        assert r.data == b'x'
+        disposition = r.headers['Content-Disposition']
+        assert 'filename="rsum 1.pdf"' in disposition
+        assert "filename*=UTF-8''r%C3%A9sum%C3%A9%20%221%22.pdf" in disposition
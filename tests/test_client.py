@@ -0,0 +1,109 @@
+import io
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from lib import admission, client, crypto, tls
+
+
+def _serve(tmp_path, monkeypatch, tls_on):
+    from cryptography.fernet import Fernet
+    from werkzeug.serving import make_server
+    from web_server import app
+    monkeypatch.setenv('MASTER_KEY', Fernet.generate_key().decode('utf-8'))
+    monkeypatch.setattr(crypto, '_KDF_ITERATIONS', 1000)
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('db')
+    os.makedirs('server_state')
+    admission.controller.reset()
+    ssl_context, context = None, None
+    if tls_on:
+        cert, key = tls.ensure_certificate(str(tmp_path / 'tls'))
+        ssl_context, context = tls.context(cert, key), client.ssl_context(cert)
+    # the handler the server itself picks: werkzeug's own for plain HTTP
+    httpd = make_server('127.0.0.1', 0, app, threaded=True, ssl_context=ssl_context,
+                        request_handler=tls.request_handler(ssl_context))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    url = f"{'https' if tls_on else 'http'}://127.0.0.1:{httpd.server_port}"
+    with client.Client(url, context=context) as c:
+        c.request('POST', '/api/auth/register', {'username': 'dana', 'password': 'pw'})
+    return httpd, url, context
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    httpd, url, _ = _serve(tmp_path, monkeypatch, tls_on=False)
+    yield url
+    httpd.shutdown()
+
+
+@pytest.fixture
+def tls_server(tmp_path, monkeypatch):
+    httpd, url, context = _serve(tmp_path, monkeypatch, tls_on=True)
+    yield url, context
+    httpd.shutdown()
+
+
+def test_batch_reuses_session(server):
+    with client.Client(server, pool_size=3) as c:
+        c.login('dana', 'pw')
+        stores = [{'op': 'store', 'app_name': f'app{i}', 'secret': f's{i}'} for i in range(8)]
+        results = list(c.batch(stores, 'phrase', parallel=3))
+        assert [r['app_name'] for r in results] == [f'app{i}' for i in range(8)]
+        assert all(r['ok'] and r['version'] == 1 for r in results)
+
+        ops = [{'op': 'retrieve', 'app_name': 'app3'},
+               {'op': 'update', 'app_name': 'app3', 'value': 'new'},
+               {'op': 'retrieve', 'app_name': 'missing'},
+               {'op': 'store', 'app_name': 'app1', 'secret': 'x', 'version': -1}]
+        first, updated, missing, conflict = c.batch(ops, 'phrase', parallel=1)
+        assert first['secret'] == 's3'
+        assert updated['ok'] and updated['version'] == 2
+        assert (missing['ok'], missing['status']) == (False, 404)
+        assert (conflict['ok'], conflict['status']) == (False, 409)
+        assert c.retrieve('app3', 'phrase')['secret'] == 'new'
+
+
+def test_batch_reuses_connections_over_tls(tls_server):
+    url, context = tls_server
+    with client.Client(url, pool_size=3, context=context) as c:
+        c.login('dana', 'pw')
+        stores = [{'op': 'store', 'app_name': f'app{i}', 'secret': f's{i}'} for i in range(8)]
+        assert all(r['ok'] for r in c.batch(stores, 'phrase', parallel=3))
+        assert c.retrieve('app5', 'phrase')['secret'] == 's5'
+        # no more connections than requests in flight
+        assert c.connections_opened <= 3
+
+
+def test_requests_without_login_are_rejected(server):
+    with client.Client(server) as c:
+        with pytest.raises(client.ClientError) as e:
+            c.retrieve('app', 'phrase')
+        assert e.value.status == 401
+
+
+def test_read_ops():
+    lines = io.StringIO('# comment\nmail\n\n{"app_name": "bank", "op": "update", "value": 1}\n{bad\n')
+    ops = list(client.read_ops(lines, 'retrieve'))
+    assert ops[0] == {'app_name': 'mail', 'op': 'retrieve', 'line': 2}
+    assert ops[1] == {'app_name': 'bank', 'op': 'update', 'value': 1, 'line': 4}
+    assert ops[2]['line'] == 5 and 'op' not in ops[2]
+    result = client.Client().run(ops[2], 'phrase')
+    assert not result['ok'] and result['error'].startswith('Malformed JSON')
+
+
+def test_cli_batch_from_file(server, tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv('SECRET_SERVER_PASSWORD', 'pw')
+    monkeypatch.setenv('SECRET_SERVER_PASSPHRASE', 'phrase')
+    batch = tmp_path / 'ops.jsonl'
+    batch.write_text(json.dumps({'op': 'store', 'app_name': 'cli', 'secret': 'v'}) + '\n'
+                     + json.dumps({'op': 'retrieve', 'app_name': 'cli'}) + '\n')
+    assert client.main(['batch', str(batch), '--url', server, '--user', 'dana', '--parallel', '1']) == 0
+    out = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [r['op'] for r in out] == ['store', 'retrieve']
+    assert out[1]['secret'] == 'v'
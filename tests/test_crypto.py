@@ -24,3 +24,61 @@ def test_wrong_passphrase_fails():
     assert r.ok
     dec = crypto.decrypt_secret(str(r), 'bad')
     assert dec.ok is False
+
+
+def test_concurrent_shared_decrypts_run_one_kdf(monkeypatch):
+    import threading
+    enc = str(crypto.encrypt_secret('shared', 'pw', 1000))
+    derived = []
+    real = crypto._derive_key
+
+    def slow_derive(passphrase, salt, iterations=None):
+        derived.append(passphrase)
+        threading.Event().wait(0.2)
+        return real(passphrase, salt, iterations)
+
+    monkeypatch.setattr(crypto, '_derive_key', slow_derive)
+    before = crypto.coalescing_stats()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        crypto.decrypt_secret_shared(('u', 'app', 1), enc, 'pw', 1000))) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert [r.data for r in results] == [b'shared'] * 3
+    assert len(derived) == 1
+    assert crypto.coalescing_stats()['coalesced'] - before['coalesced'] == 2
+    # a different passphrase is never served another caller's result
+    assert not crypto.decrypt_secret_shared(('u', 'app', 1), enc, 'wrong', 1000).ok
+
+
+def test_shared_decrypt_never_returns_another_ciphertexts_plaintext(monkeypatch):
+    import threading
+    old, new = (str(crypto.encrypt_secret(text, 'pw', 1000)) for text in ('old', 'new'))
+    real = crypto._derive_key
+
+    def slow_derive(passphrase, salt, iterations=None):
+        threading.Event().wait(0.2)
+        return real(passphrase, salt, iterations)
+
+    monkeypatch.setattr(crypto, '_derive_key', slow_derive)
+    results = {}
+    # same key and passphrase, e.g. a secret rewritten without a version bump
+    threads = [threading.Thread(target=lambda enc=enc: results.__setitem__(
+        enc, crypto.decrypt_secret_shared(('u', 'app', 1), enc, 'pw', 1000))) for enc in (old, new)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert (results[old].data, results[new].data) == (b'old', b'new')
+
+
+def test_kdf_iterations_outside_window_are_rejected():
+    import pytest
+    assert crypto.iterations_from_method(None) == crypto._KDF_ITERATIONS
+    assert crypto.iterations_from_method('pbkdf2:sha256:200000') == 200000
+    for method in ('pbkdf2:sha256:0', 'pbkdf2:sha256:-5', 'pbkdf2:sha256:10',
+                   f'pbkdf2:sha256:{crypto.MAX_KDF_ITERATIONS + 1}', 'pbkdf2:sha256:1e9', 'scrypt:1'):
+        with pytest.raises(ValueError):
+            crypto.iterations_from_method(method)
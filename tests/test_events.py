@@ -0,0 +1,82 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from lib import events, storage
+
+
+@pytest.fixture(autouse=True)
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, 'DB_DIR', str(tmp_path / 'db'))
+
+
+def _payload():
+    return {'app_username': 'me', 'password': 'x', 'method': 'pbkdf2-sha256:1000'}
+
+
+def test_writes_reach_only_the_owners_subscriptions():
+    mine, other = events.subscribe('erin'), events.subscribe('frank')
+    try:
+        storage.store_payload('erin', 'mail', None, _payload())
+        storage.store_payload('erin', 'mail', None, _payload())
+        changes = mine.wait(0.1)
+        assert [(e['type'], e['name'], e['version']) for e in changes] == [
+            ('created', 'mail', 1), ('updated', 'mail', 2)]
+        assert other.wait(0.01) == []
+    finally:
+        mine.close()
+        other.close()
+    assert events.subscriber_count() == 0
+
+
+def test_slow_client_gets_one_resync_instead_of_a_backlog():
+    sub = events.Subscription('erin', buffer_size=3)
+    for i in range(10):
+        sub.push({'id': i, 'type': 'updated', 'name': 'a', 'version': i, 'time': 0})
+    assert sub.wait(0.01) == [{'type': 'resync'}]
+    sub.push({'id': 11, 'type': 'updated', 'name': 'a', 'version': 11, 'time': 0})
+    assert [e['id'] for e in sub.wait(0.01)] == [11]
+
+
+def test_subscriptions_per_user_are_bounded(monkeypatch):
+    monkeypatch.setattr(events, 'MAX_SUBSCRIBERS', 2)
+    subs = [events.subscribe('erin'), events.subscribe('erin')]
+    with pytest.raises(events.TooManySubscribers):
+        events.subscribe('erin')
+    for sub in subs:
+        sub.close()
+
+
+def test_stream_sends_heartbeats_and_framed_changes():
+    sub = events.subscribe('erin')
+    body = events.stream(sub, heartbeat=0.01)
+    assert next(body).startswith('retry: ')
+    assert next(body) == ': heartbeat\n\n'
+    events.publish('erin', 'updated', 'bank', 4)
+    frame = next(body)
+    assert frame.startswith('id: ') and '\nevent: change\n' in frame
+    data = json.loads(frame.split('data: ', 1)[1])
+    assert (data['type'], data['name'], data['version']) == ('updated', 'bank', 4)
+    body.close()
+    assert events.subscriber_count('erin') == 0
+
+
+def test_events_endpoint(tmp_path, monkeypatch):
+    from web_server import app
+    monkeypatch.chdir(tmp_path)
+    app.config['TESTING'] = True
+    with app.test_client() as c:
+        assert c.get('/api/events').status_code == 401
+        with c.session_transaction() as s:
+            s['username'] = 'erin'
+        r = c.get('/api/events', buffered=False)
+        assert r.status_code == 200 and r.mimetype == 'text/event-stream'
+        body = iter(r.response)
+        assert b'event: ready' in next(body)
+        storage.store_payload('erin', 'wifi', None, _payload())
+        assert b'"name": "wifi"' in next(body)
+        r.close()
+    assert events.subscriber_count('erin') == 0
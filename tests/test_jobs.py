@@ -0,0 +1,125 @@
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from lib import crypto, jobs
+
+
+@pytest.fixture
+def handlers(monkeypatch):
+    # register the real handlers first, so a module first imported under the
+    # stand-in registry doesn't lose its handler for later tests
+    from lib import importer, migrate, sync  # noqa: F401
+    registry = {}
+    monkeypatch.setattr(jobs, '_handlers', registry)
+    return registry
+
+
+def test_jobs_run_in_background_and_persist(tmp_path, handlers):
+    def add(job, a, b, token):
+        job.update(step=1)
+        return {'sum': a + b, 'token_seen': token == 's3cret'}
+    handlers['add'] = add
+
+    q = jobs.JobQueue(str(tmp_path))
+    job = q.submit('add', 'amy', {'a': 1, 'b': 2}, {'token': 's3cret'})
+    assert q.wait(5)
+    assert (job.state, job.result, job.progress) == ('done', {'sum': 3, 'token_seen': True}, {'step': 1})
+
+    with open(tmp_path / f'{job.id}.json') as f:
+        saved = json.load(f)
+    assert saved['result'] == {'sum': 3, 'token_seen': True}
+    assert 's3cret' not in json.dumps(saved)
+
+    failed = q.submit('missing', 'amy')
+    q.wait(5)
+    assert failed.state == 'failed' and 'missing' in failed.error
+    assert [j.id for j in q.list('amy')] == [failed.id, job.id]
+    assert q.list('bob') == []
+
+
+def test_restart_requeues_only_jobs_without_secrets(tmp_path, handlers):
+    handlers['echo'] = lambda job, value: value
+    spool = tmp_path / 'upload.spool'
+    spool.write_bytes(b'ciphertext')
+    q = jobs.JobQueue(str(tmp_path), workers=0)
+    plain = q.submit('echo', 'amy', {'value': 42})
+    secret = q.submit('echo', 'amy', {'value': 1}, {'passphrase': 'pp'}, files=[str(spool)])
+
+    restarted = jobs.JobQueue(str(tmp_path))
+    assert restarted.get(secret.id).state == 'interrupted'
+    assert not spool.exists()
+    assert restarted.wait(5)
+    assert (restarted.get(plain.id).state, restarted.get(plain.id).result) == ('done', 42)
+
+
+
+def test_start_up_resumes_jobs_before_the_api_is_used(tmp_path, monkeypatch, handlers):
+    from web_server import resume_jobs
+    handlers['echo'] = lambda job, value: value
+    q = jobs.JobQueue(str(tmp_path), workers=0)
+    job = q.submit('echo', 'amy', {'value': 7})
+
+    monkeypatch.setattr(jobs, '_default', jobs.JobQueue(str(tmp_path)))
+    assert resume_jobs().wait(5)
+    with open(tmp_path / f'{job.id}.json') as f:
+        saved = json.load(f)
+    assert (saved['state'], saved['result']) == ('done', 7)
+
+def test_cancel_queued_and_running_jobs(tmp_path, handlers):
+    started, release = threading.Event(), threading.Event()
+
+    def slow(job):
+        started.set()
+        while not release.wait(0.01):
+            job.check_cancelled()
+    handlers['slow'] = slow
+
+    q = jobs.JobQueue(str(tmp_path), workers=1, max_pending=1)
+    running = q.submit('slow', 'amy')
+    assert started.wait(5)
+    waiting = q.submit('slow', 'amy')
+    with pytest.raises(jobs.QueueFull):
+        q.submit('slow', 'amy')
+
+    assert q.cancel(waiting.id).state == 'cancelled'
+    q.cancel(running.id)
+    assert q.wait(5)
+    assert running.state == 'cancelled'
+
+
+def test_async_import_returns_202_and_job_result(tmp_path, monkeypatch):
+    from cryptography.fernet import Fernet
+    from lib import admission
+    from web_server import app
+    monkeypatch.setenv('MASTER_KEY', Fernet.generate_key().decode('utf-8'))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(crypto, '_KDF_ITERATIONS', 1000)
+    monkeypatch.setattr(jobs, '_default', jobs.JobQueue(str(tmp_path / 'jobs')))
+    admission.controller.reset()
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        client.post('/api/auth/register', json={'username': 'amy', 'password': 'pw'})
+        r = client.post('/api/secrets/import', data=b'name,username,password\nGitHub,amy,gh-pass\n',
+                        headers={'X-Passphrase': 'pp', 'Prefer': 'respond-async'})
+        assert r.status_code == 202
+        job_id = r.get_json()['id']
+        assert r.headers['Location'] == f'/api/jobs/{job_id}'
+
+        assert jobs.get_queue().wait(10)
+        r = client.get(f'/api/jobs/{job_id}/result')
+        assert r.status_code == 200
+        assert r.get_json()['result']['imported'] == 1
+        # the spooled upload is gone once the job has finished
+        assert [n for n in os.listdir(tmp_path / 'jobs') if n.endswith('.spool')] == []
+
+        r = client.post('/api/secrets/retrieve', json={'app_name': 'GitHub', 'passphrase': 'pp'})
+        assert r.get_json()['secret'] == 'gh-pass'
+
+        client.post('/api/auth/logout')
+        client.post('/api/auth/register', json={'username': 'bob', 'password': 'pw'})
+        assert client.get(f'/api/jobs/{job_id}').status_code == 404
@@ -0,0 +1,172 @@
+import json
+import os
+import sys
+import pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from lib import crypto, migrate, session_store
+
+
+@pytest.fixture
+def state(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv('MASTER_KEY', raising=False)
+    monkeypatch.delenv('MASTER_KEY_PREVIOUS', raising=False)
+    monkeypatch.setattr(session_store, 'KEY_CHECK_INTERVAL', 0.0)
+    os.makedirs(session_store.SESSIONS_DIR)
+    session_store._reload_keys()
+    yield tmp_path
+    session_store._reload_keys()
+
+
+def test_master_key_rotation_keeps_sessions_readable(state):
+    for i in range(3):
+        session_store.save_session_credentials(f's{i}', 'bob', f'pw{i}')
+    with open(session_store.MASTER_KEY_FILE, 'rb') as f:
+        old_key = f.read()
+
+    job = migrate.MasterKeyRotation(rate=0)
+    job.run()
+
+    assert job.progress()['state'] == 'done'
+    assert job.done == 3
+    with open(session_store.MASTER_KEY_FILE, 'rb') as f:
+        assert f.read() != old_key
+    assert not os.path.exists(session_store.PREVIOUS_KEY_FILE)
+    assert not session_store.rotating()
+    assert [session_store.get_session_password(f's{i}') for i in range(3)] == ['pw0', 'pw1', 'pw2']
+
+
+def test_rotation_by_another_worker_is_picked_up(state):
+    from cryptography.fernet import Fernet
+    session_store.save_session_credentials('s0', 'bob', 'pw0')
+    # another process rotates: it writes the key files, this one never reloads
+    with open(session_store.MASTER_KEY_FILE, 'rb') as f:
+        old_key = f.read()
+    new_key = Fernet.generate_key()
+    session_store._write_key_file(session_store.PREVIOUS_KEY_FILE, old_key)
+    session_store._write_key_file(session_store.MASTER_KEY_FILE, new_key)
+
+    session_store.save_session_credentials('s1', 'bob', 'pw1')
+    with open(os.path.join(session_store.SESSIONS_DIR, 's1.json')) as f:
+        token = json.load(f)['encrypted_password']
+    assert Fernet(new_key).decrypt(token.encode('utf-8')) == b'pw1'
+    assert session_store.get_session_password('s0') == 'pw0'
+
+    session_store.reencrypt_session_file(os.path.join(session_store.SESSIONS_DIR, 's0.json'))
+    os.remove(session_store.PREVIOUS_KEY_FILE)
+    assert not session_store.rotating()
+    assert [session_store.get_session_password(f's{i}') for i in range(2)] == ['pw0', 'pw1']
+
+
+def test_migration_hooks_are_abstract():
+    with pytest.raises(TypeError):
+        migrate.Migration()
+
+
+def test_rotation_resumes_from_checkpoint(state):
+    for i in range(3):
+        session_store.save_session_credentials(f's{i}', 'bob', f'pw{i}')
+    session_store.rotate_master_key()
+    first = sorted(os.listdir(session_store.SESSIONS_DIR))[0]
+    session_store.reencrypt_session_file(os.path.join(session_store.SESSIONS_DIR, first))
+    os.makedirs(migrate.MIGRATIONS_DIR)
+    with open(os.path.join(migrate.MIGRATIONS_DIR, 'master-key-rotation.json'), 'w') as f:
+        json.dump({'state': 'stopped', 'cursor': os.path.join(session_store.SESSIONS_DIR, first), 'done': 1}, f)
+
+    job = migrate.MasterKeyRotation(rate=0)
+    job.run()
+    # the checkpointed session is not visited again
+    assert job.done == 3
+    assert job.skipped == 0
+    assert not session_store.rotating()
+    assert [session_store.get_session_password(f's{i}') for i in range(3)] == ['pw0', 'pw1', 'pw2']
+
+
+def test_rotation_job_resumes_after_restart(state, monkeypatch):
+    from lib import jobs
+    for i in range(3):
+        session_store.save_session_credentials(f's{i}', 'bob', f'pw{i}')
+    # the server goes down before a worker picks the job up
+    monkeypatch.setattr(jobs, '_default', jobs.JobQueue(str(state / 'jobs'), workers=0))
+    job = migrate.start_rotation(rate=0)
+    assert migrate.start_rotation(rate=0).id == job.id
+    assert migrate.progress(migrate.MasterKeyRotation.name)['state'] == 'queued'
+
+    monkeypatch.setattr(jobs, '_default', jobs.JobQueue(str(state / 'jobs')))
+    restarted = jobs.start()
+    assert restarted.wait(5)
+    assert restarted.get(job.id).state == 'done'
+    assert migrate.progress(migrate.MasterKeyRotation.name)['state'] == 'done'
+    assert not session_store.rotating()
+    assert [session_store.get_session_password(f's{i}') for i in range(3)] == ['pw0', 'pw1', 'pw2']
+
+
+def test_secret_reencryption_upgrades_kdf_parameters(state, monkeypatch):
+    app_dir = os.path.join('db', 'carol', 'mail')
+    os.makedirs(app_dir)
+    old = crypto.encrypt_secret('top', 'pp', iterations=2000)
+    with open(os.path.join(app_dir, 'secret.json'), 'w') as f:
+        json.dump({'app_username': 'c', 'password': str(old), 'method': crypto.kdf_method(2000)}, f)
+    monkeypatch.setattr(crypto, '_KDF_ITERATIONS', 1000)
+    monkeypatch.setattr(crypto, 'MIN_KDF_ITERATIONS', 1000)    # toy counts stand in for real ones
+
+    job = migrate.SecretReencryption('carol', 'pp', rate=0)
+    job.run()
+
+    assert job.progress()['done'] == 1
+    with open(os.path.join(app_dir, 'secret.json')) as f:
+        payload = json.load(f)
+    assert payload['method'] == 'pbkdf2:sha256:1000'
+    assert payload['app_username'] == 'c'
+    assert crypto.decrypt_secret(payload['password'], 'pp', 1000).data == b'top'
+    assert job._passphrase is None
+
+
+def test_failed_rotation_can_be_retried_or_forced(state):
+    for i in range(2):
+        session_store.save_session_credentials(f's{i}', 'bob', f'pw{i}')
+    corrupt = os.path.join(session_store.SESSIONS_DIR, 'bad.json')
+    with open(corrupt, 'w') as f:
+        json.dump({'username': 'eve', 'encrypted_password': 'not-a-token'}, f)
+
+    job = migrate.MasterKeyRotation(rate=0)
+    job.run()
+    assert job.progress()['state'] == 'failed'
+    assert job.failed_items == [corrupt]
+    assert session_store.rotating()
+
+    # a new run continues the same rotation instead of refusing to start
+    retry = migrate.MasterKeyRotation(rate=0)
+    retry.run()
+    assert retry.progress()['state'] == 'failed'
+    assert (retry.done, retry.skipped) == (0, 2)
+
+    forced = migrate.MasterKeyRotation(rate=0, force=True)
+    forced.run()
+    assert forced.progress()['state'] == 'done'
+    assert not os.path.exists(corrupt)
+    assert not session_store.rotating()
+    assert [session_store.get_session_password(f's{i}') for i in range(2)] == ['pw0', 'pw1']
+
+
+def test_parse_rate_validates_and_clamps():
+    assert migrate.parse_rate(None) == migrate.DEFAULT_RATE
+    assert migrate.parse_rate('5') == 5.0
+    assert migrate.parse_rate(0) == migrate.MIN_RATE
+    assert migrate.parse_rate(-3) == migrate.MIN_RATE
+    assert migrate.parse_rate(1e9) == migrate.MAX_RATE
+    for bad in ('fast', True, float('nan'), [1]):
+        with pytest.raises((TypeError, ValueError)):
+            migrate.parse_rate(bad)
+
+
+def test_reencrypt_route_rejects_invalid_rate(state):
+    from web_server import app
+    app.config['TESTING'] = True
+    with app.test_client() as c:
+        with c.session_transaction() as s:
+            s['username'] = 'carol'
+        r = c.post('/api/secrets/reencrypt', json={'passphrase': 'pp', 'rate': 'fast'})
+        assert r.status_code == 400
+        r = c.post('/api/maintenance/rotate-master-key', json={'rate': {}})
+        assert r.status_code == 400
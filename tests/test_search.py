@@ -0,0 +1,102 @@
+import json
+import os
+import sys
+import threading
+
+import pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from lib import search, storage
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    search.reset()
+    yield tmp_path
+    search.reset()
+
+
+def test_index_is_built_from_disk_then_updated_on_store(db):
+    os.makedirs(os.path.join('db', 'amy', 'github'))
+    with open(os.path.join('db', 'amy', 'github', 'secret.json'), 'w') as f:
+        json.dump({'app_username': 'amy@example.com', 'password': 'x'}, f)
+
+    assert [r['name'] for r in search.search('amy', 'git')] == ['github']
+
+    storage.store_payload('amy', 'gitlab', None, {'app_username': 'amy', 'password': 'x'})
+    assert sorted(r['name'] for r in search.search('amy', 'git')) == ['github', 'gitlab']
+
+    # re-storing with a new username replaces the old index entry
+    storage.store_payload('amy', 'gitlab', None, {'app_username': 'work@corp', 'password': 'x'})
+    assert [r['name'] for r in search.search('amy', 'work')] == ['gitlab']
+    assert search.search('amy', 'amy@')[0]['name'] == 'github'
+    assert search.search('bob', 'git') == []
+
+
+def test_ranking_prefix_fuzzy_and_limit(db):
+    index = search.get_index('amy')
+    for name in ('Mail', 'Mailchimp', 'Gmail', 'Bank', 'Mastodon'):
+        index.put(name, '', 0.0)
+    names = [r['name'] for r in index.search('mail')]
+    assert names[:3] == ['Mail', 'Mailchimp', 'Gmail']
+    assert 'Bank' not in names
+
+    # typo still finds the app
+    assert index.search('mastdon')[0]['name'] == 'Mastodon'
+    assert index.search('mastdon', fuzzy=False) == []
+    assert len(index.search('ma', limit=2)) == 2
+
+
+def test_search_scales_to_many_entries(db):
+    index = search.get_index('amy')
+    for i in range(10_000):
+        index.put(f'app{i:05d}', f'user{i}@example.com', 0.0)
+    results = index.search('app0999', limit=5)
+    assert [r['name'] for r in results][:1] == ['app09990']
+    assert len(results) == 5
+
+
+class _CountingList(list):
+    reads = 0
+
+    def __getitem__(self, i):
+        _CountingList.reads += 1
+        return super().__getitem__(i)
+
+
+def test_common_prefix_walk_is_bounded_and_ranked(db):
+    index = search.get_index('amy')
+    for i in range(10_000):
+        index.put(f'app{i:05d}', f'user{i}@example.com', 0.0)
+    # sorts after every 'user<digit>...' key but is the shortest match
+    index.put('zz', 'user@x.io', 0.0)
+    index.put('user', '', 0.0)
+    for length, keys in index._keys['user'].items():
+        index._keys['user'][length] = _CountingList(keys)
+
+    _CountingList.reads = 0
+    results = index.search('user', limit=5)
+    assert [r['name'] for r in results[:2]] == ['user', 'zz']
+    assert len(results) == 5 and all(r['score'] >= search._USER_PREFIX for r in results[1:])
+    # every one of the 10k usernames matches; the walk visits a handful
+    assert _CountingList.reads < 200
+
+
+def test_store_during_index_build_is_not_lost(db, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+    build = search._build
+
+    def slow_build(username):
+        index = build(username)
+        started.set()
+        release.wait(5)
+        return index
+    monkeypatch.setattr(search, '_build', slow_build)
+    querying = threading.Thread(target=search.get_index, args=('amy',))
+    querying.start()
+    started.wait(5)
+    # the listener must not block behind the scan
+    storage.store_payload('amy', 'bank', None, {'app_username': 'amy', 'password': 'x'})
+    release.set()
+    querying.join(5)
+    assert [r['name'] for r in search.search('amy', 'bank')] == ['bank']
@@ -0,0 +1,133 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from lib import admission, network, shared_state
+
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def test_set_get_delete_and_expiry(tmp_path, monkeypatch):
+    table = shared_state.SharedTable(str(tmp_path / 't.tbl'), slots=8, slot_size=64)
+    table.set('a', {'x': 1})
+    table.set('b', [1, 2])
+    table.set('a', {'x': 2})
+    assert table.get('a') == {'x': 2} and table.get('b') == [1, 2] and table.get('c', 'none') == 'none'
+    assert table.delete('b') and not table.delete('b')
+    assert table.get('b') is None
+
+    table.set('gone', 1, ttl=-1)
+    assert table.get('gone') is None
+    assert table.items() == [('a', {'x': 2})]
+
+    # at most MAX_LOAD of the slots hold entries
+    for i in range(5):
+        table.set(f'k{i}', i)
+    with pytest.raises(shared_state.SharedTableFull):
+        table.set('one-too-many', 0)
+    with pytest.raises(ValueError):
+        table.set('big', 'x' * 64)
+
+    # a second handle sees the same data and keeps the file's geometry
+    other = shared_state.SharedTable(str(tmp_path / 't.tbl'))
+    assert (other.slots, other.get('k4')) == (8, 4)
+
+
+def test_tombstones_and_expired_entries_are_compacted(tmp_path):
+    table = shared_state.SharedTable(str(tmp_path / 't.tbl'), slots=64, slot_size=64)
+    table.set('keep', 1)
+    for i in range(1000):
+        table.set(f'user:{i}', i, ttl=-1 if i % 2 else None)
+        if not i % 2:
+            table.delete(f'user:{i}')
+    assert table.get('keep') == 1 and table.items() == [('keep', 1)]
+    # slots went back to EMPTY, so a miss ends after a short probe
+    assert table._in_use() <= table.max_in_use
+    empty = sum(1 for i in range(table.slots) if table._read_slot(i)[4] == shared_state._EMPTY)
+    assert empty >= table.slots - table.max_in_use
+
+
+def test_full_shared_admission_table_fails_closed(tmp_path):
+    table = shared_state.SharedTable(str(tmp_path / 't.tbl'), slots=8, slot_size=128)
+    workers = admission.SharedAdmissionController(table)
+    for i in range(table.max_in_use):
+        table.set(f'other:{i}', i)
+    assert workers.admit('10.0.0.9', 'amy') > 0
+    assert workers.rejected == 1
+    table.delete('other:0')
+    table.delete('other:1')
+    assert workers.admit('10.0.0.9', 'amy') == 0
+
+
+def test_refused_shared_admission_charges_neither_bucket(tmp_path):
+    table = shared_state.SharedTable(str(tmp_path / 't.tbl'), slots=8, slot_size=128)
+    workers = admission.SharedAdmissionController(table)
+    assert workers.admit('10.0.0.9', None) == 0
+    for i in range(table.max_in_use - 1):
+        table.set(f'other:{i}', i)
+    # the IP bucket exists, the new username bucket has no room
+    assert workers.admit('10.0.0.9', 'amy') == admission.FULL_RETRY_AFTER
+    assert table.get('admission:ip:10.0.0.9')[0] == pytest.approx(admission.IP_BURST - 1, abs=0.1)
+    assert table.get('admission:user:amy') is None
+
+
+def test_readers_in_other_processes_never_see_torn_writes(tmp_path):
+    path = str(tmp_path / 't.tbl')
+    table = shared_state.SharedTable(path, slots=16)
+    table.set('pair', [0, 0])
+    writer = textwrap.dedent(f"""
+        from lib import shared_state
+        table = shared_state.SharedTable({path!r})
+        for i in range(1, 5001):
+            table.set('pair', [i, 'x' * (i % 50), i])
+    """)
+    proc = subprocess.Popen([sys.executable, '-c', writer], cwd=PROJECT_DIR)
+    seen = set()
+    while proc.poll() is None:
+        value = table.get('pair')
+        assert value[0] == value[-1]
+        seen.add(value[0])
+    assert proc.returncode == 0
+    assert table.get('pair')[0] == 5000
+    assert len(seen) > 1
+
+
+def test_admission_buckets_are_shared_between_workers(tmp_path):
+    path = str(tmp_path / 't.tbl')
+    now = [0.0]
+    workers = [admission.SharedAdmissionController(shared_state.SharedTable(path), ip_burst=3,
+                                                   user_burst=100, clock=lambda: now[0])
+               for _ in range(2)]
+    assert [workers[i % 2].admit('10.0.0.9', None) for i in range(3)] == [0, 0, 0]
+    assert workers[0].admit('10.0.0.9', None) > 0
+    assert workers[1].admit('10.0.0.9', None) > 0
+
+    for _ in range(admission.LOCKOUT_THRESHOLD):
+        workers[0].record_failure(None, 'amy')
+    assert workers[1].admit(None, 'amy') > 0
+    workers[1].record_success('amy')
+    assert workers[0].admit(None, 'amy') == 0
+    assert len(workers[0]) == 2
+    workers[1].reset()
+    assert len(workers[0]) == 0
+
+
+def test_network_snapshot_is_published_once_for_all_workers(tmp_path, monkeypatch):
+    monkeypatch.setenv('SHARED_STATE', str(tmp_path / 't.tbl'))
+    monkeypatch.setattr(shared_state, '_table', None)
+    monkeypatch.setattr(network, '_hotspot_cache', None)
+    calls = []
+    monkeypatch.setattr(network, 'get_hotspot_info', lambda: calls.append(1) or ('192.168.43.0/24', '192.168.43.1', 'wlan0'))
+    monkeypatch.setattr(network, 'get_connected_peers', lambda: calls.append(2) or {'192.168.50.7'})
+
+    assert network.is_ip_in_hotspot_subnet('192.168.43.20')
+    # another worker: empty local cache, but the shared snapshot is fresh
+    monkeypatch.setattr(network, '_hotspot_cache', None)
+    assert network.is_ip_in_hotspot_subnet('192.168.43.20')
+    assert network.is_connected_peer('192.168.50.7')
+    assert not network.is_connected_peer('192.168.50.8')
+    assert calls == [1, 2]
@@ -0,0 +1,53 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from lib import snapshot
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def test_incremental_snapshot_only_stores_changes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _write('db/alice/mail/secret.json', b'{"a": 1}')
+    _write('db/bob/bank/secret.json', b'{"b": 2}')
+    _write('server_state/master.key', b'k' * 44)
+    repo = snapshot.Repository()
+
+    first = repo.create()
+    assert first['stats']['hashed'] == 3
+
+    _write('db/alice/mail/secret.json', b'{"a": 2}')
+    second = repo.create()
+    assert second['stats']['unchanged'] == 2
+    assert second['stats']['hashed'] == 1
+    assert second['stats']['new_chunks'] == 1
+
+    third = repo.create()
+    assert third['stats']['new_chunks'] == 0
+    assert repo.list() == sorted([first['id'], second['id'], third['id']])
+
+
+def test_restore_single_user_from_older_snapshot(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(snapshot, 'CHUNK_SIZE', 1024)
+    big = os.urandom(5000)
+    _write('db/alice/mail/secret.json', b'old')
+    _write('db/alice/docs/blobs/scan.blob', big)
+    _write('db/bob/bank/secret.json', b'bob')
+    repo = snapshot.Repository()
+    snap = repo.create()['id']
+    _write('db/alice/mail/secret.json', b'new')
+    repo.create()
+
+    restored = repo.restore(snap, 'out', snapshot.restore_prefix('alice'))
+    assert sorted(restored) == sorted([os.path.join('out', 'db', 'alice', 'mail', 'secret.json'),
+                                       os.path.join('out', 'db', 'alice', 'docs', 'blobs', 'scan.blob')])
+    with open(os.path.join('out', 'db', 'alice', 'mail', 'secret.json'), 'rb') as f:
+        assert f.read() == b'old'
+    with open(os.path.join('out', 'db', 'alice', 'docs', 'blobs', 'scan.blob'), 'rb') as f:
+        assert f.read() == big
+    assert not os.path.exists(os.path.join('out', 'db', 'bob'))
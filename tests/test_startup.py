@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+
+import pytest
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+from lib import network, session_store, startup
+
+
+def test_importing_server_has_no_filesystem_side_effects(tmp_path):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    subprocess.run([sys.executable, '-c', 'import web_server, lib.session_store'],
+                   cwd=str(tmp_path), env=env, check=True)
+    assert os.listdir(str(tmp_path)) == []
+
+
+@pytest.fixture(autouse=True)
+def restore_module_state(monkeypatch):
+    # warmers and refresh_snapshot() fill these module-level caches; recording
+    # them here makes monkeypatch put the originals back afterwards
+    monkeypatch.setattr(network, '_hotspot_cache', None)
+    monkeypatch.setattr(session_store, '_fernet', None)
+    monkeypatch.setattr(session_store, '_fernets', [])
+
+
+def test_warmers_report_results(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('MASTER_KEY', 'x' * 43 + '=')
+    os.makedirs(os.path.join('db', 'amy', 'mail'))
+    with open(os.path.join('db', 'amy', 'mail', 'secret.json'), 'w') as f:
+        f.write('{}')
+    monkeypatch.setattr(network, 'get_hotspot_info', lambda: ('10.0.0.0/24', '10.0.0.1', 'wlan0'))
+
+    results = {r['name']: r for r in startup.run_warmers()}
+    assert results['user_index']['result'] == 1
+    assert results['static']['result'] > 0
+    assert results['network']['error'] is None
+
+
+def test_hotspot_info_is_cached(monkeypatch):
+    calls = []
+    monkeypatch.setattr(network, 'get_hotspot_info', lambda: calls.append(1) or ('10.0.0.0/24', '10.0.0.1', 'wlan0'))
+    network.refresh_snapshot()
+    assert network.is_ip_in_hotspot_subnet('10.0.0.7')
+    assert not network.is_ip_in_hotspot_subnet('10.9.0.7')
+    assert len(calls) == 1
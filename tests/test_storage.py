@@ -0,0 +1,126 @@
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from lib import storage
+from lib.locks import KeyedLocks, SingleFlight
+
+
+def test_store_payload_versions_and_conditional_writes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storage.store_payload('u', 'a', None, {'password': 'x'}, expected_version=-1)
+    storage.store_payload('u', 'a', None, {'password': 'y'}, expected_version=1)
+    with pytest.raises(storage.VersionConflict) as exc:
+        storage.store_payload('u', 'a', None, {'password': 'z'}, expected_version=1)
+    assert exc.value.current == 2
+    data, _ = storage.retrieve_latest_payload('u', 'a', None)
+    assert json.loads(data) == {'password': 'y', 'version': 2}
+
+    # a rejected write to a missing secret leaves no empty app directory behind
+    with pytest.raises(storage.VersionConflict):
+        storage.store_payload('u', 'b', None, {'password': 'x'}, expected_version=3)
+    assert sorted(os.listdir(os.path.join('db', 'u'))) == ['a']
+
+
+def test_concurrent_writes_to_one_secret_are_not_lost(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    threads = [threading.Thread(target=storage.store_payload, args=('u', 'a', None, {'password': str(i)}))
+               for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert storage.current_version('u', 'a') == 20
+    assert len(storage._locks) == 0
+
+
+def test_keyed_locks_do_not_block_other_keys():
+    locks = KeyedLocks()
+    entered = threading.Event()
+
+    def other():
+        with locks.hold(('u', 'b')):
+            entered.set()
+
+    with locks.hold(('u', 'a')):
+        t = threading.Thread(target=other)
+        t.start()
+        assert entered.wait(2)
+    t.join()
+    assert len(locks) == 0
+
+
+def test_single_flight_shares_one_call_and_keeps_nothing():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def slow():
+        calls.append(1)
+        release.wait(2)
+        return 'value'
+
+    def caller():
+        results.append(flights.do('k', slow))
+
+    threads = [threading.Thread(target=caller) for _ in range(4)]
+    for t in threads:
+        t.start()
+    deadline = time.monotonic() + 2
+    while flights.stats()['coalesced'] < 3 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    release.set()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert sorted(results) == [('value', False)] + [('value', True)] * 3
+    assert len(flights) == 0
+    # a later call runs again rather than reusing the finished result
+    assert flights.do('k', lambda: 'fresh') == ('fresh', False)
+    assert flights.stats() == {'executed': 2, 'coalesced': 3, 'in_flight': 0, 'hit_rate': 0.6}
+
+
+def test_single_flight_shares_exceptions():
+    flights = SingleFlight()
+    with pytest.raises(ValueError):
+        flights.do('k', lambda: (_ for _ in ()).throw(ValueError('boom')))
+    assert len(flights) == 0
+
+
+def test_changed_since_reports_deltas_and_imported_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storage.store_payload('u', 'a', None, {'password': 'x', 'app_username': 'amy'})
+    changes, removed, count = storage.changed_since('u', 0)
+    assert count == 1 and removed == [] and changes[0] == dict(changes[0], name='a', app_username='amy', version=1)
+
+    since = time.time()
+    filename = storage.store_payload('u', 'b', None, {'password': 'y'})
+    # sync backdates the mtime of imported files; they still count as changed
+    os.utime(filename, (since - 3600, since - 3600))
+    changes, _, count = storage.changed_since('u', since)
+    assert [c['name'] for c in changes] == ['b'] and count == 2
+    assert changes[0]['modified'] == since - 3600
+    assert storage.changed_since('nobody', 0) == ([], [], 0)
+
+
+def test_changed_since_reports_removed_apps_until_stored_again(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storage.store_payload('u', 'a', None, {'password': 'x'})
+    storage.store_payload('u', 'b', None, {'password': 'y'})
+    assert storage.changed_since('u', 0)[1] == []
+
+    since = time.time()
+    shutil.rmtree(os.path.join(storage.DB_DIR, 'u', 'a'))
+    changes, removed, count = storage.changed_since('u', since)
+    assert (changes, removed, count) == ([], ['a'], 1)
+    # still reported to a client that syncs later from the same point
+    assert storage.changed_since('u', since)[1] == ['a']
+
+    storage.store_payload('u', 'a', None, {'password': 'z'})
+    changes, removed, count = storage.changed_since('u', since)
+    assert [c['name'] for c in changes] == ['a'] and removed == [] and count == 2
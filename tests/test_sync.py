@@ -0,0 +1,163 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import pytest
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+from lib import sync
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _start_instance(workdir):
+    port = _free_port()
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.pop('MASTER_KEY', None)
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, 'web_server.py'), '--host', '127.0.0.1',
+                             '--port', str(port), '--no-debug'],
+                            cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            return proc, url
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    pytest.fail('server did not start')
+
+
+@pytest.fixture
+def peers(tmp_path):
+    procs = []
+    urls = []
+    for name in ('a', 'b'):
+        workdir = tmp_path / name
+        workdir.mkdir()
+        proc, url = _start_instance(str(workdir))
+        procs.append(proc)
+        urls.append(url)
+    yield urls
+    for proc in procs:
+        proc.terminate()
+        proc.wait(5)
+
+
+def _client(url):
+    c = sync.PeerClient(url)
+    c._call('POST', '/api/auth/register', {'username': 'sam', 'password': 'pw'})
+    return c
+
+
+def test_plan_prefers_higher_version_then_mtime():
+    local = {'root': 'x', 'apps': {'a': {'hash': '1', 'version': 2, 'modified': 1.0},
+                                   'b': {'hash': '2', 'version': 0, 'modified': 5.0},
+                                   'c': {'hash': '3', 'version': 0, 'modified': 1.0}}}
+    remote = {'root': 'y', 'apps': {'a': {'hash': '9', 'version': 1, 'modified': 9.0},
+                                    'b': {'hash': '8', 'version': 0, 'modified': 6.0},
+                                    'd': {'hash': '4', 'version': 0, 'modified': 1.0}}}
+    assert sync.plan(local, remote) == (['b', 'd'], ['a', 'c'])
+
+
+def _side(tmp_path, monkeypatch, name):
+    from lib import storage
+    root = str(tmp_path / name)
+    monkeypatch.setattr(sync, 'DB_DIR', root)
+    monkeypatch.setattr(storage, 'DB_DIR', root)
+
+
+def _write_raw(tmp_path, side, app, payload, mtime):
+    app_dir = tmp_path / side / 'sam' / app
+    app_dir.mkdir(parents=True)
+    path = app_dir / 'secret.json'
+    path.write_text(json.dumps(payload))
+    os.utime(path, (mtime, mtime))
+
+
+def test_unversioned_payload_converges(tmp_path, monkeypatch):
+    # a legacy payload (no "version" field) exists only on side a
+    _write_raw(tmp_path, 'a', 'old', {'app_username': 'u', 'password': 'c2VjcmV0'}, 1000.0)
+    _side(tmp_path, monkeypatch, 'a')
+    local = sync.summary('sam')
+    exported = sync.export_payloads('sam', ['old'])
+
+    _side(tmp_path, monkeypatch, 'b')
+    assert sync.import_payloads('sam', exported) == ['old']
+    remote = sync.summary('sam')
+    assert remote['root'] == local['root']
+    assert sync.plan(local, remote) == ([], [])
+
+
+def test_equal_version_and_mtime_resolve_deterministically(tmp_path, monkeypatch):
+    _write_raw(tmp_path, 'a', 'x', {'password': 'YQ==', 'version': 3}, 1000.0)
+    _write_raw(tmp_path, 'b', 'x', {'password': 'Yg==', 'version': 3}, 1000.0)
+    _side(tmp_path, monkeypatch, 'a')
+    a = sync.summary('sam')
+    _side(tmp_path, monkeypatch, 'b')
+    b = sync.summary('sam')
+    # both sides agree on the winner
+    a_pull, a_push = sync.plan(a, b)
+    b_pull, b_push = sync.plan(b, a)
+    assert (a_pull, a_push) == (b_push, b_pull) and len(a_pull + a_push) == 1
+
+    winner, loser = ('b', 'a') if a_pull else ('a', 'b')
+    _side(tmp_path, monkeypatch, winner)
+    exported = sync.export_payloads('sam', ['x'])
+    _side(tmp_path, monkeypatch, loser)
+    assert sync.import_payloads('sam', exported) == ['x']
+    _side(tmp_path, monkeypatch, 'a')
+    a = sync.summary('sam')
+    _side(tmp_path, monkeypatch, 'b')
+    assert sync.summary('sam')['root'] == a['root']
+
+
+
+def test_invalid_modified_is_rejected_before_anything_is_written(tmp_path, monkeypatch):
+    _side(tmp_path, monkeypatch, 'b')
+    good = {'payload': json.dumps({'password': 'YQ==', 'version': 1}), 'modified': 1000.0}
+    for bad in (float('inf'), float('nan'), -1.0, 1e12, '1000', True):
+        with pytest.raises(ValueError):
+            sync.import_payloads('sam', {'a': good, 'b': dict(good, modified=bad)})
+        assert sync.summary('sam')['apps'] == {}
+
+
+def test_sync_run_only_contacts_connected_peers(tmp_path, monkeypatch):
+    from cryptography.fernet import Fernet
+    from lib import admission, network
+    from web_server import app
+    monkeypatch.setenv('MASTER_KEY', Fernet.generate_key().decode('utf-8'))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(network, 'is_ip_in_hotspot_subnet', lambda ip: False)
+    monkeypatch.setattr(network, 'is_connected_peer', lambda ip: ip == '192.168.43.7')
+    admission.controller.reset()
+    app.config['TESTING'] = True
+    with app.test_client() as c:
+        c.post('/api/auth/register', json={'username': 'sam', 'password': 'pw'})
+        for peer in ('http://attacker.example', 'http://10.9.9.9:5001', 'file:///etc/passwd'):
+            assert c.post('/api/sync/run', json={'peer': peer}).status_code == 403
+    assert sync.is_known_peer('http://192.168.43.7:5001')
+    assert sync.is_known_peer('https://127.0.0.1:5001')
+
+def test_two_instances_converge(peers):
+    a, b = _client(peers[0]), _client(peers[1])
+    a._call('POST', '/api/secrets/store', {'app_name': 'mail', 'secret_text': 'm', 'passphrase': 'p'})
+    b._call('POST', '/api/secrets/store', {'app_name': 'bank', 'secret_text': 'b', 'passphrase': 'p'})
+
+    result = a._call('POST', '/api/sync/run', {'peer': peers[1]})
+    assert result['pulled'] == ['bank']
+    assert result['pushed'] == ['mail']
+    assert a.summary()['root'] == b.summary()['root']
+
+    # payloads moved as ciphertext and decrypt on the other side
+    r = b._call('POST', '/api/secrets/retrieve', {'app_name': 'mail', 'passphrase': 'p'})
+    assert r['secret'] == 'm'
+
+    again = a._call('POST', '/api/sync/run', {'peer': peers[1]})
+    assert again['in_sync'] is True
@@ -0,0 +1,117 @@
+import http.client
+import os
+import socket
+import ssl
+import stat
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from lib import tls
+
+
+def test_certificate_is_generated_once(tmp_path):
+    cert, key = tls.ensure_certificate(str(tmp_path))
+    with open(cert, 'rb') as f:
+        first = f.read()
+    assert stat.S_IMODE(os.stat(key).st_mode) == 0o600
+    assert tls.ensure_certificate(str(tmp_path)) == (cert, key)
+    with open(cert, 'rb') as f:
+        assert f.read() == first
+
+
+@pytest.fixture
+def https_server(tmp_path, monkeypatch):
+    from werkzeug.serving import make_server
+    from lib import audit
+    from web_server import app
+    # requests write db/, server_state/ and audit records; keep them in tmp_path
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(audit, 'log', audit.AuditLog(str(tmp_path / 'audit')))
+    cert, key = tls.ensure_certificate(str(tmp_path))
+    server = make_server('127.0.0.1', 0, app, threaded=True, ssl_context=tls.context(cert, key),
+                         request_handler=tls.KeepAliveRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = ssl.create_default_context(cafile=cert)
+    client.check_hostname = False
+    tls.reset_stats()
+    yield server.server_port, client
+    server.shutdown()
+
+
+def _get_closing(port, client, session=None):
+    with socket.create_connection(('127.0.0.1', port)) as raw:
+        with client.wrap_socket(raw, server_hostname='localhost', session=session) as s:
+            s.sendall(b'GET /api/auth/check HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n')
+            while s.recv(65536):
+                pass
+            return s.session, s.session_reused
+
+
+def test_keep_alive_and_session_resumption(https_server):
+    port, client = https_server
+    conn = http.client.HTTPSConnection('127.0.0.1', port, context=client)
+    for _ in range(3):
+        conn.request('GET', '/api/auth/check')
+        r = conn.getresponse()
+        assert r.status == 200 and b'authenticated' in r.read()
+    conn.close()
+    assert tls.stats()['handshakes'] == 1
+
+    session, reused = _get_closing(port, client)
+    assert not reused
+    _, reused = _get_closing(port, client, session)
+    assert reused
+
+    stats = tls.stats()
+    assert (stats['handshakes'], stats['resumed'], stats['enabled']) == (3, 1, True)
+    assert stats['resumption_rate'] == round(1 / 3, 3)
+
+
+def test_unread_request_body_is_drained(https_server):
+    port, client = https_server
+    conn = http.client.HTTPSConnection('127.0.0.1', port, context=client)
+    # the logout route never reads its body; the next request must still parse
+    conn.request('POST', '/api/auth/logout', body=b'x' * 5000, headers={'Content-Type': 'text/plain'})
+    r = conn.getresponse()
+    r.read()
+    assert r.getheader('Connection') != 'close'
+    conn.request('GET', '/api/auth/check')
+    r = conn.getresponse()
+    assert r.status == 200 and b'authenticated' in r.read()
+    conn.close()
+    assert tls.stats()['handshakes'] == 1
+
+
+def test_streaming_route_keeps_its_request_body(https_server, tmp_path, monkeypatch):
+    import json
+    from cryptography.fernet import Fernet
+    from lib import admission, crypto
+    monkeypatch.setenv('MASTER_KEY', Fernet.generate_key().decode('utf-8'))
+    monkeypatch.setattr(crypto, '_KDF_ITERATIONS', 1000)
+    monkeypatch.chdir(tmp_path)
+    admission.controller.reset()
+    port, client = https_server
+    conn = http.client.HTTPSConnection('127.0.0.1', port, context=client)
+    conn.request('POST', '/api/auth/register', body=json.dumps({'username': 'amy', 'password': 'pw'}),
+                 headers={'Content-Type': 'application/json'})
+    r = conn.getresponse()
+    r.read()
+    cookie = r.getheader('Set-Cookie').split(';', 1)[0]
+
+    # large enough to still be streaming when the response headers go out
+    csv = 'name,username,password\n' + ''.join(f'app{i:04d},user{i}@example.com,pw-{i}\n' for i in range(1000))
+    conn.request('POST', '/api/secrets/import', body=csv.encode('utf-8'),
+                 headers={'Cookie': cookie, 'X-Passphrase': 'pp', 'Content-Type': 'text/csv'})
+    r = conn.getresponse()
+    lines = [json.loads(line) for line in r.read().decode('utf-8').splitlines()]
+    assert lines[-1] == dict(lines[-1], done=True, imported=1000)
+    assert sum(name.startswith('app') for name in os.listdir(os.path.join('db', 'amy'))) == 1000
+
+    conn.request('GET', '/api/auth/check', headers={'Cookie': cookie})
+    r = conn.getresponse()
+    assert r.status == 200 and b'amy' in r.read()
+    conn.close()
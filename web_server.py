@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
-from flask import Flask, request, jsonify, session, send_from_directory
+from flask import Flask, Response, g, request, jsonify, session, send_from_directory, stream_with_context
+import io
 import json
 import os
-from lib import auth, storage, crypto, utils
+import time
+from lib import admission, audit, auth, storage, crypto, utils
 
 app = Flask(__name__, static_folder='static')
 app.secret_key = os.urandom(24)  # Generate random secret key for sessions
@@ -11,7 +13,8 @@ app.secret_key = os.urandom(24)  # Generate random secret key for sessions
 @app.after_request
 def after_request(response):
     response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type, X-Passphrase, If-Match, If-None-Match, Prefer')
+    response.headers.add('Access-Control-Expose-Headers', 'ETag, Location')
     response.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
     response.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
     return response
@@ -38,31 +41,95 @@ def restrict_access():
          return None # Access Granted
          
     # Check 2: (Backup) Is it in ARP table? (Legacy check)
-    allowed_peers = network.get_connected_peers()
-    if remote_ip in allowed_peers:
+    if network.is_connected_peer(remote_ip):
         return None  # Access Granted
         
     # 3. Deny Everyone Else
     print(f"SECURITY ALERT: Blocked access attempt from {remote_ip}")
+    audit.record('access.denied', ip=remote_ip, method=request.method, path=request.path)
+    g.audited = True
     return jsonify({
         'error': f'Access Denied: You must be connected to the secure hotspot. Your IP was detected as: {remote_ip}'
     }), 403
 
+# Endpoints whose outcome is written to the audit log, by event type.
+AUDIT_EVENTS = {
+    'login': 'auth.login',
+    'register': 'auth.register',
+    'logout': 'auth.logout',
+    'store_secret': 'secret.write',
+    'store_ciphertext': 'secret.write',
+    'update_secret': 'secret.update',
+    'retrieve_secret': 'secret.read',
+    'retrieve_ciphertext': 'secret.read',
+    'reencrypt_secrets': 'secret.reencrypt',
+    'import_secrets': 'secret.import',
+    'upload_blob': 'blob.write',
+    'download_blob': 'blob.read',
+    'sync_pull': 'sync.pull',
+    'sync_push': 'sync.push',
+    'sync_run': 'sync.run',
+    'cancel_job': 'job.cancel',
+    'rotate_master_key': 'maintenance.rotate_master_key',
+}
+
+@app.after_request
+def audit_request(response):
+    """Queue an audit event for security-relevant endpoints (never blocks).
+
+    Request bodies are never read here: handlers that take the user or app
+    from the body record them in g.audit_user / g.audit_app.
+    """
+    event = AUDIT_EVENTS.get(request.endpoint)
+    if event and not g.get('audited'):
+        audit.record(
+            event,
+            outcome='ok' if response.status_code < 400 else 'denied' if response.status_code in (401, 403, 429) else 'failed',
+            status=response.status_code,
+            user=g.get('audit_user') or session.get('username'),
+            ip=request.remote_addr,
+            app=(request.view_args or {}).get('app_name') or g.get('audit_app'),
+        )
+    return response
+
 @app.route('/')
 def index():
     return send_from_directory('static', 'index.html')
 
+@app.route('/sw.js')
+def service_worker():
+    # Served from the root so its scope covers the whole app; never cached by
+    # the browser's HTTP cache so shell updates are picked up promptly.
+    response = send_from_directory('static', 'sw.js', mimetype='application/javascript')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def _admission_denied(username):
+    """Reject over-limit auth attempts before any password hashing runs."""
+    retry_after = admission.controller.admit(request.remote_addr, username)
+    if not retry_after:
+        return None
+    response = jsonify({'error': 'Too many attempts; please wait and try again'})
+    response.headers['Retry-After'] = str(int(retry_after) + 1)
+    return response, 429
+
 @app.route('/api/auth/login', methods=['POST'])
 def login():
     """Authenticate user and create session"""
     data = request.json
     username = data.get('username')
+    g.audit_user = username
     password = data.get('password')
     
     if not username or not password:
         return jsonify({'error': 'Username and password required'}), 400
     
+    limited = _admission_denied(username)
+    if limited:
+        return limited
+    
     if auth.check_auth(username, password):
+        admission.controller.record_success(username)
         session['username'] = username
         # Create server-side session id and store encrypted credentials
         session_id = os.urandom(24).hex()
@@ -71,6 +138,7 @@ def login():
         session_store.save_session_credentials(session_id, username, password)
         return jsonify({'success': True, 'username': username})
     else:
+        admission.controller.record_failure(request.remote_addr, username)
         return jsonify({'error': 'Invalid credentials'}), 401
 
 @app.route('/api/auth/register', methods=['POST'])
@@ -78,11 +146,16 @@ def register():
     """Register new user"""
     data = request.json
     username = data.get('username')
+    g.audit_user = username
     password = data.get('password')
     
     if not username or not password:
         return jsonify({'error': 'Username and password required'}), 400
     
+    limited = _admission_denied(username)
+    if limited:
+        return limited
+    
     # Check if user already exists
     auth_file = os.path.join("db", username, "auth.json")
     if os.path.exists(auth_file):
@@ -149,6 +222,118 @@ def list_apps():
     
     return jsonify({'apps': apps})
 
+@app.route('/api/apps/search', methods=['GET'])
+def search_apps():
+    """Search the user's apps by name and app username (prefix and fuzzy)"""
+    if 'username' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    from lib import search
+    query = request.args.get('q', '')
+    try:
+        limit = int(request.args.get('limit', search.DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    fuzzy = request.args.get('fuzzy', '1') not in ('0', 'false', 'no')
+    return jsonify({'results': search.search(session['username'], query, limit, fuzzy)})
+
+@app.route('/api/apps/changes', methods=['GET'])
+def app_changes():
+    """Apps changed since `since` (the `now` of a previous call; 0 for everything)
+
+    Clients keep `now` for their next call and drop the apps named in
+    `removed` from their own list.
+    """
+    if 'username' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    try:
+        since = float(request.args.get('since', 0))
+    except ValueError:
+        return jsonify({'error': 'Invalid since'}), 400
+    now = time.time()
+    changes, removed, count = storage.changed_since(session['username'], since)
+    return jsonify({'changes': changes, 'removed': removed, 'count': count, 'now': now})
+
+@app.route('/api/events', methods=['GET'])
+def app_events():
+    """Server-sent events: a 'change' event for every write to the user's apps
+
+    A 'resync' event means the client fell behind and should refetch from
+    /api/apps/changes; comment lines are heartbeats.
+    """
+    if 'username' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    from lib import events
+    try:
+        subscription = events.subscribe(session['username'])
+    except events.TooManySubscribers as e:
+        return jsonify({'error': str(e)}), 503
+    response = Response(events.stream(subscription), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def _expected_version(username, app_name):
+    """Turn If-Match / If-None-Match into an expected payload version.
+
+    Returns (expected, error_response). `expected` is None for an
+    unconditional write and -1 for "must not exist yet".
+    """
+    if request.if_none_match.star_tag:
+        return -1, None
+    if request.if_match.star_tag:
+        current = storage.current_version(username, app_name)
+        if current is None:
+            return None, _version_conflict(-1)
+        return current, None
+    tags = request.if_match.as_set()
+    if not tags:
+        return None, None
+    try:
+        return int(next(iter(tags))), None
+    except ValueError:
+        return None, (jsonify({'error': 'Invalid If-Match header'}), 400)
+
+def _version_conflict(current):
+    response = jsonify({
+        'error': 'Version conflict: the secret was changed by another client',
+        'version': current
+    })
+    if current >= 0:
+        response.set_etag(str(current))
+    return response, 409
+
+def _with_etag(response, version):
+    response.set_etag(str(version))
+    return response
+
+def _wants_async():
+    """Heavy routes queue a job and answer 202 when sent `Prefer: respond-async`."""
+    return 'respond-async' in request.headers.get('Prefer', '')
+
+def _submit_job(kind, username, params, secrets, files=None):
+    from lib import jobs
+    try:
+        job = jobs.submit(kind, username, params, secrets, files)
+    except jobs.QueueFull as e:
+        for path in files or []:
+            os.remove(path)
+        return jsonify({'error': str(e)}), 503
+    return _job_accepted(job)
+
+def _job_accepted(job):
+    response = jsonify(_job_view(job))
+    response.headers['Location'] = f'/api/jobs/{job.id}'
+    return response, 202
+
+def _job_view(job):
+    view = job.to_dict()
+    for internal in ('user', 'params', 'files', 'needs_secrets'):
+        view.pop(internal)
+    return view
+
 @app.route('/api/secrets/store', methods=['POST'])
 def store_secret():
     """Store a new encrypted secret"""
@@ -157,6 +342,7 @@ def store_secret():
     
     data = request.json
     app_name = data.get('app_name')
+    g.audit_app = app_name
     app_username = data.get('app_username', '')
     secret_text = data.get('secret_text')
     passphrase = data.get('passphrase')
@@ -173,6 +359,10 @@ def store_secret():
     if not user_password:
         return jsonify({'error': 'Missing session credentials; please login again'}), 401
     
+    expected_version, error = _expected_version(username, app_name)
+    if error:
+        return error
+    
     try:
         # Encrypt the secret
         encrypted_data = crypto.encrypt_secret(secret_text, passphrase)
@@ -183,13 +373,18 @@ def store_secret():
         payload = {
             'app_username': app_username,
             'password': str(encrypted_data),
+            'method': crypto.kdf_method(),
             'timestamp': __import__('datetime').datetime.now().strftime("%Y%m%d-%H%M%S")
         }
         
         # Store it
-        filename = storage.store_payload(username, app_name, user_password, payload)
-        return jsonify({'success': True, 'filename': filename})
+        filename = storage.store_payload(username, app_name, user_password, payload,
+                                         expected_version=expected_version)
+        return _with_etag(jsonify({'success': True, 'filename': filename, 'version': payload['version']}),
+                          payload['version'])
         
+    except storage.VersionConflict as e:
+        return _version_conflict(e.current)
     except PermissionError:
         return jsonify({'error': 'Authentication failed'}), 401
     except Exception as e:
@@ -203,6 +398,7 @@ def retrieve_secret():
     
     data = request.json
     app_name = data.get('app_name')
+    g.audit_app = app_name
     passphrase = data.get('passphrase')
     
     if not all([app_name, passphrase]):
@@ -228,15 +424,18 @@ def retrieve_secret():
         app_username = payload.get('app_username', 'N/A')
         timestamp = payload.get('timestamp', 'Unknown')
         
-        # Decrypt
-        decrypted_data = crypto.decrypt_secret(encrypted_text, passphrase)
+        # Decrypt; identical concurrent requests for this version share one KDF run
+        version = storage.payload_version(payload)
+        decrypted_data = crypto.decrypt_secret_shared((username, app_name, version), encrypted_text, passphrase,
+                                                      crypto.iterations_from_method(payload.get('method')))
         if decrypted_data.ok:
-            return jsonify({
+            return _with_etag(jsonify({
                 'success': True,
                 'secret': decrypted_data.data.decode('utf-8'),
                 'app_username': app_username,
-                'timestamp': timestamp
-            })
+                'timestamp': timestamp,
+                'version': version
+            }), version)
         else:
             return jsonify({'error': f'Decryption failed: {decrypted_data.status}'}), 400
             
@@ -245,6 +444,84 @@ def retrieve_secret():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/secrets/ciphertext/store', methods=['POST'])
+def store_ciphertext():
+    """Store a secret the browser has already encrypted.
+
+    The server never sees the passphrase or plaintext and runs no KDF; the
+    ciphertext uses the same (salt || fernet token) format as `store_secret`.
+    """
+    if 'username' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    data = request.json
+    app_name = data.get('app_name')
+    g.audit_app = app_name
+    app_username = data.get('app_username', '')
+    ciphertext = data.get('ciphertext')
+    method = data.get('method')
+
+    if not all([app_name, ciphertext, method]):
+        return jsonify({'error': 'Missing required fields'}), 400
+    try:
+        crypto.iterations_from_method(method)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not crypto.is_valid_ciphertext(ciphertext):
+        return jsonify({'error': 'Invalid encrypted payload'}), 400
+
+    username = session['username']
+    expected_version, error = _expected_version(username, app_name)
+    if error:
+        return error
+
+    try:
+        payload = {
+            'app_username': app_username,
+            'password': ciphertext,
+            'method': method,
+            'timestamp': __import__('datetime').datetime.now().strftime("%Y%m%d-%H%M%S")
+        }
+        filename = storage.store_payload(username, app_name, None, payload,
+                                         expected_version=expected_version)
+        return _with_etag(jsonify({'success': True, 'filename': filename, 'version': payload['version']}),
+                          payload['version'])
+    except storage.VersionConflict as e:
+        return _version_conflict(e.current)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/secrets/ciphertext/retrieve', methods=['POST'])
+def retrieve_ciphertext():
+    """Return a stored secret as opaque ciphertext for the browser to decrypt"""
+    if 'username' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    data = request.json
+    app_name = data.get('app_name')
+    g.audit_app = app_name
+    if not app_name:
+        return jsonify({'error': 'Missing required fields'}), 400
+
+    try:
+        result = storage.retrieve_latest_payload(session['username'], app_name, None)
+        if not result:
+            return jsonify({'error': 'No secret found'}), 404
+
+        data_str, filepath = result
+        payload = json.loads(data_str)
+        version = storage.payload_version(payload)
+        return _with_etag(jsonify({
+            'success': True,
+            'ciphertext': payload['password'],
+            'method': payload.get('method') or crypto.kdf_method(),
+            'app_username': payload.get('app_username', 'N/A'),
+            'timestamp': payload.get('timestamp', 'Unknown'),
+            'version': version
+        }), version)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/secrets/update', methods=['POST'])
 def update_secret():
     """Update a secret by overwriting with a new value (or JSON object)"""
@@ -253,6 +530,7 @@ def update_secret():
     
     data = request.json
     app_name = data.get('app_name')
+    g.audit_app = app_name
     passphrase = data.get('passphrase')
     key_path = data.get('key_path')
     value = data.get('value')
@@ -280,8 +558,19 @@ def update_secret():
         encrypted_text = payload['password']
         app_username = payload.get('app_username', '')
         
+        # Optimistic concurrency: remember the version we read, check the
+        # client's precondition now, and only write if nobody else has
+        # written in the meantime. No lock is held during the KDF work.
+        base_version = storage.payload_version(payload)
+        expected_version, error = _expected_version(username, app_name)
+        if error:
+            return error
+        if expected_version is not None and expected_version != base_version:
+            return _version_conflict(base_version)
+        
         # Decrypt
-        decrypted_data = crypto.decrypt_secret(encrypted_text, passphrase)
+        decrypted_data = crypto.decrypt_secret(encrypted_text, passphrase,
+                                               crypto.iterations_from_method(payload.get('method')))
         if not decrypted_data.ok:
             return jsonify({'error': f'Decryption failed: {decrypted_data.status}'}), 400
         
@@ -316,17 +605,22 @@ def update_secret():
         new_payload = {
             'app_username': app_username,
             'password': str(encrypted_data),
+            'method': crypto.kdf_method(),
             'timestamp': __import__('datetime').datetime.now().strftime("%Y%m%d-%H%M%S")
         }
         
-        filename = storage.store_payload(username, app_name, user_password, new_payload)
+        filename = storage.store_payload(username, app_name, user_password, new_payload,
+                                         expected_version=base_version)
         
-        return jsonify({
+        return _with_etag(jsonify({
             'success': True,
             'updated_secret': secret_data,
-            'filename': filename
-        })
+            'filename': filename,
+            'version': new_payload['version']
+        }), new_payload['version'])
         
+    except storage.VersionConflict as e:
+        return _version_conflict(e.current)
     except TypeError as e:
         return jsonify({'error': f'Update failed: {str(e)}'}), 400
     except PermissionError:
@@ -351,17 +645,384 @@ def get_secret_metadata(app_name):
             payload = json.load(f)
         
         stat = os.stat(secret_file)
-        return jsonify({
+        version = storage.payload_version(payload)
+        return _with_etag(jsonify({
             'app_username': payload.get('app_username', 'N/A'),
             'timestamp': payload.get('timestamp', 'Unknown'),
             'modified': stat.st_mtime,
-            'size': stat.st_size
-        })
+            'size': stat.st_size,
+            'version': version
+        }), version)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/secrets/reencrypt', methods=['POST'])
+def reencrypt_secrets():
+    """Start a background job re-encrypting the user's secrets with current KDF parameters"""
+    if 'username' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    data = request.json
+    passphrase = data.get('passphrase')
+    if not passphrase:
+        return jsonify({'error': 'Missing required fields'}), 400
+
+    from lib import jobs, migrate
+    try:
+        rate = migrate.parse_rate(data.get('rate'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid rate'}), 400
+    try:
+        job = migrate.start_reencryption(session['username'], passphrase, rate=rate)
+    except jobs.QueueFull as e:
+        return jsonify({'error': str(e)}), 503
+    return _job_accepted(job)
+
+@app.route('/api/secrets/reencrypt', methods=['GET'])
+def reencrypt_progress():
+    """Report progress of the user's re-encryption job"""
+    if 'username' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    from lib import migrate
+    progress = migrate.progress(f"reencrypt-{session['username']}")
+    if progress is None:
+        return jsonify({'error': 'No re-encryption job found'}), 404
+    return jsonify(progress)
+
+@app.route('/api/secrets/import', methods=['POST'])
+def import_secrets():
+    """Bulk-import a CSV/JSON password-manager export streamed as the request body.
+
+    Progress is streamed back as one JSON object per line, one per batch; the
+    last line has `done` set. The passphrase travels in the X-Passphrase
+    header because the body is the raw export.
+    """
+    if 'username' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    passphrase = request.headers.get('X-Passphrase')
+    if not passphrase:
+        return jsonify({'error': 'Missing required fields'}), 400
+
+    from lib import importer, session_store
+    user_password = session_store.get_session_password(session.get('session_id')) if session.get('session_id') else None
+    if not user_password:
+        return jsonify({'error': 'Missing session credentials; please login again'}), 401
+
+    fmt = request.args.get('format') or None
+    on_conflict = request.args.get('on_conflict', 'skip')
+    if fmt not in (None, 'csv', 'json') or on_conflict not in importer.ON_CONFLICT:
+        return jsonify({'error': 'Invalid format or on_conflict'}), 400
+    try:
+        batch_size = int(request.args.get('batch_size', importer.DEFAULT_BATCH_SIZE))
+    except ValueError:
+        return jsonify({'error': 'Invalid batch_size'}), 400
+
+    username = session['username']
+    if _wants_async():
+        from lib import blobs
+        path, key = importer.spool(blobs.read_chunks(request.stream))
+        return _submit_job('import', username,
+                           {'spool_file': path, 'fmt': fmt, 'on_conflict': on_conflict, 'batch_size': batch_size},
+                           {'passphrase': passphrase, 'spool_key': key}, files=[path])
+
+    def generate():
+        stream = io.TextIOWrapper(request.stream, encoding='utf-8-sig', newline='')
+        try:
+            for progress in importer.run_import(username, importer.iter_entries(stream, fmt), passphrase,
+                                                on_conflict, batch_size):
+                yield json.dumps(progress) + '\n'
+        except importer.ImportFormatError as e:
+            yield json.dumps({'error': str(e), 'done': True}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/maintenance/rotate-master-key', methods=['POST'])
+def rotate_master_key():
+    """Rotate the session master key and re-encrypt sessions in the background (phone only)
+
+    Running it again after a 'failed' rotation retries the sessions that could
+    not be re-encrypted; `force: true` drops them so the old key is retired.
+    """
+    if request.remote_addr != '127.0.0.1':
+        return jsonify({'error': 'Maintenance is only available on the server device'}), 403
+
+    from lib import jobs, migrate
+    data = request.get_json(silent=True) or {}
+    try:
+        rate = migrate.parse_rate(data.get('rate'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid rate'}), 400
+    try:
+        job = migrate.start_rotation(rate=rate, force=data.get('force') is True)
+    except jobs.QueueFull as e:
+        return jsonify({'error': str(e)}), 503
+    return _job_accepted(job)
+
+@app.route('/api/maintenance/migrations/<name>', methods=['GET'])
+def migration_progress(name):
+    """Report progress of a maintenance migration (phone only)"""
+    if request.remote_addr != '127.0.0.1':
+        return jsonify({'error': 'Maintenance is only available on the server device'}), 403
+
+    from lib import migrate
+    progress = migrate.progress(name)
+    if progress is None:
+        return jsonify({'error': 'Migration not found'}), 404
+    return jsonify(progress)
+
+@app.route('/api/maintenance/startup', methods=['GET'])
+def startup_report():
+    """Start-up phase timings, warm-up results and current RSS (phone only)"""
+    if request.remote_addr != '127.0.0.1':
+        return jsonify({'error': 'Maintenance is only available on the server device'}), 403
+
+    from lib import startup
+    return jsonify(startup.report())
+
+@app.route('/api/maintenance/tls', methods=['GET'])
+def tls_stats():
+    """TLS handshake counts and session resumption rate (phone only)"""
+    if request.remote_addr != '127.0.0.1':
+        return jsonify({'error': 'Maintenance is only available on the server device'}), 403
+
+    from lib import tls
+    return jsonify(tls.stats())
+
+@app.route('/api/maintenance/coalescing', methods=['GET'])
+def coalescing_stats():
+    """How many secret retrievals shared another request's decryption (phone only)"""
+    if request.remote_addr != '127.0.0.1':
+        return jsonify({'error': 'Maintenance is only available on the server device'}), 403
+
+    return jsonify(crypto.coalescing_stats())
+
+@app.route('/api/sync/summary', methods=['GET'])
+def sync_summary():
+    """Hash summary of the user's encrypted payloads, for peer sync"""
+    if 'username' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    from lib import sync
+    return jsonify(sync.summary(session['username']))
+
+@app.route('/api/sync/pull', methods=['POST'])
+def sync_pull():
+    """Return stored (still encrypted) payloads for the requested apps"""
+    if 'username' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    from lib import sync
+    data = request.json
+    return jsonify({'apps': sync.export_payloads(session['username'], data.get('apps', []))})
+
+@app.route('/api/sync/push', methods=['POST'])
+def sync_push():
+    """Accept encrypted payloads from a peer, keeping whichever copy is newer"""
+    if 'username' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    from lib import sync
+    data = request.json
+    try:
+        applied = sync.import_payloads(session['username'], data.get('apps', {}))
+    except (ValueError, KeyError, TypeError) as e:
+        return jsonify({'error': f'Invalid sync payload: {e}'}), 400
+    return jsonify({'success': True, 'applied': applied})
+
+@app.route('/api/sync/run', methods=['POST'])
+def sync_run():
+    """Sync the user's apps with a peer instance using the session credentials"""
+    if 'username' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    data = request.json
+    peer = data.get('peer')
+    if not peer or not isinstance(peer, str):
+        return jsonify({'error': 'Missing required fields'}), 400
+    from lib import sync
+    if not sync.is_known_peer(peer):
+        return jsonify({'error': 'Peer must be this device or one connected to it, given by IP address'}), 403
+
+    session_id = session.get('session_id')
+    if not session_id:
+        return jsonify({'error': 'Missing session credentials; please login again'}), 401
+    from lib import session_store
+    user_password = session_store.get_session_password(session_id)
+    if not user_password:
+        return jsonify({'error': 'Missing session credentials; please login again'}), 401
+
+    if _wants_async():
+        return _submit_job('sync', session['username'], {'peer': peer}, {'password': user_password})
+    try:
+        result = sync.sync_with_peer(peer, session['username'], user_password)
+    except sync.SyncError as e:
+        return jsonify({'error': str(e)}), 502
+    return jsonify(dict(result, success=True))
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """List the user's background jobs, newest first"""
+    if 'username' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    from lib import jobs
+    return jsonify({'jobs': [_job_view(job) for job in jobs.get_queue().list(session['username'])]})
+
+def _user_job(job_id):
+    from lib import jobs
+    job = jobs.get_queue().get(job_id)
+    return job if job is not None and job.user == session['username'] else None
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """State and progress of one background job"""
+    if 'username' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    job = _user_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(_job_view(job))
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """Result of a finished job; 202 while it is still queued or running"""
+    if 'username' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    job = _user_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.state in ('queued', 'running'):
+        return jsonify(_job_view(job)), 202
+    if job.state != 'done':
+        return jsonify({'error': job.error or f'Job {job.state}', 'state': job.state}), 409
+    return jsonify({'id': job.id, 'state': job.state, 'result': job.result})
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Cancel a queued job, or ask a running one to stop at its next step"""
+    if 'username' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    if _user_job(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    from lib import jobs
+    return jsonify(_job_view(jobs.get_queue().cancel(job_id)))
+
+@app.route('/api/blobs/<app_name>', methods=['GET'])
+def list_blobs(app_name):
+    """List encrypted blobs attached to an app"""
+    if 'username' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    from lib import blobs
+    try:
+        return jsonify({'blobs': blobs.list_blobs(session['username'], app_name)})
+    except blobs.BlobError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/blobs/<app_name>/<blob_name>', methods=['POST'])
+def upload_blob(app_name, blob_name):
+    """Stream-encrypt a (possibly chunked) request body into a blob.
+
+    The passphrase travels in the X-Passphrase header because the body is the
+    raw attachment and is never buffered as a whole.
+    """
+    if 'username' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    passphrase = request.headers.get('X-Passphrase')
+    if not passphrase:
+        return jsonify({'error': 'Missing required fields'}), 400
+
+    username = session['username']
+    session_id = session.get('session_id')
+    from lib import session_store
+    if not session_id or not session_store.get_session_password(session_id):
+        return jsonify({'error': 'Missing session credentials; please login again'}), 401
+    # blobs are attachments of an existing secret in the user's own db directory
+    if storage.current_version(username, app_name) is None:
+        return jsonify({'error': 'No secret found'}), 404
+
+    from lib import blobs
+    try:
+        filename, size = blobs.store_blob(username, app_name, blob_name, passphrase,
+                                          blobs.read_chunks(request.stream))
+        return jsonify({'success': True, 'filename': filename, 'size': size})
+    except blobs.BlobError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/blobs/<app_name>/<blob_name>', methods=['GET'])
+def download_blob(app_name, blob_name):
+    """Stream a decrypted blob back to the client"""
+    if 'username' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    passphrase = request.headers.get('X-Passphrase')
+    if not passphrase:
+        return jsonify({'error': 'Missing required fields'}), 400
+
+    from lib import blobs
+    username = session['username']
+    try:
+        chunks = blobs.open_blob(username, app_name, blob_name, passphrase)
+    except blobs.BlobError as e:
+        return jsonify({'error': f'Decryption failed: {e}'}), 400
+    if chunks is None:
+        return jsonify({'error': 'Blob not found'}), 404
+
+    return Response(chunks, mimetype='application/octet-stream', headers={
+        'Content-Disposition': _attachment(blob_name)
+    })
+
+def _attachment(filename):
+    """Content-Disposition with an ASCII fallback and an RFC 5987 filename*"""
+    from urllib.parse import quote
+    fallback = ''.join(c for c in filename if 32 <= ord(c) < 127 and c not in '"\\') or 'download'
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+def resume_jobs():
+    """Requeue background jobs cut off by the last shutdown; call once at start-up."""
+    # importing these registers their job handlers
+    from lib import importer, jobs, migrate, sync
+    return jobs.start()
+
 if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Secret Server')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--debug', action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument('--warm-up', action='store_true',
+                        help='prime network, user and static caches once the port is open')
+    parser.add_argument('--startup-report', action='store_true',
+                        help='print import time and RSS of the server module, then exit')
+    parser.add_argument('--tls', action='store_true',
+                        help='serve HTTPS; a self-signed certificate is created in server_state/tls once')
+    parser.add_argument('--cert', help='certificate (PEM) to use with --tls instead of the self-signed one')
+    parser.add_argument('--key', help='private key (PEM) for --cert')
+    args = parser.parse_args()
+
+    from lib import startup
+    if args.startup_report:
+        raise SystemExit(startup.main([]))
+
     # Ensure db directory exists
     os.makedirs('db', exist_ok=True)
-    print("Starting web server on http://localhost:5001")
-    app.run(host='0.0.0.0', port=5001, debug=True)
+    audit.configure()
+    # The debug reloader runs the app in a child process; resume jobs and
+    # warm up only there.
+    if not args.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        resume_jobs()
+        if args.warm_up:
+            startup.warm_up(args.host, args.port)
+    from lib import tls
+    ssl_context = tls.context(args.cert, args.key) if args.tls else None
+    print(f"Starting web server on {'https' if ssl_context else 'http'}://localhost:{args.port}")
+    app.run(host=args.host, port=args.port, debug=args.debug, ssl_context=ssl_context,
+            request_handler=tls.request_handler(ssl_context))